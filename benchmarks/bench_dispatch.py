@@ -0,0 +1,54 @@
+"""Compare dispatch strategies against the local stub server.
+
+The stub makes the first (SDK vision) backend slow and the HTTP upload fast,
+which is the case where the old sequential chain paid for both attempts.
+
+Usage:
+    python benchmarks/bench_dispatch.py [--slow 4] [--fast 0.3] [--hedge-delay 1] [--runs 3]
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from stub_server import StubConfig, StubServer
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--slow', type=float, default=4.0, help='latency of the SDK vision backend')
+    parser.add_argument('--fast', type=float, default=0.3, help='latency of the HTTP upload backend')
+    parser.add_argument('--hedge-delay', type=float, default=1.0)
+    parser.add_argument('--runs', type=int, default=3)
+    args = parser.parse_args()
+
+    server = StubServer(StubConfig(latency={'sdk': args.slow, 'http': args.fast})).start()
+    os.environ.update(server.env())
+    # Imported after the environment points at the stub
+    from ulamlens.analysis import analyze_upload
+    from ulamlens.client import BackendClient
+    from ulamlens.dispatch import Dispatcher
+
+    payload = b'\xff\xd8stub-jpeg\xff\xd9'
+    # Shared, pooled client as in the app
+    backend = BackendClient.from_env('stub')
+    print(f"SDK backend {args.slow}s, HTTP backend {args.fast}s, {args.runs} runs each")
+    for strategy in ('sequential', 'race', 'hedge'):
+        dispatcher = Dispatcher(strategy, hedge_delay_s=args.hedge_delay, attempt_timeout_s=args.slow * 2)
+        times = []
+        for _ in range(args.runs):
+            t0 = time.perf_counter()
+            result = analyze_upload(payload, 'image/jpeg', 'stub', dispatcher=dispatcher, backend=backend)
+            times.append(time.perf_counter() - t0)
+            if 'error' in result:
+                print(f"  {strategy}: error {result['error']}")
+        print(f"{strategy:<11} median {statistics.median(times):6.2f}s  max {max(times):6.2f}s")
+    backend.close()
+    server.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,116 @@
+"""Benchmark for the history store and view at a large number of entries.
+
+Fills a temporary history with ``--entries`` synthetic analyses (one real
+thumbnail, repeated), then times the queries the history page runs and
+random jumps of the history list (scroll + repaint, offscreen).
+
+Usage:
+    python benchmarks/bench_history.py [--entries 100000] [--jumps 200]
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+
+import numpy as np
+
+from ulamlens.history import HistoryStore, encode_thumbnail
+
+DISHES = ['Chicken Adobo', 'Sinigang na Baboy', 'Kare-Kare', 'Lechon Kawali', 'Tinola', 'Pinakbet', 'Bistek Tagalog',
+          'Menudo', 'Laing', 'Dinuguan']
+
+
+def fill(store, entries, seed=7):
+    """Insert ``entries`` rows one minute apart, ending now; returns seconds taken."""
+    rng = random.Random(seed)
+    image = np.random.default_rng(seed).integers(0, 255, (480, 640, 3), dtype=np.uint8)
+    thumb = encode_thumbnail(image)
+    now = time.time()
+    t0 = time.perf_counter()
+    # Bulk insert in one transaction; store.add commits per entry, which is what the app needs
+    rows = []
+    for i in range(entries):
+        name = rng.choice(DISHES)
+        offset = store.thumbs.append(thumb)
+        result = {'ulam_name': name, 'macros': {'calories': rng.randint(150, 700)}}
+        rows.append((now - (entries - i) * 60, name, result['macros']['calories'], 20.0, 10.0, 15.0,
+                     rng.uniform(0.5, 3.0), 'camera', offset, len(thumb), json.dumps(result)))
+    store._db.executemany(
+        "INSERT INTO entries (ts, ulam_name, calories, protein_g, carbs_g, fat_g, latency_s, source, "
+        "thumb_offset, thumb_len, result) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+    store._db.commit()
+    return time.perf_counter() - t0
+
+
+def timed(fn, repeat=20):
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - t0)
+    return sorted(times)[len(times) // 2] * 1000
+
+
+def bench_view(store, jumps):
+    from PyQt5.QtWidgets import QApplication
+    from ui.history import HistoryPage
+
+    app = QApplication.instance() or QApplication([])
+    page = HistoryPage(store)
+    page.resize(800, 600)
+    t0 = time.perf_counter()
+    page.show()
+    app.processEvents()
+    opened = (time.perf_counter() - t0) * 1000
+    bar = page.view.verticalScrollBar()
+    times = []
+    for _ in range(jumps):
+        t0 = time.perf_counter()
+        bar.setValue(random.randint(0, bar.maximum()))
+        page.view.viewport().repaint()
+        times.append((time.perf_counter() - t0) * 1000)
+    times.sort()
+    page.close()
+    return opened, times[len(times) // 2], times[int(len(times) * 0.95)], times[-1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--entries', type=int, default=100_000)
+    parser.add_argument('--jumps', type=int, default=200)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as folder:
+        store = HistoryStore(folder)
+        print(f"fill {args.entries} entries: {fill(store, args.entries):.2f}s")
+        image = np.zeros((480, 640, 3), np.uint8)
+        print(f"add one (with thumbnail):   {timed(lambda: store.add({'ulam_name': 'Tinola'}, image, 1.0)):7.2f} ms")
+        print(f"ids():                      {timed(store.ids, 5):7.2f} ms")
+        ids = store.ids()
+
+        def block():
+            start = random.randrange(max(1, len(ids) - 256))
+            store.entries(ids[start:start + 256])
+        print(f"entries(256-row block):     {timed(block):7.2f} ms")
+        print(f"today's calories:           {timed(store.today_calories):7.2f} ms")
+        print(f"top dishes this week:       {timed(store.top_dishes_this_week):7.2f} ms")
+        try:
+            opened, p50, p95, worst = bench_view(store, args.jumps)
+        except ImportError:
+            print("PyQt5 not installed; skipping the view benchmark")
+        else:
+            print(f"history page open:          {opened:7.2f} ms")
+            print(f"random jump + repaint:      p50 {p50:.2f} ms  p95 {p95:.2f} ms  max {worst:.2f} ms")
+        stats = store.stats()
+        print(f"on disk: {stats['entries']} entries, thumbnails {stats['thumbs_bytes'] / 1e6:.1f} MB in one file")
+        store.close()
+
+
+if __name__ == '__main__':
+    main()
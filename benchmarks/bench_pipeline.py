@@ -0,0 +1,259 @@
+"""End-to-end analysis benchmark against the local stub server, with stored baselines.
+
+Runs the capture-free analysis path (``AnalysisEngine.analyze`` on decoded
+images: preprocessing, upload, dispatch, streaming, parsing, nutrition
+lookup) over a fixture image set, with the stub configured per scenario.
+Reports latency percentiles, throughput, error rate, per-stage timings and
+memory, and compares them with ``benchmarks/baselines/pipeline.json``.
+
+Fixtures come from ``--fixtures DIR`` or, by default, a fixed set of
+synthetic plate images generated from ``--seed``, so runs are comparable
+without any sample photos.
+
+Usage:
+    python benchmarks/bench_pipeline.py [--scenario steady|flaky|streaming|all] [--requests 40] [--concurrency 4]
+                                        [--fixtures DIR] [--save-baseline] [--tolerance 0.25] [--json] [--verbose]
+
+Exits with status 1 when a scenario regressed beyond ``--tolerance``
+against the baseline. Baselines are machine-specific: record them with
+``--save-baseline`` on the machine that runs the comparison. Peak RSS is
+that of the whole benchmark process so far.
+"""
+import argparse
+import contextlib
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import cv2
+import numpy as np
+
+from stub_server import StubConfig, StubServer
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baselines', 'pipeline.json')
+IMAGE_EXTS = ('.jpg', '.jpeg', '.png', '.bmp', '.webp')
+
+# Stub behaviour and app settings of each scenario
+SCENARIOS = {
+    'steady': {
+        'stub': dict(latency={'default': 0.3}, jitter=0.1),
+        'env': {'ULAMLENS_STREAM': '0'},
+    },
+    'flaky': {
+        'stub': dict(latency={'default': 0.3}, jitter=0.1, error_rate=0.2, malformed_rate=0.1),
+        'env': {'ULAMLENS_STREAM': '0'},
+    },
+    'streaming': {
+        'stub': dict(latency={'default': 0.3}, jitter=0.1, chunk_chars=8, chunk_delay=0.01),
+        'env': {'ULAMLENS_STREAM': '1'},
+    },
+}
+# Lower is better for these; throughput must not drop
+LATENCY_KEYS = ('p50_s', 'p95_s', 'p99_s')
+
+
+def synthetic_fixtures(count=8, seed=7, size=(1280, 720)):
+    """Plates of coloured 'food' blobs on a textured table, identical for the same seed."""
+    rng = np.random.default_rng(seed)
+    width, height = size
+    images = []
+    for i in range(count):
+        table = rng.integers(90, 160, 3)
+        img = np.empty((height, width, 3), np.uint8)
+        img[:] = table
+        img = cv2.add(img, rng.integers(0, 25, (height, width, 3), dtype=np.uint8))
+        center = (int(width * rng.uniform(0.4, 0.6)), int(height * rng.uniform(0.4, 0.6)))
+        radius = int(height * rng.uniform(0.3, 0.42))
+        cv2.circle(img, center, radius, (235, 235, 235), -1)
+        for _ in range(int(rng.integers(6, 14))):
+            offset = rng.normal(0, radius * 0.3, 2)
+            blob = (int(center[0] + offset[0]), int(center[1] + offset[1]))
+            color = tuple(int(c) for c in rng.integers(20, 200, 3))
+            axes = (int(rng.integers(15, radius // 3)), int(rng.integers(10, radius // 4)))
+            cv2.ellipse(img, blob, axes, float(rng.uniform(0, 180)), 0, 360, color, -1)
+        images.append((f"synthetic-{i}", cv2.GaussianBlur(img, (5, 5), 0)))
+    return images
+
+
+def load_fixtures(folder):
+    images = []
+    for name in sorted(os.listdir(folder)):
+        if name.lower().endswith(IMAGE_EXTS):
+            img = cv2.imread(os.path.join(folder, name))
+            if img is not None:
+                images.append((name, img))
+    return images
+
+
+def peak_rss_mib():
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    if not ordered:
+        return None
+    index = min(len(ordered) - 1, max(0, int(round(q * (len(ordered) - 1)))))
+    return ordered[index]
+
+
+def run_scenario(name, images, requests, concurrency, seed):
+    spec = SCENARIOS[name]
+    server = StubServer(StubConfig(seed=seed, **spec['stub'])).start()
+    saved = {key: os.environ.get(key) for key in list(spec['env']) + list(server.env())}
+    os.environ.update(server.env())
+    os.environ.update(spec['env'])
+    # Imported after the environment points at the stub
+    from ulamlens.client import BackendClient
+    from ulamlens.engine import AnalysisEngine
+    from ulamlens.metrics import metrics
+
+    backend = BackendClient.from_env('stub')
+    engine = AnalysisEngine.from_env('stub', client=backend)
+    engine.cache = None  # every request goes to the backend
+    metrics.enabled = True
+    metrics.reset()
+
+    def one(i):
+        _, image = images[i % len(images)]
+        t0 = time.perf_counter()
+        result = engine.analyze(image)
+        return time.perf_counter() - t0, 'error' in result
+
+    try:
+        one(0)  # warm up imports, the connection pool and the nutrition table
+        metrics.reset()
+        t0 = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            outcomes = list(pool.map(one, range(requests)))
+        wall = time.perf_counter() - t0
+    finally:
+        backend.close()
+        server.stop()
+        for key, value in saved.items():
+            if value is None:
+                os.environ.pop(key, None)
+            else:
+                os.environ[key] = value
+
+    latencies = [seconds for seconds, _ in outcomes]
+    stages = {}
+    for histogram in metrics.snapshot()['histograms']:
+        if histogram['name'] in ('preprocess_seconds', 'encode_seconds', 'parse_seconds', 'backend_request_seconds'):
+            labels = histogram['labels']
+            label = f"{histogram['name']}[{labels['backend']}, {labels['status']}]" if labels else histogram['name']
+            stages[label] = {'count': histogram['count'], 'p50_s': histogram['p50']}
+    metrics.enabled = False
+    return {
+        'requests': requests,
+        'concurrency': concurrency,
+        'errors': sum(1 for _, failed in outcomes if failed),
+        'p50_s': round(percentile(latencies, 0.50), 4),
+        'p95_s': round(percentile(latencies, 0.95), 4),
+        'p99_s': round(percentile(latencies, 0.99), 4),
+        'mean_s': round(statistics.mean(latencies), 4),
+        'throughput_rps': round(requests / wall, 3),
+        'stub_requests': len(server.requests),
+        'peak_rss_mib': peak_rss_mib(),
+        'stages': stages,
+    }
+
+
+def compare(name, current, baseline, tolerance):
+    """Regression messages of ``current`` against ``baseline`` (empty if none)."""
+    problems = []
+    for key in LATENCY_KEYS:
+        if baseline.get(key) and current[key] > baseline[key] * (1 + tolerance):
+            problems.append(f"{name}: {key} {current[key]:.3f}s vs baseline {baseline[key]:.3f}s")
+    if baseline.get('throughput_rps') and current['throughput_rps'] < baseline['throughput_rps'] * (1 - tolerance):
+        problems.append(f"{name}: throughput {current['throughput_rps']:.2f}/s vs baseline {baseline['throughput_rps']:.2f}/s")
+    if current['errors'] > baseline.get('errors', 0) * (1 + tolerance) + 1:
+        problems.append(f"{name}: {current['errors']} errors vs baseline {baseline.get('errors', 0)}")
+    return problems
+
+
+def load_baselines(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scenario', default='all', choices=sorted(SCENARIOS) + ['all'])
+    parser.add_argument('--requests', type=int, default=40)
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--fixtures', help='folder of sample photos (default: synthetic images)')
+    parser.add_argument('--seed', type=int, default=7)
+    parser.add_argument('--baseline', default=BASELINE_PATH)
+    parser.add_argument('--save-baseline', action='store_true', help='store these results as the new baseline')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='allowed relative slowdown before failing')
+    parser.add_argument('--json', action='store_true', help='print the results as JSON')
+    parser.add_argument('--verbose', action='store_true', help="show the app's own log lines")
+    args = parser.parse_args()
+
+    # The benchmark measures the remote path: no local model, no result cache, no debug copies
+    for key in ('ULAMLENS_LOCAL_MODEL', 'ULAMLENS_DEBUG_SAVE_DIR', 'ULAMLENS_ASYNC'):
+        os.environ.pop(key, None)
+    os.environ['ULAMLENS_CACHE'] = '0'
+
+    if args.fixtures:
+        images = load_fixtures(args.fixtures)
+        if not images:
+            sys.exit(f"No images found in {args.fixtures}")
+    else:
+        images = synthetic_fixtures(seed=args.seed)
+    names = sorted(SCENARIOS) if args.scenario == 'all' else [args.scenario]
+
+    results = {}
+    for name in names:
+        # The app logs every request; keep the report readable
+        quiet = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(open(os.devnull, 'w'))
+        with quiet:
+            results[name] = run_scenario(name, images, args.requests, args.concurrency, args.seed)
+        if not args.json:
+            r = results[name]
+            print(f"{name:<10} p50 {r['p50_s']:6.3f}s  p95 {r['p95_s']:6.3f}s  p99 {r['p99_s']:6.3f}s  "
+                  f"{r['throughput_rps']:6.2f} req/s  {r['errors']:3d} errors  "
+                  f"{r['stub_requests']:4d} backend calls  peak RSS {r['peak_rss_mib']} MiB")
+    if args.json:
+        print(json.dumps(results, indent=2))
+
+    baselines = load_baselines(args.baseline)
+    if args.save_baseline:
+        for name, result in results.items():
+            baselines[name] = dict(result, recorded_at=time.strftime('%Y-%m-%d'), machine=platform.machine(),
+                                   python=platform.python_version(), fixtures=len(images))
+        os.makedirs(os.path.dirname(args.baseline), exist_ok=True)
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(baselines, f, indent=2, sort_keys=True)
+            f.write('\n')
+        print(f"Baseline saved to {args.baseline}")
+        return 0
+
+    problems = []
+    for name, result in results.items():
+        if name in baselines:
+            problems += compare(name, result, baselines[name], args.tolerance)
+        else:
+            print(f"{name}: no baseline yet (run with --save-baseline)")
+    for problem in problems:
+        print(f"REGRESSION {problem}")
+    return 1 if problems else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,110 @@
+"""Offline benchmark for the upload preprocessing stage.
+
+For every image in a folder, compares the original upload (full frame,
+default-quality JPEG) with one or more preprocessing settings and reports the
+encoded size, the time to preprocess and encode, and the dHash distance to the
+uncompressed crop as a cheap check that encoding did not smear the dish.
+Recognition accuracy itself still needs a run against the real model. It
+also times the old temp-file write/read round trip against in-memory
+encoding.
+
+Usage:
+    python benchmarks/bench_preprocess.py SAMPLES_DIR [--max-edge 512,768,1024] [--quality 70,80] [--format jpeg,webp] [--crop auto]
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import cv2
+import numpy as np
+
+from ulamlens.cache import dhash, hamming
+from ulamlens.preprocess import PreprocessConfig, crop, downscale, prepare_upload
+
+IMAGE_EXTS = ('.jpg', '.jpeg', '.png', '.bmp', '.webp')
+
+
+def load_images(folder):
+    images = []
+    for name in sorted(os.listdir(folder)):
+        if name.lower().endswith(IMAGE_EXTS):
+            img = cv2.imread(os.path.join(folder, name))
+            if img is not None:
+                images.append((name, img))
+    return images
+
+
+def baseline(image):
+    t0 = time.perf_counter()
+    ok, buf = cv2.imencode('.jpg', image)
+    return len(buf), (time.perf_counter() - t0) * 1000
+
+
+def temp_file_round_trip(image):
+    """The pre-in-memory analysis path: imwrite to a temp file, then read it back."""
+    t0 = time.perf_counter()
+    with tempfile.NamedTemporaryFile(suffix='.jpg', delete=False) as tmp:
+        path = tmp.name
+    cv2.imwrite(path, image)
+    with open(path, 'rb') as f:
+        data = f.read()
+    elapsed = (time.perf_counter() - t0) * 1000
+    os.remove(path)
+    return len(data), elapsed
+
+
+def csv_list(text, cast=str):
+    return [cast(v) for v in text.split(',') if v]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('folder')
+    parser.add_argument('--max-edge', default='512,768,1024')
+    parser.add_argument('--quality', default='70,80,90')
+    parser.add_argument('--format', default='jpeg,webp')
+    parser.add_argument('--crop', default='auto')
+    args = parser.parse_args()
+
+    images = load_images(args.folder)
+    if not images:
+        sys.exit(f"No images found in {args.folder}")
+
+    base = [baseline(img) for _, img in images]
+    base_kib = statistics.mean(b for b, _ in base) / 1024
+    print(f"{len(images)} images from {args.folder}")
+    disk = [temp_file_round_trip(img) for _, img in images]
+    disk_ms = statistics.mean(t for _, t in disk)
+    mem_ms = statistics.mean(t for _, t in base)
+    print(f"temp-file round trip: {disk_ms:.2f} ms and {statistics.mean(b for b, _ in disk) * 2 / 1024:.1f} KiB "
+          f"of disk I/O per analysis; in-memory imencode: {mem_ms:.2f} ms, no disk I/O "
+          f"({disk_ms - mem_ms:.2f} ms saved)")
+
+    print(f"{'setting':<28} {'avg KiB':>9} {'vs orig':>8} {'avg ms':>8} {'max dHash':>10}")
+    print(f"{'original (default JPEG)':<28} {base_kib:9.1f} {'1.00':>8} {statistics.mean(t for _, t in base):8.2f} {'0':>10}")
+
+    for fmt in csv_list(args.format):
+        for edge in csv_list(args.max_edge, int):
+            for quality in csv_list(args.quality, int):
+                config = PreprocessConfig(crop=args.crop, max_edge=edge, fmt=fmt, quality=quality)
+                sizes, times, dists = [], [], []
+                for _, img in images:
+                    data, info = prepare_upload(img, config)
+                    sizes.append(info["bytes"])
+                    times.append(info["preprocess_ms"] + info["encode_ms"])
+                    # Compare with the uncompressed crop so only encoding loss is measured
+                    decoded = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+                    reference = downscale(crop(img, config), edge)
+                    dists.append(hamming(dhash(decoded), dhash(reference)))
+                kib = statistics.mean(sizes) / 1024
+                label = f"{fmt} edge={edge} q={quality}"
+                print(f"{label:<28} {kib:9.1f} {kib / base_kib:8.2f} {statistics.mean(times):8.2f} {max(dists):>10}")
+
+
+if __name__ == '__main__':
+    main()
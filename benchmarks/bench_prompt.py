@@ -0,0 +1,88 @@
+"""Compare the full and the compact prompt against the local stub server.
+
+Runs ``--runs`` streamed analyses per prompt style, with and without the
+nutrition table, and reports latency percentiles plus the input and output
+tokens per call as recorded by the token budget meter. The stub answers in
+the schema the prompt asks for and streams it ``--chunk-chars`` characters
+every ``--chunk-delay`` seconds, so a shorter answer finishes sooner, as
+it does with a real model.
+
+Usage:
+    python benchmarks/bench_prompt.py [--runs 20] [--latency 0.3] [--chunk-chars 4] [--chunk-delay 0.02]
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from stub_server import StubConfig, StubServer
+
+
+def totals(budget):
+    calls = tokens_in = tokens_out = 0
+    for stats in budget.stats()['models'].values():
+        calls += stats['calls']
+        tokens_in += stats['input_tokens']
+        tokens_out += stats['output_tokens']
+    return calls, tokens_in, tokens_out
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=20)
+    parser.add_argument('--latency', type=float, default=0.3, help='seconds to the first token')
+    parser.add_argument('--chunk-chars', type=int, default=4, help='characters per streamed delta (about a token)')
+    parser.add_argument('--chunk-delay', type=float, default=0.02, help='seconds between streamed deltas')
+    args = parser.parse_args()
+
+    server = StubServer(StubConfig(latency={'default': args.latency}, chunk_chars=args.chunk_chars,
+                                   chunk_delay=args.chunk_delay)).start()
+    folder = tempfile.mkdtemp(prefix='ulamlens-bench-')
+    os.environ.update(server.env())
+    os.environ.update({'ULAMLENS_STREAM': '1', 'ULAMLENS_CACHE': '0',
+                       'ULAMLENS_BUDGET_PATH': os.path.join(folder, 'budget.json')})
+    # Imported after the environment points at the stub
+    from ulamlens.analysis import analyze_upload, max_output_tokens, prompt_for
+    from ulamlens.budget import default_budget, estimate_tokens
+    from ulamlens.client import BackendClient
+    from ulamlens.dispatch import Dispatcher
+    from ulamlens.nutrition import default_table
+
+    payload = b'\xff\xd8stub-jpeg\xff\xd9'
+    backend = BackendClient.from_env('stub')
+    dispatcher = Dispatcher('sequential', attempt_timeout_s=30)
+    budget = default_budget()
+    analyze_upload(payload, 'image/jpeg', 'stub', dispatcher=dispatcher, backend=backend)  # warm up the connection
+    print(f"stub: {args.latency}s to first token, {args.chunk_chars} chars every {args.chunk_delay}s; "
+          f"{args.runs} runs each")
+    print(f"{'prompt':<8} {'table':<6} {'prompt tok':>10} {'p50 s':>7} {'p95 s':>7} {'in tok':>7} {'out tok':>8}")
+    for table_on in (False, True):
+        os.environ['ULAMLENS_NUTRITION'] = '1' if table_on else '0'
+        for style in ('full', 'compact'):
+            os.environ['ULAMLENS_PROMPT'] = style
+            os.environ.pop('ULAMLENS_MAX_OUTPUT_TOKENS', None)
+            prompt = prompt_for(default_table(), style)
+            before = totals(budget)
+            times, errors = [], 0
+            for _ in range(args.runs):
+                t0 = time.perf_counter()
+                result = analyze_upload(payload, 'image/jpeg', 'stub', dispatcher=dispatcher, backend=backend)
+                times.append(time.perf_counter() - t0)
+                errors += 'error' in result
+            after = totals(budget)
+            calls = max(1, after[0] - before[0])
+            times.sort()
+            print(f"{style:<8} {'on' if table_on else 'off':<6} {estimate_tokens(prompt):>10} "
+                  f"{statistics.median(times):7.3f} {times[int(len(times) * 0.95)]:7.3f} "
+                  f"{(after[1] - before[1]) / calls:7.0f} {(after[2] - before[2]) / calls:8.0f}"
+                  f"{f'  ({errors} errors)' if errors else ''}  max_output_tokens={max_output_tokens(style)}")
+    backend.close()
+    server.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,323 @@
+"""Local stand-in for the OpenAI responses API.
+
+Answers both the SDK's JSON requests and the multipart HTTP fallback with a
+canned ulam result, after a configurable delay, so the analysis path can be
+exercised without network access or an API key. Requests that ask for
+``stream`` get the text as server-sent ``response.output_text.delta`` events,
+``--chunk-chars`` at a time with ``--chunk-delay`` seconds between them.
+``--error-rate`` and ``--malformed-rate`` make that fraction of requests
+fail with a 500 or answer with a truncated, unparseable result, and
+``--jitter`` adds up to that many seconds of random extra latency.
+
+Unless ``--text`` fixes the answer, it follows the prompt: only the dish
+name for the identification prompt of the nutrition table, and the
+one-letter schema for ``ULAMLENS_PROMPT=compact``. Every answer reports
+``usage`` tokens estimated like the app does (four characters per token,
+765 per image), so token accounting can be checked too.
+
+Point the app at it with:
+    OPENAI_BASE_URL=http://127.0.0.1:8765/v1
+    OPENAI_IMAGE_ENDPOINT=http://127.0.0.1:8765/v1/responses
+    OPENAI_API_KEY=stub
+
+Usage:
+    python benchmarks/stub_server.py [--port 8765] [--latency sdk=8] [--latency http=0.3] [--status 500]
+                                     [--chunk-chars 8] [--chunk-delay 0.05]
+                                     [--error-rate 0.1] [--malformed-rate 0.1] [--jitter 0.2] [--seed 1]
+                                     [--text JSON]
+"""
+import argparse
+import json
+import random
+import re
+import select
+import socket
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+RESULT = {
+    "ulam_name": "Chicken Adobo",
+    "macros": {"calories": 420, "protein_g": 32.0, "carbs_g": 6.0, "fat_g": 28.0},
+    "health_facts": "Good source of protein; soy sauce and vinegar braise.",
+    "warnings": "High in sodium.",
+}
+COMPACT_RESULT = {"n": "Chicken Adobo", "m": [420, 32, 6, 28], "h": "Good protein; soy and vinegar braise.",
+                  "w": "High sodium."}
+IMAGE_TOKENS = 765
+
+
+def answer_for(prompt):
+    """Canned answer text matching what ``prompt`` asks for."""
+    compact = '{"n":' in prompt
+    if 'not a common' in prompt:  # identification prompt; the dish is in the nutrition table
+        return json.dumps({"n": RESULT['ulam_name']} if compact else {"ulam_name": RESULT['ulam_name']},
+                          separators=(',', ':') if compact else None)
+    if compact:
+        return json.dumps(COMPACT_RESULT, separators=(',', ':'))
+    return json.dumps(RESULT)
+
+
+def usage_for(prompt, image, text):
+    input_tokens = max(1, len(prompt) // 4) + (IMAGE_TOKENS if image else 0)
+    output_tokens = max(1, len(text) // 4)
+    return {"input_tokens": input_tokens, "output_tokens": output_tokens,
+            "total_tokens": input_tokens + output_tokens}
+
+
+class StubConfig:
+    """Per-request behaviour. ``latency`` maps a model name, ``'sdk'``, ``'http'`` or ``'default'`` to seconds.
+
+    ``latency`` is the time to the first byte; streamed answers then take
+    ``chunk_delay`` per ``chunk_chars`` characters. ``error_rate`` and
+    ``malformed_rate`` are the fractions of requests answered with a 500 or
+    with truncated JSON, and ``jitter`` is the most random extra latency
+    per request; ``seed`` makes that randomness repeatable.
+    """
+
+    def __init__(self, latency=None, status=200, text=None, chunk_chars=8, chunk_delay=0.0,
+                 error_rate=0.0, malformed_rate=0.0, jitter=0.0, seed=None):
+        self.latency = dict(latency or {})
+        self.status = status
+        self.text = text
+        self.chunk_chars = max(1, chunk_chars)
+        self.chunk_delay = chunk_delay
+        self.error_rate = error_rate
+        self.malformed_rate = malformed_rate
+        self.jitter = jitter
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def delay_for(self, model, kind):
+        for key in (model, kind, 'default'):
+            if key in self.latency:
+                return self.latency[key]
+        return 0.0
+
+    def plan(self, model, kind, prompt=''):
+        """``(status, text, delay)`` for one request."""
+        with self._lock:
+            error, malformed, extra = self._random.random(), self._random.random(), self._random.random()
+        status = self.status
+        if status == 200 and error < self.error_rate:
+            status = 500
+        text = self.text if self.text is not None else answer_for(prompt)
+        if malformed < self.malformed_rate:
+            text = text[:len(text) // 2]
+        return status, text, self.delay_for(model, kind) + extra * self.jitter
+
+
+def response_body(model, text, usage=None):
+    return {
+        "id": "resp_stub",
+        "object": "response",
+        "created_at": int(time.time()),
+        "status": "completed",
+        "model": model,
+        "output": [{
+            "type": "message",
+            "id": "msg_stub",
+            "status": "completed",
+            "role": "assistant",
+            "content": [{"type": "output_text", "text": text, "annotations": []}],
+        }],
+        "parallel_tool_calls": False,
+        "tool_choice": "auto",
+        "tools": [],
+        "usage": usage,
+    }
+
+
+def _prompt_of(request_input):
+    """``(prompt text, has image)`` of a responses API ``input`` (a string or messages)."""
+    if isinstance(request_input, str):
+        return request_input, False
+    parts = []
+    for message in request_input or []:
+        content = message.get('content') if isinstance(message, dict) else None
+        parts.extend(content if isinstance(content, list) else [{"type": "input_text", "text": content or ''}])
+    text = "".join(p.get('text', '') for p in parts if p.get('type') == 'input_text')
+    return text, any(p.get('type') == 'input_image' for p in parts)
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, fmt, *args):
+        pass
+
+    def handle(self):
+        try:
+            super().handle()
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # client dropped a kept-alive connection
+
+    def _read_request(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else b''
+        ctype = self.headers.get('Content-Type', '')
+        if ctype.startswith('multipart/'):
+            match = re.search(rb'name="model"\r\n\r\n(.*?)\r\n', body)
+            stream = re.search(rb'name="stream"\r\n\r\ntrue\r\n', body) is not None
+            prompt = re.search(rb'name="input"\r\n\r\n(.*?)\r\n--', body, re.S)
+            image = re.search(rb'name="image"', body) is not None
+            return 'http', match.group(1).decode() if match else '', stream, \
+                prompt.group(1).decode(errors='replace') if prompt else '', image
+        try:
+            payload = json.loads(body or b'{}')
+        except ValueError:
+            return 'sdk', '', False, '', False
+        prompt, image = _prompt_of(payload.get('input'))
+        return 'sdk', payload.get('model', ''), bool(payload.get('stream')), prompt, image
+
+    def _send_json(self, status, payload):
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_event(self, event):
+        data = f"event: {event['type']}\ndata: {json.dumps(event)}\n\n".encode()
+        self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+        self.wfile.flush()
+
+    def _send_stream(self, model, config, text, delay, usage):
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        body = response_body(model, text, usage)
+        seq = 0
+        self._send_event({"type": "response.created", "sequence_number": seq,
+                          "response": dict(body, status="in_progress", output=[], usage=None)})
+        # Like the real API, headers arrive at once and the latency is spent before the first token
+        self._wait(delay)
+        for start in range(0, len(text), config.chunk_chars):
+            if start and config.chunk_delay:
+                self._wait(config.chunk_delay)
+            seq += 1
+            self._send_event({"type": "response.output_text.delta", "sequence_number": seq,
+                              "item_id": "msg_stub", "output_index": 0, "content_index": 0,
+                              "delta": text[start:start + config.chunk_chars], "logprobs": []})
+        self._send_event({"type": "response.output_text.done", "sequence_number": seq + 1,
+                          "item_id": "msg_stub", "output_index": 0, "content_index": 0,
+                          "text": text, "logprobs": []})
+        self._send_event({"type": "response.completed", "sequence_number": seq + 2, "response": body})
+        self.wfile.write(b"0\r\n\r\n")
+
+    def _wait(self, seconds):
+        """Sleep, but notice a client that hangs up meanwhile (it closed the connection)."""
+        deadline = time.monotonic() + seconds
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            readable, _, _ = select.select([self.connection], [], [], remaining)
+            if readable and not self.connection.recv(1, socket.MSG_PEEK):
+                raise ConnectionResetError("client closed the connection")
+
+    def do_POST(self):
+        config = self.server.config
+        kind, model, stream, prompt, image = self._read_request()
+        self.server.requests.append((kind, model))
+        status, text, delay = config.plan(model, kind, prompt)
+        usage = usage_for(prompt, image, text)
+        try:
+            if not (stream and status == 200):
+                self._wait(delay)
+            if status != 200:
+                self._send_json(status, {"error": {"message": "stub error", "type": "server_error"}})
+            elif stream:
+                self._send_stream(model, config, text, delay, usage)
+            else:
+                self._send_json(200, response_body(model, text, usage))
+        except (BrokenPipeError, ConnectionResetError):
+            # Client gave up (timeout or cancellation)
+            self.server.aborted.append((kind, model))
+            self.close_connection = True
+
+
+class StubServer:
+    """Threaded stub server; use ``port=0`` to pick a free port."""
+
+    def __init__(self, config=None, host='127.0.0.1', port=0):
+        self.httpd = ThreadingHTTPServer((host, port), StubHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.config = config or StubConfig()
+        self.httpd.requests = []
+        self.httpd.aborted = []  # requests whose client hung up before the answer was complete
+        self._thread = None
+
+    @property
+    def config(self):
+        return self.httpd.config
+
+    @property
+    def requests(self):
+        return self.httpd.requests
+
+    @property
+    def aborted(self):
+        return self.httpd.aborted
+
+    @property
+    def base_url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def env(self):
+        """Environment variables that point the app at this server."""
+        return {
+            'OPENAI_BASE_URL': self.base_url,
+            'OPENAI_IMAGE_ENDPOINT': self.base_url + '/responses',
+            'OPENAI_API_KEY': 'stub',
+        }
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def parse_latency(items):
+    latency = {}
+    for item in items or []:
+        key, _, value = item.rpartition('=')
+        latency[key or 'default'] = float(value)
+    return latency
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency', action='append', help='[model|sdk|http=]seconds; repeatable')
+    parser.add_argument('--status', type=int, default=200)
+    parser.add_argument('--chunk-chars', type=int, default=8, help='characters per streamed delta')
+    parser.add_argument('--chunk-delay', type=float, default=0.0, help='seconds between streamed deltas')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='fraction of requests answered with a 500')
+    parser.add_argument('--malformed-rate', type=float, default=0.0, help='fraction of answers with truncated JSON')
+    parser.add_argument('--jitter', type=float, default=0.0, help='up to this many seconds of extra latency')
+    parser.add_argument('--seed', type=int, default=None, help='seed for the random errors and jitter')
+    parser.add_argument('--text', default=None, help='fixed answer text instead of one matching the prompt')
+    args = parser.parse_args()
+    config = StubConfig(parse_latency(args.latency), args.status, text=args.text,
+                        chunk_chars=args.chunk_chars, chunk_delay=args.chunk_delay,
+                        error_rate=args.error_rate, malformed_rate=args.malformed_rate, jitter=args.jitter, seed=args.seed)
+    server = StubServer(config, args.host, args.port)
+    for key, value in server.env().items():
+        print(f"{key}={value}")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -1,10 +1,23 @@
+import time
+_START = time.perf_counter()
 import sys
 from PyQt5.QtWidgets import QApplication
 from ui.main_window import MainWindow
+from ui.startup import StartupTimer, warm_heavy_imports
+from ulamlens.metrics import start_exporters
 
 def main():
+    # Set ULAMLENS_STARTUP_TIMING=1 to print the cold-start phases
+    startup = StartupTimer(_START)
+    startup.mark('imports')
+    # No-op unless ULAMLENS_METRICS is set
+    start_exporters()
     app = QApplication(sys.argv)
+    startup.mark('QApplication')
     window = MainWindow()
+    startup.mark('window construction')
+    # Camera/analysis modules load in the background once the menu is on screen
+    startup.watch_first_paint(window, on_first_paint=lambda: warm_heavy_imports(startup))
     window.show()
     sys.exit(app.exec_())
 
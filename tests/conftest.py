@@ -0,0 +1,63 @@
+"""Shared fixtures: the repo and ``benchmarks/`` on the path, and an isolated environment.
+
+Every test runs with the analysis cache off, no HTTP retries and the data
+folder, token budget and offline queue in temporary folders, so nothing touches
+``~/.ulamlens`` or the network. ``stub`` starts ``benchmarks/stub_server.py``
+and points the OpenAI settings at it; ``down_port`` points them at a closed port.
+"""
+import os
+import socket
+import sys
+import tempfile
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+
+# Set before anything creates the process-wide budget singleton
+os.environ['ULAMLENS_BUDGET_PATH'] = os.path.join(tempfile.mkdtemp(prefix='ulamlens-test-'), 'budget.json')
+
+from stub_server import StubConfig, StubServer  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def isolated_env(tmp_path, monkeypatch):
+    monkeypatch.setenv('ULAMLENS_DATA_DIR', str(tmp_path))
+    monkeypatch.setenv('ULAMLENS_CACHE', '0')
+    monkeypatch.setenv('ULAMLENS_HTTP_RETRIES', '0')
+    monkeypatch.setenv('ULAMLENS_OFFLINE_PATH', str(tmp_path / 'offline.sqlite'))
+    for name in ('ULAMLENS_ASYNC', 'ULAMLENS_DISPATCH', 'ULAMLENS_STREAM', 'ULAMLENS_PROMPT',
+                 'ULAMLENS_NUTRITION', 'ULAMLENS_LOCAL_MODEL'):
+        monkeypatch.delenv(name, raising=False)
+    return tmp_path
+
+
+@pytest.fixture
+def down_port(monkeypatch):
+    """Port nothing listens on; the OpenAI settings point at it (until ``stub`` starts a server)."""
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        port = s.getsockname()[1]
+    monkeypatch.setenv('OPENAI_BASE_URL', f'http://127.0.0.1:{port}/v1')
+    monkeypatch.setenv('OPENAI_IMAGE_ENDPOINT', f'http://127.0.0.1:{port}/v1/responses')
+    monkeypatch.setenv('OPENAI_API_KEY', 'stub')
+    return port
+
+
+@pytest.fixture
+def stub(monkeypatch):
+    """``start(**config)`` runs a stub server and returns it; all are stopped after the test."""
+    servers = []
+
+    def start(port=0, **config):
+        server = StubServer(StubConfig(**config), port=port).start()
+        servers.append(server)
+        for name, value in server.env().items():
+            monkeypatch.setenv(name, value)
+        return server
+
+    yield start
+    for server in servers:
+        server.stop()
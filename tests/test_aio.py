@@ -0,0 +1,81 @@
+import asyncio
+import time
+
+import pytest
+
+from ulamlens.aio import dispatch
+from ulamlens.dispatch import Attempt, Dispatcher, Schedule
+
+
+def accept(raw_text):
+    return {'text': raw_text} if raw_text == 'ok' else None
+
+
+def coroutine_attempt(name, delay, started, error=None):
+    async def call():
+        started[name] = time.monotonic()
+        await asyncio.sleep(delay)
+        if error is not None:
+            raise error
+        return 'ok'
+    return Attempt(name, call)
+
+
+def thread_attempt(name, delay, started, error=None):
+    def call(cancel, timeout_s):
+        started[name] = time.monotonic()
+        if cancel.wait(delay):
+            raise RuntimeError('cancelled')
+        if error is not None:
+            raise error
+        return 'ok'
+    return Attempt(name, call)
+
+
+def run_threaded(attempts, dispatcher):
+    return dispatcher.run(attempts, accept)
+
+
+def run_async(attempts, dispatcher):
+    return asyncio.run(dispatch(attempts, accept, dispatcher))
+
+
+@pytest.mark.parametrize('make, run', [(thread_attempt, run_threaded), (coroutine_attempt, run_async)],
+                         ids=['threaded', 'async'])
+def test_hedge_replaces_a_failure_while_another_attempt_runs(make, run):
+    started = {}
+    t0 = time.monotonic()
+    attempts = [make('slow', 1.5, started), make('hedge', 0.05, started, error=ValueError('500')),
+                make('third', 0.05, started)]
+    dispatcher = Dispatcher('hedge', hedge_delay_s=0.2, max_parallel=2)
+    outcome = run(attempts, dispatcher)
+    assert outcome.name == 'third'
+    # 'hedge' starts after the delay and fails; 'third' takes its slot at once, not a delay later
+    assert started['third'] - started['hedge'] < 0.2
+    assert time.monotonic() - t0 < 1.0
+    assert {name: status for name, _, status in outcome.attempts} == {
+        'hedge': 'error', 'third': 'ok', 'slow': 'lost'}
+
+
+@pytest.mark.parametrize('make, run', [(thread_attempt, run_threaded), (coroutine_attempt, run_async)],
+                         ids=['threaded', 'async'])
+def test_race_starts_every_slot(make, run):
+    started = {}
+    attempts = [make(name, 0.1 if name == 'b' else 1.0, started) for name in 'abc']
+    outcome = run(attempts, Dispatcher('race', max_parallel=3))
+    assert outcome.name == 'b'
+    assert max(started.values()) - min(started.values()) < 0.1
+
+
+def test_schedule():
+    schedule = Schedule('hedge', 3, max_parallel=2, hedge_delay_s=1.0)
+    assert schedule.due(0, now=0.0) == 1 and schedule.started(0.0) == 0
+    assert schedule.hedge_at(1) == 1.0
+    assert schedule.due(1, now=0.5) == 0
+    assert schedule.due(1, now=1.0) == 1 and schedule.started(1.0) == 1
+    assert schedule.hedge_at(2) is None
+    # One of the two failed: its replacement is due at once
+    assert schedule.due(1, now=1.1, ended=1) == 1 and schedule.started(1.1) == 2
+    assert schedule.due(0, now=5.0, ended=2) == 0
+    assert Schedule('race', 3, max_parallel=2).due(0, now=0.0) == 2
+    assert Schedule('sequential', 3, max_parallel=2).due(0, now=0.0) == 1
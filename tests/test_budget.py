@@ -0,0 +1,126 @@
+import asyncio
+import json
+import threading
+import time
+
+import pytest
+
+from ulamlens.analysis import analyze_upload
+from ulamlens.budget import BudgetDeferred, TokenBudget, default_budget, usage_tokens
+from ulamlens.cancel import CancelToken
+from ulamlens.client import BackendClient
+from ulamlens.dispatch import Dispatcher
+
+
+def age_minute_window(budget, seconds_left):
+    """Pretend the calls recorded so far leave the per-minute window in ``seconds_left`` seconds."""
+    at = time.time() - 60 + seconds_left
+    budget._minute = type(budget._minute)((at, used) for _, used in budget._minute)
+
+
+def test_unlimited_budget_never_waits():
+    budget = TokenBudget()
+    budget.record('m', 10_000, 10_000)
+    assert budget.acquire(5000) == 0
+    budget.release(0)
+
+
+def test_per_minute_limit_waits_for_the_window():
+    budget = TokenBudget(per_minute=1000, max_wait_s=5)
+    budget.record('m', 800, 100)
+    age_minute_window(budget, 0.3)
+    t0 = time.monotonic()
+    assert budget.acquire(200) == 200
+    assert 0.25 <= time.monotonic() - t0 < 2.0
+    assert budget.stats()['reserved'] == 200 and budget.stats()['minute_tokens'] == 0
+
+
+def test_per_minute_limit_defers_a_long_wait():
+    budget = TokenBudget(per_minute=1000, max_wait_s=5)
+    budget.record('m', 800, 100)
+    with pytest.raises(BudgetDeferred) as info:
+        budget.acquire(200)
+    assert 55 < info.value.retry_after <= 60
+    assert 'per-minute' in info.value.reason
+
+
+def test_reservations_in_flight_count_until_released():
+    budget = TokenBudget(per_minute=1000, max_wait_s=5)
+    first = budget.acquire(600)
+    threading.Timer(0.3, budget.release, args=(first,)).start()
+    t0 = time.monotonic()
+    assert budget.acquire(600) == 600
+    assert time.monotonic() - t0 >= 0.25
+
+
+def test_a_single_call_larger_than_the_limit_still_runs():
+    budget = TokenBudget(per_minute=100)
+    assert budget.acquire(500) == 500
+
+
+def test_cancel_while_waiting():
+    budget = TokenBudget(per_minute=1000, max_wait_s=30)
+    budget.record('m', 900, 100)
+    age_minute_window(budget, 20)
+    cancel = CancelToken()
+    threading.Timer(0.2, cancel.cancel).start()
+    t0 = time.monotonic()
+    assert budget.acquire(100, cancel=cancel) is None
+    assert time.monotonic() - t0 < 1.5
+
+
+def test_daily_limits_defer_until_midnight():
+    budget = TokenBudget(per_day=1000, max_wait_s=30)
+    budget.record('m', 900, 50)
+    with pytest.raises(BudgetDeferred) as info:
+        budget.acquire(100)
+    assert 'daily token budget' in info.value.reason
+    spend = TokenBudget(usd_per_day=0.01, input_price=10.0, output_price=10.0)
+    spend.record('m', 1000, 0)
+    with pytest.raises(BudgetDeferred, match='spend'):
+        spend.acquire(100)
+
+
+def test_acquire_async_waits_too():
+    budget = TokenBudget(per_minute=1000, max_wait_s=5)
+    budget.record('m', 900, 100)
+    age_minute_window(budget, 0.2)
+    assert asyncio.run(budget.acquire_async(100)) == 100
+
+
+def test_day_totals_survive_a_restart_and_never_go_backwards(tmp_path):
+    path = str(tmp_path / 'budget.json')
+    budget = TokenBudget(path=path)
+    budget.record('m', 300, 200)
+    budget.save()
+    assert TokenBudget(path=path).stats()['day_tokens'] == 500
+    # Another process saved more meanwhile: a smaller total does not overwrite it
+    smaller = TokenBudget()
+    smaller.path = path
+    smaller.record('m', 10, 10)
+    smaller.save()
+    with open(path) as f:
+        assert json.load(f)['tokens'] == 500
+
+
+def test_usage_tokens_reads_both_field_styles():
+    assert usage_tokens({"input_tokens": 3, "output_tokens": 4}) == (3, 4)
+    assert usage_tokens({"prompt_tokens": 3, "completion_tokens": 4}) == (3, 4)
+    assert usage_tokens(None) is None
+
+
+def test_calls_against_the_stub_are_metered(stub, monkeypatch):
+    monkeypatch.setenv('ULAMLENS_NUTRITION', '0')
+    stub(latency={'default': 0.01})
+    budget = default_budget()
+    before = budget.stats()['day_tokens']
+    backend = BackendClient.from_env('stub')
+    try:
+        result = analyze_upload(b'\xff\xd8stub\xff\xd9', 'image/jpeg', 'stub', dispatcher=Dispatcher('sequential'),
+                                backend=backend)
+    finally:
+        backend.close()
+    assert result['ulam_name'] == 'Chicken Adobo'
+    # The stub reports 765 tokens per image plus the prompt and the answer
+    assert budget.stats()['day_tokens'] - before > 765
+    assert budget.stats()['reserved'] == 0
@@ -0,0 +1,92 @@
+import types
+
+import numpy as np
+import pytest
+
+from ulamlens import cache as cache_module
+from ulamlens.cache import AnalysisCache, dhash, hamming
+
+RESULT = {"ulam_name": "Chicken Adobo"}
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(cache_module, 'time', types.SimpleNamespace(time=lambda: now[0]))
+    return now
+
+
+@pytest.fixture
+def make_cache(tmp_path):
+    caches = []
+
+    def make(**kwargs):
+        caches.append(AnalysisCache(str(tmp_path / 'cache.sqlite'), **kwargs))
+        return caches[-1]
+
+    yield make
+    for c in caches:
+        c._db.close()
+
+
+def flip(value, bits):
+    for bit in bits:
+        value ^= 1 << bit
+    return value
+
+
+def test_dhash_is_stable_under_small_changes():
+    rng = np.random.default_rng(1)
+    photo = rng.integers(0, 256, (120, 160, 3), dtype=np.uint8)
+    photo = np.repeat(np.repeat(photo[::8, ::8], 8, 0), 8, 1)  # coarse blocks, like a plate
+    noisy = np.clip(photo.astype(int) + rng.integers(-3, 4, photo.shape), 0, 255).astype(np.uint8)
+    other = rng.integers(0, 256, (120, 160, 3), dtype=np.uint8)
+    assert dhash(photo) < 1 << 64
+    assert hamming(dhash(photo), dhash(noisy)) <= 6
+    assert hamming(dhash(photo), dhash(other)) > 6
+
+
+def test_hit_within_max_distance_and_miss_beyond(make_cache):
+    cache = make_cache(max_distance=4)
+    key = 0x0123456789ABCDEF
+    cache.put(key, RESULT)
+    assert cache.get(flip(key, [0, 9, 33, 63])) == RESULT
+    assert cache.get(flip(key, [0, 9, 33, 40, 63])) is None
+    assert cache.stats()['hits'] == 1 and cache.stats()['misses'] == 1
+
+
+def test_closest_entry_wins(make_cache):
+    cache = make_cache(max_distance=6)
+    cache.put(0, {"ulam_name": "far"})
+    cache.put(flip(0, [1, 2, 3]), {"ulam_name": "near"})
+    assert cache.get(flip(0, [1, 2, 3, 4]))['ulam_name'] == 'near'
+
+
+def test_hashes_with_the_top_bit_survive_a_reopen(make_cache):
+    key = (1 << 64) - 1
+    make_cache().put(key, RESULT)
+    assert make_cache(max_distance=0).get(key) == RESULT
+
+
+def test_entries_expire_after_the_ttl(make_cache, clock):
+    cache = make_cache(ttl_s=60)
+    cache.put(42, RESULT)
+    clock[0] += 59
+    assert cache.get(42) == RESULT
+    clock[0] += 2
+    assert cache.get(42) is None
+    assert cache.stats()['entries'] == 0 and cache.stats()['evictions'] == 1
+
+
+def test_least_recently_used_entry_is_evicted(make_cache, clock):
+    cache = make_cache(max_distance=0, max_entries=2)
+    cache.put(1, {"n": 1})
+    clock[0] += 1
+    cache.put(2, {"n": 2})
+    clock[0] += 1
+    assert cache.get(1) == {"n": 1}  # 1 is now more recent than 2
+    clock[0] += 1
+    cache.put(4, {"n": 4})
+    assert cache.get(2) is None
+    assert cache.get(1) == {"n": 1} and cache.get(4) == {"n": 4}
+    assert cache.stats()['entries'] == 2 and cache.stats()['evictions'] == 1
@@ -0,0 +1,63 @@
+import threading
+import time
+
+import pytest
+
+from ulamlens.analysis import analyze_upload
+from ulamlens.cancel import CancelToken, link
+from ulamlens.client import BackendClient
+from ulamlens.dispatch import Dispatcher
+
+
+def test_callbacks_run_once_on_cancel():
+    token = CancelToken()
+    calls = []
+    token.on_cancel(lambda: calls.append('a'))
+    unregister = token.on_cancel(lambda: calls.append('b'))
+    unregister()
+    token.cancel('user')
+    token.cancel('again')
+    assert calls == ['a']
+    assert token.is_set() and token.reason == 'user'
+    # Registered after the fact: runs right away
+    token.on_cancel(lambda: calls.append('late'))
+    assert calls == ['a', 'late']
+
+
+def test_child_follows_its_parent_but_not_the_other_way_round():
+    parent = CancelToken()
+    child = parent.child()
+    child.cancel()
+    assert not parent.is_set()
+    other = parent.child()
+    parent.cancel()
+    assert other.is_set()
+
+
+def test_link_ignores_plain_events():
+    calls = []
+    link(threading.Event(), lambda: calls.append(1))()
+    link(None, lambda: calls.append(1))()
+    assert calls == []
+
+
+@pytest.mark.parametrize('strategy', ['sequential', 'race', 'hedge'])
+def test_cancel_aborts_the_request_in_flight(stub, strategy):
+    server = stub(latency={'default': 5.0})
+    backend = BackendClient.from_env('stub')
+    backend.openai_client()
+    backend.session()
+    cancel = CancelToken()
+    threading.Timer(0.5, cancel.cancel).start()
+    t0 = time.monotonic()
+    try:
+        result = analyze_upload(b'\xff\xd8stub\xff\xd9', 'image/jpeg', 'stub', cancel=cancel, backend=backend,
+                                dispatcher=Dispatcher(strategy, hedge_delay_s=0.1, max_parallel=2))
+    finally:
+        backend.close()
+    assert time.monotonic() - t0 < 2.0
+    assert result == {"error": "Analysis cancelled by user."}
+    deadline = time.monotonic() + 2.0
+    while len(server.aborted) < len(server.requests) and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert server.requests and sorted(server.aborted) == sorted(server.requests)
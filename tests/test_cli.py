@@ -0,0 +1,62 @@
+import json
+import os
+
+import cv2
+import numpy as np
+
+from ulamlens.cli import load_done, main
+
+
+def record(path, result=None):
+    return json.dumps({"path": path, "result": result or {"ulam_name": "Adobo"}}) + '\n'
+
+
+def test_load_done_truncates_a_partial_last_line(tmp_path):
+    out = tmp_path / 'out.jsonl'
+    complete = record('/a.jpg') + record('/b.jpg')
+    out.write_text(complete + '{"path": "/c.jpg", "res')
+    assert load_done(str(out)) == {'/a.jpg', '/b.jpg'}
+    assert out.read_text() == complete
+    # Appending after the truncation gives a valid file again
+    with open(out, 'a') as f:
+        f.write(record('/c.jpg'))
+    assert load_done(str(out)) == {'/a.jpg', '/b.jpg', '/c.jpg'}
+
+
+def test_load_done_stops_at_a_garbled_line(tmp_path):
+    out = tmp_path / 'out.jsonl'
+    out.write_text(record('/a.jpg') + 'not json\n' + record('/b.jpg'))
+    assert load_done(str(out)) == {'/a.jpg'}
+    assert out.read_text() == record('/a.jpg')
+
+
+def test_load_done_can_skip_errors(tmp_path):
+    out = tmp_path / 'out.jsonl'
+    out.write_text(record('/a.jpg') + record('/b.jpg', {"error": "timeout"}))
+    assert load_done(str(out)) == {'/a.jpg', '/b.jpg'}
+    assert out.read_text().count('\n') == 2
+    assert load_done(str(out), retry_errors=True) == {'/a.jpg'}
+    # The stale error line is gone, so the retried image gets a single line
+    assert out.read_text() == record('/a.jpg')
+    assert load_done(str(tmp_path / 'missing.jsonl')) == set()
+
+
+def test_resume_only_analyses_missing_images(stub, tmp_path):
+    server = stub(latency={'default': 0.01})
+    photos = tmp_path / 'photos'
+    photos.mkdir()
+    for i in range(3):
+        image = np.full((240, 320, 3), 60 * i, np.uint8)
+        cv2.imwrite(str(photos / f'{i}.jpg'), image)
+    out = tmp_path / 'out.jsonl'
+    args = ['analyze', str(photos), '--out', str(out), '--dispatch', 'sequential', '--workers', '1']
+    assert main(args) == 0
+    lines = out.read_text().splitlines(keepends=True)
+    assert len(lines) == 3
+    # Simulate a run killed in the middle of writing the last line
+    out.write_text(''.join(lines[:2]) + lines[2][:10])
+    sent = len(server.requests)
+    assert main(args) == 0
+    assert len(server.requests) == sent + 1
+    paths = [json.loads(line)['path'] for line in out.read_text().splitlines()]
+    assert sorted(paths) == sorted(os.path.abspath(str(photos / f'{i}.jpg')) for i in range(3))
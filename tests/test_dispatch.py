@@ -0,0 +1,145 @@
+import threading
+import time
+
+import pytest
+
+from ulamlens.analysis import VISION_MODELS, analyze_upload
+from ulamlens.cancel import CancelToken
+from ulamlens.client import BackendClient
+from ulamlens.dispatch import Attempt, Dispatcher
+
+PAYLOAD = b'\xff\xd8stub-jpeg\xff\xd9'
+
+
+class Recorder:
+    """Attempts that answer ``text`` after ``delay`` seconds (or raise ``error``) and remember their tokens."""
+
+    def __init__(self):
+        self.tokens = {}
+        self.started = {}
+        self.t0 = time.monotonic()
+
+    def attempt(self, name, delay, text='ok', error=None):
+        def call(cancel, timeout_s):
+            self.tokens[name] = cancel
+            self.started[name] = time.monotonic() - self.t0
+            if cancel.wait(delay):
+                raise RuntimeError('cancelled')
+            if error is not None:
+                raise error
+            return text
+        return Attempt(name, call)
+
+
+def accept(raw_text):
+    return {'text': raw_text} if raw_text == 'ok' else None
+
+
+def statuses(outcome):
+    return {name: status for name, _, status in outcome.attempts}
+
+
+def test_race_returns_the_fastest_and_cancels_the_losers():
+    rec = Recorder()
+    attempts = [rec.attempt('slow', 2.0), rec.attempt('fast', 0.05)]
+    t0 = time.monotonic()
+    outcome = Dispatcher('race', max_parallel=2).run(attempts, accept)
+    assert time.monotonic() - t0 < 1.0
+    assert outcome.name == 'fast' and outcome.result == {'text': 'ok'}
+    assert statuses(outcome) == {'fast': 'ok', 'slow': 'lost'}
+    assert rec.tokens['slow'].cancelled and rec.tokens['slow'].reason == 'lost'
+
+
+def test_race_moves_on_when_an_answer_is_rejected():
+    rec = Recorder()
+    attempts = [rec.attempt('garbled', 0.0, text='???'), rec.attempt('good', 0.1)]
+    outcome = Dispatcher('race', max_parallel=2).run(attempts, accept)
+    assert outcome.name == 'good'
+    assert statuses(outcome) == {'garbled': 'invalid', 'good': 'ok'}
+
+
+def test_hedge_starts_the_backup_after_the_delay():
+    rec = Recorder()
+    attempts = [rec.attempt('primary', 2.0), rec.attempt('backup', 0.05)]
+    outcome = Dispatcher('hedge', hedge_delay_s=0.2, max_parallel=2).run(attempts, accept)
+    assert outcome.name == 'backup'
+    assert rec.started['backup'] >= 0.15
+    assert statuses(outcome) == {'backup': 'ok', 'primary': 'lost'}
+    assert rec.tokens['primary'].cancelled
+
+
+def test_hedge_does_not_start_the_backup_when_the_primary_is_quick():
+    rec = Recorder()
+    attempts = [rec.attempt('primary', 0.05), rec.attempt('backup', 0.05)]
+    outcome = Dispatcher('hedge', hedge_delay_s=1.0, max_parallel=2).run(attempts, accept)
+    assert outcome.name == 'primary'
+    assert 'backup' not in rec.started
+
+
+def test_hedge_replaces_a_failed_attempt_at_once():
+    rec = Recorder()
+    attempts = [rec.attempt('broken', 0.0, error=ValueError('bad request')), rec.attempt('backup', 0.0)]
+    outcome = Dispatcher('hedge', hedge_delay_s=5.0, max_parallel=2).run(attempts, accept)
+    assert outcome.name == 'backup'
+    assert rec.started['backup'] < 2.0  # well before the hedge delay
+    assert outcome.error == 'bad request'
+
+
+def test_sequential_runs_one_attempt_at_a_time():
+    rec = Recorder()
+    attempts = [rec.attempt('first', 0.1, text='???'), rec.attempt('second', 0.0)]
+    outcome = Dispatcher('sequential').run(attempts, accept)
+    assert outcome.name == 'second'
+    assert rec.started['second'] >= 0.1
+
+
+def test_outside_cancel_stops_every_attempt():
+    rec = Recorder()
+    cancel = CancelToken()
+    attempts = [rec.attempt('a', 5.0), rec.attempt('b', 5.0)]
+    t0 = time.monotonic()
+    threading.Timer(0.1, cancel.cancel).start()
+    outcome = Dispatcher('race', max_parallel=2).run(attempts, accept, cancel=cancel)
+    assert time.monotonic() - t0 < 1.0
+    assert outcome.cancelled and not outcome.ok
+    assert statuses(outcome) == {'a': 'cancelled', 'b': 'cancelled'}
+    assert rec.tokens['a'].cancelled and rec.tokens['b'].cancelled
+
+
+def test_attempt_over_its_budget_times_out():
+    rec = Recorder()
+    outcome = Dispatcher('sequential', attempt_timeout_s=0.2).run([rec.attempt('stuck', 5.0)], accept)
+    assert not outcome.ok
+    assert statuses(outcome) == {'stuck': 'timeout'}
+    assert rec.tokens['stuck'].reason == 'timeout'
+
+
+@pytest.mark.parametrize('error, status', [
+    (ConnectionError('refused'), 'unreachable'),
+    (TimeoutError('read timed out'), 'unreachable'),
+    (ValueError('401 unauthorized'), 'error'),
+])
+def test_failures_are_classified(error, status):
+    rec = Recorder()
+    outcome = Dispatcher('sequential').run([rec.attempt('only', 0.0, error=error)], accept)
+    assert statuses(outcome) == {'only': status}
+
+
+def test_race_against_the_stub_closes_the_losing_connection(stub):
+    server = stub(latency={'sdk': 3.0, 'http': 0.5})
+    backend = BackendClient.from_env('stub')
+    backend.openai_client()  # so the SDK request is on the wire before the HTTP answer arrives
+    try:
+        t0 = time.monotonic()
+        result = analyze_upload(PAYLOAD, 'image/jpeg', 'stub', dispatcher=Dispatcher('race', max_parallel=2),
+                                backend=backend)
+        elapsed = time.monotonic() - t0
+    finally:
+        backend.close()
+    assert result['ulam_name'] == 'Chicken Adobo'
+    assert elapsed < 2.0
+    # The SDK request hung up on the stub instead of running to the end
+    deadline = time.monotonic() + 2.0
+    while not server.aborted and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert ('sdk', VISION_MODELS[0]) in server.aborted
@@ -0,0 +1,76 @@
+import numpy as np
+
+from ulamlens.motion import MotionDetector
+
+FPS = 30
+
+
+def scene(plate_at=None, size=240):
+    frame = np.full((480, 640, 3), 90, np.uint8)
+    if plate_at is not None:
+        x, y = plate_at
+        frame[y:y + size, x:x + size] = 230
+    return frame
+
+
+class Feed:
+    """Feeds frames at ``FPS`` with an explicit clock and records when the detector fired."""
+
+    def __init__(self, detector):
+        self.detector = detector
+        self.now = 0.0
+        self.fired = []
+
+    def run(self, seconds, frame_at):
+        for i in range(int(seconds * FPS)):
+            if self.detector.update(frame_at(i), now=self.now):
+                self.fired.append(round(self.now, 2))
+            self.now += 1 / FPS
+
+
+def detector(cooldown_s=3.0):
+    # A generous frame budget so no frame is skipped on a slow test machine
+    return MotionDetector(settle_s=0.8, cooldown_s=cooldown_s, budget_ms=1000.0)
+
+
+def test_fires_once_after_the_plate_settles():
+    feed = Feed(detector())
+    feed.run(1.0, lambda i: scene())
+    feed.run(0.3, lambda i: scene((40 * i, 150)))  # sliding in
+    assert feed.fired == [] and feed.detector.state == 'moving'
+    settled_at = feed.now
+    feed.run(6.0, lambda i: scene((360, 150)))
+    assert len(feed.fired) == 1
+    assert settled_at + 0.8 <= feed.fired[0] <= settled_at + 1.0
+    assert feed.detector.state == 'triggered'
+
+
+def test_a_new_plate_fires_again_but_not_before_the_cooldown():
+    feed = Feed(detector())
+    feed.run(0.5, lambda i: scene())
+    feed.run(2.0, lambda i: scene((100, 100)))
+    assert len(feed.fired) == 1
+    # Swapped for another plate right away: still within the cooldown
+    feed.run(0.2, lambda i: scene())
+    feed.run(0.5, lambda i: scene((300, 200)))
+    assert len(feed.fired) == 1
+    feed.run(3.0, lambda i: scene((300, 200)))
+    assert len(feed.fired) == 2
+    assert feed.fired[1] - feed.fired[0] >= 3.0
+
+
+def test_empty_scene_and_slow_lighting_changes_never_fire():
+    feed = Feed(detector())
+    feed.run(10.0, lambda i: scene() + np.uint8(i // 30))  # one gray level brighter every second
+    assert feed.fired == []
+    assert feed.detector.state == 'empty'
+
+
+def test_rearm_allows_another_capture_of_the_same_plate():
+    feed = Feed(detector(cooldown_s=0.0))
+    feed.run(0.5, lambda i: scene())
+    feed.run(2.0, lambda i: scene((100, 100)))
+    assert len(feed.fired) == 1
+    feed.detector.rearm()
+    feed.run(2.0, lambda i: scene((100, 100)))
+    assert len(feed.fired) == 2
@@ -0,0 +1,75 @@
+import pytest
+
+from ulamlens.analysis import analyze_upload
+from ulamlens.client import BackendClient
+from ulamlens.dispatch import Dispatcher
+from ulamlens.nutrition import NutritionTable, enrich, tokens
+
+
+@pytest.fixture(scope='module')
+def table():
+    return NutritionTable.load()
+
+
+def name_of(row):
+    return row['name'] if row else None
+
+
+@pytest.mark.parametrize('query, expected', [
+    ('Chicken Adobo', 'Chicken Adobo'),
+    ('adobong manok', 'Chicken Adobo'),
+    ('Adobo na Manok', 'Chicken Adobo'),
+    ('ADOBO (chicken)', 'Chicken Adobo'),
+    ('adobong baboy', 'Pork Adobo'),
+    ('Adobong Manok sa Gata', 'Chicken Adobo sa Gata'),
+    ('Sinigang na Isda', 'Sinigang na Isda'),
+    ('Kare-kare', 'Kare-Kare'),
+    ('pansit bihon', 'Pancit Bihon'),
+])
+def test_names_and_aliases(table, query, expected):
+    assert name_of(table.lookup(query)) == expected
+
+
+@pytest.mark.parametrize('query, expected', [
+    ('Chiken Adobo', 'Chicken Adobo'),
+    ('Bicol Expres', 'Bicol Express'),
+    ('Dinuguann', 'Dinuguan'),
+    ('Lechón Kawali', 'Lechon Kawali'),
+])
+def test_typos_and_accents(table, query, expected):
+    assert name_of(table.lookup(query)) == expected
+
+
+@pytest.mark.parametrize('query', ['', 'Spaghetti Carbonara', 'chicken', 'pork'])
+def test_unknown_or_ambiguous_names(table, query):
+    assert table.lookup(query) is None
+
+
+def test_tokens_translate_and_correct_words(table):
+    assert tokens('Adobong Manok na Prito') == {'adobong', 'chicken', 'fried'}
+    assert tokens('chiken tinolla', table.vocabulary) == {'chicken', 'tinola'}
+
+
+def test_enrich_fills_the_row_and_leaves_errors_alone(table):
+    result = enrich({"ulam_name": "adobong manok"}, table)
+    assert result['nutrition_match'] == 'Chicken Adobo'
+    assert result['macros'] == {"calories": 420, "protein_g": 32.0, "carbs_g": 6.0, "fat_g": 28.0}
+    assert result['serving'] and result['warnings']
+    unknown = {"ulam_name": "Ramen", "macros": {"calories": 500}}
+    assert enrich(dict(unknown), table) == unknown
+    assert enrich({"error": "x"}, table) == {"error": "x"}
+
+
+def test_identified_dish_gets_table_macros(stub, monkeypatch):
+    monkeypatch.setenv('ULAMLENS_NUTRITION', '1')
+    server = stub(latency={'default': 0.01})
+    backend = BackendClient.from_env('stub')
+    try:
+        result = analyze_upload(b'\xff\xd8stub\xff\xd9', 'image/jpeg', 'stub', dispatcher=Dispatcher('sequential'),
+                                backend=backend)
+    finally:
+        backend.close()
+    # The stub answered the identification prompt with the name only
+    assert result['nutrition_match'] == 'Chicken Adobo'
+    assert result['macros']['calories'] == 420
+    assert server.requests
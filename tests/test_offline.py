@@ -0,0 +1,180 @@
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from ulamlens import offline as offline_module
+from ulamlens.analysis import UNREACHABLE_RESULT, analyze_upload
+from ulamlens.client import BackendClient
+from ulamlens.dispatch import Dispatcher
+from ulamlens.engine import AnalysisEngine
+from ulamlens.offline import OfflineDrainer, OfflineQueue, is_retryable
+
+
+@pytest.fixture
+def queue(tmp_path):
+    q = OfflineQueue(str(tmp_path / 'queue.sqlite'))
+    yield q
+    q.close()
+
+
+@pytest.fixture
+def no_jitter(monkeypatch):
+    monkeypatch.setattr(offline_module.random, 'uniform', lambda low, high: high)
+
+
+def wait_for(condition, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.02)
+    return condition()
+
+
+def test_interrupted_job_is_sent_again_after_a_restart(tmp_path):
+    path = str(tmp_path / 'queue.sqlite')
+    q = OfflineQueue(path)
+    job_id = q.put(b'jpeg-bytes', 'image/jpeg', {"source": "camera"})
+    assert [job.id for job in q.claim(5)] == [job_id]
+    assert q.stats()['running'] == 1
+    q.close()  # the app stops while the job is being sent
+
+    q = OfflineQueue(path)
+    try:
+        assert q.stats()['pending'] == 1 and q.stats()['running'] == 0
+        job, = q.claim(5)
+        assert (job.id, job.upload_bytes, job.mime, job.meta) == (job_id, b'jpeg-bytes', 'image/jpeg',
+                                                                   {"source": "camera"})
+    finally:
+        q.close()
+
+
+def test_retry_waits_and_results_are_kept_until_delivered(queue):
+    job_id = queue.put(b'x', 'image/jpeg')
+    queue.claim(1)
+    assert queue.retry(job_id, 'down', 60.0) == 1
+    assert queue.claim(1) == []
+    assert queue.next_due() > time.time() + 50
+    queue.wake()
+    job, = queue.claim(1)
+    queue.complete(job.id, {"ulam_name": "Adobo"})
+    assert queue.depth() == 0
+    assert [(j, r) for j, r, _, _ in queue.finished()] == [(job_id, {"ulam_name": "Adobo"})]
+    queue.delivered(job_id)
+    assert queue.finished() == []
+
+
+def test_full_queue_refuses_new_jobs(tmp_path):
+    q = OfflineQueue(str(tmp_path / 'queue.sqlite'), max_jobs=2)
+    try:
+        assert q.put(b'1', 'image/jpeg') and q.put(b'2', 'image/jpeg')
+        assert q.put(b'3', 'image/jpeg') is None
+    finally:
+        q.close()
+
+
+def test_drainer_backs_off_exponentially_then_delivers(queue, no_jitter):
+    calls, delivered = [], []
+
+    def analyze(upload_bytes, mime, cancel):
+        calls.append(time.monotonic())
+        return dict(UNREACHABLE_RESULT) if len(calls) <= 4 else {"ulam_name": "Adobo"}
+
+    queue.put(b'x', 'image/jpeg', {"n": 1})
+    drainer = OfflineDrainer(queue, analyze, lambda job_id, result, meta: delivered.append((result, meta)),
+                             base_delay_s=0.1, max_delay_s=0.3).start()
+    try:
+        assert wait_for(lambda: delivered)
+    finally:
+        drainer.stop()
+    assert delivered == [({"ulam_name": "Adobo"}, {"n": 1})]
+    gaps = [b - a for a, b in zip(calls, calls[1:])]
+    # 0.1, 0.2, then capped at 0.3
+    for gap, expected in zip(gaps, [0.1, 0.2, 0.3, 0.3]):
+        assert expected - 0.02 <= gap <= expected + 0.25
+    stats = drainer.stats()
+    assert stats['retries'] == 4 and stats['sent'] == 1 and stats['reachable']
+
+
+def test_only_one_probe_while_unreachable(queue, no_jitter):
+    running, peak = [0], [0]
+    lock = threading.Lock()
+    down = threading.Event()
+    down.set()
+
+    def analyze(upload_bytes, mime, cancel):
+        with lock:
+            running[0] += 1
+            peak[0] = max(peak[0], running[0])
+        time.sleep(0.05)
+        with lock:
+            running[0] -= 1
+        return dict(UNREACHABLE_RESULT) if down.is_set() else {"ulam_name": "Adobo"}
+
+    for i in range(4):
+        queue.put(b'x', 'image/jpeg', {"n": i})
+    delivered = []
+    drainer = OfflineDrainer(queue, analyze, lambda job_id, result, meta: delivered.append(meta['n']),
+                             workers=2, base_delay_s=0.05, max_delay_s=0.1).start()
+    try:
+        # The first round still assumes the backend is up; after a failure only one job is tried at a time
+        assert wait_for(lambda: drainer.stats()['retries'] >= 2)
+        peak[0] = running[0]
+        assert wait_for(lambda: drainer.stats()['retries'] >= 8)
+        assert peak[0] == 1
+        down.clear()
+        assert wait_for(lambda: len(delivered) == 4)
+    finally:
+        drainer.stop()
+    assert sorted(delivered) == [0, 1, 2, 3]
+
+
+def test_deferred_jobs_wait_for_the_budget_without_an_outage(queue):
+    results = [{"error": "budget", "deferred": True, "retry_after": 1.0}, {"ulam_name": "Adobo"}]
+    calls, delivered = [], []
+
+    def analyze(upload_bytes, mime, cancel):
+        calls.append(time.monotonic())
+        return dict(results[min(len(calls), 2) - 1])
+
+    assert is_retryable(results[0]) and not is_retryable(results[1])
+    queue.put(b'x', 'image/jpeg')
+    drainer = OfflineDrainer(queue, analyze, lambda job_id, result, meta: delivered.append(result),
+                             base_delay_s=0.01).start()
+    try:
+        assert wait_for(lambda: len(calls) == 1)
+        time.sleep(0.1)
+        assert drainer.stats()['reachable']
+        assert wait_for(lambda: delivered)
+    finally:
+        drainer.stop()
+    assert calls[1] - calls[0] >= 0.95
+    assert delivered == [{"ulam_name": "Adobo"}]
+
+
+def test_photo_taken_offline_is_delivered_once_the_stub_is_up(stub, down_port, no_jitter):
+    engine = AnalysisEngine.from_env('stub', offline=True)
+    result = engine.analyze(np.full((480, 640, 3), 120, np.uint8))
+    assert result['unreachable'] and result['queued']
+    assert engine.offline.depth() == 1
+
+    backend = BackendClient.from_env('stub')
+    calls, delivered = [], []
+
+    def analyze(upload_bytes, mime, cancel):
+        calls.append(time.monotonic())
+        return analyze_upload(upload_bytes, mime, 'stub', dispatcher=Dispatcher('sequential'), cancel=cancel,
+                              backend=backend)
+
+    drainer = OfflineDrainer(engine.offline, analyze, lambda job_id, result, meta: delivered.append(result),
+                             base_delay_s=0.1, max_delay_s=1.0).start()
+    try:
+        assert wait_for(lambda: len(calls) >= 3)
+        assert delivered == []
+        stub(port=down_port, latency={'default': 0.01})
+        assert wait_for(lambda: delivered)
+    finally:
+        drainer.stop()
+        backend.close()
+    assert delivered[0]['ulam_name'] == 'Chicken Adobo'
+    assert engine.offline.depth() == 0
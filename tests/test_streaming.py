@@ -0,0 +1,75 @@
+import json
+
+from ulamlens.analysis import analyze_upload
+from ulamlens.client import BackendClient
+from ulamlens.dispatch import Dispatcher
+from ulamlens.streaming import IncrementalJsonParser, sse_text_deltas
+
+ANSWER = json.dumps({
+    "ulam_name": "Sinigang na Baboy",
+    "macros": {"calories": 350, "protein_g": 25.0, "carbs_g": 10.0, "fat_g": 22.0},
+    "health_facts": "Tamarind broth, {not} a \"brace\", with, commas",
+    "warnings": "None",
+})
+
+
+def feed_in_pieces(text, cuts):
+    parser = IncrementalJsonParser()
+    fields = []
+    start = 0
+    for cut in list(cuts) + [len(text)]:
+        fields += parser.feed(text[start:cut])
+        start = cut
+    return parser, fields
+
+
+def test_every_split_point_gives_the_same_fields():
+    expected = list(json.loads(ANSWER).items())
+    for cut in range(1, len(ANSWER)):
+        parser, fields = feed_in_pieces(ANSWER, [cut])
+        assert fields == expected, f"split at {cut}"
+        assert parser.done
+
+
+def test_one_character_at_a_time():
+    parser, fields = feed_in_pieces(ANSWER, range(1, len(ANSWER)))
+    assert dict(fields) == json.loads(ANSWER)
+
+
+def test_fields_are_reported_as_soon_as_they_are_complete():
+    parser = IncrementalJsonParser()
+    assert parser.feed('```json\n{"ulam_name": "Lech') == []
+    assert parser.feed('on", "macros": {"calories": 1') == [('ulam_name', 'Lechon')]
+    # Nested object: nothing until its closing brace
+    assert parser.feed('00, "fat_g": 9') == []
+    assert parser.feed('}, "warnings"') == [('macros', {'calories': 100, 'fat_g': 9})]
+    assert parser.feed(': "Salty"}\n```') == [('warnings', 'Salty')]
+    assert parser.done
+    assert parser.feed('{"ignored": 1}') == []
+
+
+def test_sse_text_deltas_reads_deltas_and_usage():
+    usage = []
+    events = [
+        {"type": "response.created"},
+        {"type": "response.output_text.delta", "delta": '{"ulam_'},
+        {"type": "response.output_text.delta", "delta": 'name":"Adobo"}'},
+        {"type": "response.completed", "response": {"usage": {"input_tokens": 5, "output_tokens": 3}}},
+    ]
+    lines = [b'event: x'] + [f"data: {json.dumps(e)}".encode() for e in events] + [b'data: [DONE]', b'']
+    assert ''.join(sse_text_deltas(lines, usage.append)) == '{"ulam_name":"Adobo"}'
+    assert usage == [{"input_tokens": 5, "output_tokens": 3}]
+
+
+def test_fields_stream_in_from_the_stub(stub, monkeypatch):
+    monkeypatch.setenv('ULAMLENS_NUTRITION', '0')
+    stub(latency={'default': 0.05}, chunk_chars=3, chunk_delay=0.005)
+    backend = BackendClient.from_env('stub')
+    fields = []
+    try:
+        result = analyze_upload(b'\xff\xd8stub\xff\xd9', 'image/jpeg', 'stub', dispatcher=Dispatcher('sequential'),
+                                backend=backend, on_field=lambda key, value: fields.append(key))
+    finally:
+        backend.close()
+    assert result['ulam_name'] == 'Chicken Adobo'
+    assert fields[:2] == ['ulam_name', 'macros']
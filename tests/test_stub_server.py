@@ -0,0 +1,69 @@
+import json
+
+from stub_server import StubConfig, answer_for
+
+from ulamlens.analysis import analyze_upload
+from ulamlens.client import BackendClient
+from ulamlens.dispatch import Dispatcher
+
+PAYLOAD = b'\xff\xd8stub\xff\xd9'
+
+
+def analyze(backend):
+    return analyze_upload(PAYLOAD, 'image/jpeg', 'stub', dispatcher=Dispatcher('sequential'), backend=backend)
+
+
+def test_seeded_plans_repeat():
+    config_a = StubConfig(error_rate=0.3, malformed_rate=0.3, jitter=0.1, seed=7)
+    config_b = StubConfig(error_rate=0.3, malformed_rate=0.3, jitter=0.1, seed=7)
+    plans = [config_a.plan('m', 'sdk') for _ in range(50)]
+    assert plans == [config_b.plan('m', 'sdk') for _ in range(50)]
+    statuses = [status for status, _, _ in plans]
+    assert 0 < statuses.count(500) < 50
+    assert all(0 <= delay <= 0.1 for _, _, delay in plans)
+
+
+def test_answers_follow_the_prompt():
+    assert json.loads(answer_for('Identify the dish ... not a common Filipino ulam'))['ulam_name'] == 'Chicken Adobo'
+    assert set(json.loads(answer_for('Answer as {"n":name,"m":[...]}'))) == {'n', 'm', 'h', 'w'}
+    assert 'macros' in json.loads(answer_for('Describe this dish'))
+
+
+def test_error_rate_fails_every_backend(stub, monkeypatch):
+    monkeypatch.setenv('ULAMLENS_NUTRITION', '0')
+    server = stub(error_rate=1.0)
+    backend = BackendClient.from_env('stub')
+    try:
+        result = analyze(backend)
+    finally:
+        backend.close()
+    # A 500 is an answer from the backend, not an outage
+    assert 'error' in result and not result.get('unreachable')
+    assert len(server.requests) >= 2
+
+
+def test_malformed_answers_are_rejected(stub, monkeypatch):
+    monkeypatch.setenv('ULAMLENS_NUTRITION', '0')
+    stub(malformed_rate=1.0)
+    backend = BackendClient.from_env('stub')
+    try:
+        result = analyze(backend)
+    finally:
+        backend.close()
+    assert 'error' in result and 'ulam_name' not in result
+
+
+def test_error_answers_are_not_resent(stub, monkeypatch):
+    monkeypatch.setenv('ULAMLENS_NUTRITION', '0')
+    server = stub(error_rate=1.0)
+    sent = []
+    for retries in ('0', '2'):
+        monkeypatch.setenv('ULAMLENS_HTTP_RETRIES', retries)
+        backend = BackendClient.from_env('stub')
+        try:
+            analyze(backend)
+        finally:
+            backend.close()
+        sent.append(len(server.requests) - sum(sent))
+    # Retries are for failed connections only: a 500 is never sent again
+    assert sent[0] == sent[1] > 0
@@ -0,0 +1,166 @@
+import threading
+import time
+from collections import deque
+import cv2
+
+from ulamlens.config import env_int
+from ulamlens.quality import sharpness_score
+
+
+class FrameGrabber(threading.Thread):
+    """Background thread that owns the cv2.VideoCapture and keeps only the newest frame.
+
+    The Qt event loop never calls the blocking ``read()`` itself; it asks for
+    ``latest()`` instead, which returns immediately with whatever frame was
+    grabbed last. Older frames are simply overwritten (dropped).
+
+    With a ``scorer`` (e.g. ``quality.sharpness_score``) the last ``keep``
+    frames are also scored on this thread, so ``best()`` can hand Capture the
+    sharpest recent frame instead of whichever came last.
+    """
+
+    def __init__(self, device=0, scorer=None, keep=5):
+        super().__init__(daemon=True)
+        self.device = device
+        self.scorer = scorer
+        self._recent = deque(maxlen=max(1, keep))  # (score, frame_id, time, frame)
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._paused = threading.Event()
+        self._frame = None
+        self._frame_id = 0
+        self._consumed_id = 0
+        self.cap = None
+        self.dropped = 0
+
+    def run(self):
+        self.cap = cv2.VideoCapture(self.device)
+        if not self.cap.isOpened():
+            print(f"[camera] Could not open camera {self.device}.")
+        try:
+            while not self._stop_event.is_set():
+                if self._paused.is_set():
+                    # Keep the device open but stop decoding frames nobody will see
+                    self._stop_event.wait(0.1)
+                    continue
+                ret, frame = self.cap.read()
+                if not ret:
+                    # Camera not ready (or unplugged); avoid spinning the CPU
+                    time.sleep(0.05)
+                    continue
+                score = self.scorer(frame) if self.scorer is not None else None
+                with self._lock:
+                    if score is not None:
+                        self._recent.append((score, self._frame_id + 1, time.monotonic(), frame))
+                    if self._frame is not None and self._frame_id != self._consumed_id:
+                        # Previous frame was never picked up by the UI
+                        self.dropped += 1
+                    self._frame = frame
+                    self._frame_id += 1
+        finally:
+            self.cap.release()
+
+    def latest(self, only_new=False):
+        """Return ``(frame_id, frame)`` for the newest frame, or ``(id, None)`` if none yet.
+
+        With ``only_new=True`` the frame is only returned when it has not been
+        handed out before, so the caller can skip redundant repaints.
+        """
+        with self._lock:
+            if self._frame is None or (only_new and self._frame_id == self._consumed_id):
+                return self._frame_id, None
+            self._consumed_id = self._frame_id
+            return self._frame_id, self._frame
+
+    def best(self, max_age_s=1.0):
+        """``(frame_id, frame, score)`` of the highest-scoring frame of the last ``max_age_s`` seconds.
+
+        Falls back to ``latest()`` (with a None score) without a scorer or recent frames.
+        """
+        cutoff = time.monotonic() - max_age_s
+        with self._lock:
+            recent = [entry for entry in self._recent if entry[2] >= cutoff]
+        if not recent:
+            frame_id, frame = self.latest()
+            return frame_id, frame, None
+        score, frame_id, _, frame = max(recent, key=lambda entry: entry[0])
+        return frame_id, frame, score
+
+    def pause(self):
+        self._paused.set()
+        with self._lock:
+            # A frame from before the pause must not be shown (or captured) after resuming
+            self._recent.clear()
+            self._frame = None
+            self._consumed_id = self._frame_id
+
+    def resume(self):
+        self._paused.clear()
+
+    def stop(self, wait=False, timeout=2.0):
+        """Ask the thread to exit; it releases the camera on its way out.
+
+        By default this does not wait, so a stalled driver can never block the UI.
+        """
+        self._stop_event.set()
+        if wait and self.is_alive() and threading.current_thread() is not self:
+            self.join(timeout)
+
+
+class CameraService:
+    """App-wide owner of the camera so it is opened once, not on every page visit.
+
+    Users ``acquire()`` the camera while they need frames and ``release()`` it
+    afterwards. With no users the grabber is paused but keeps the device open
+    (a warm handle), so the next preview starts instantly. ``close()`` stops
+    the grabber and waits for it to release the device. ``scorer`` and
+    ``keep`` are passed on to the grabber for best-of-N capture.
+    """
+
+    def __init__(self, device=0, scorer=None, keep=5):
+        self.device = device
+        self.scorer = scorer
+        self.keep = keep
+        self.grabber = None
+        self._users = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, device=0):
+        """Camera with best-of-ULAMLENS_BEST_OF capture (1 turns frame scoring off)."""
+        keep = env_int('ULAMLENS_BEST_OF', 5)
+        return cls(device, scorer=sharpness_score if keep > 1 else None, keep=keep)
+
+    def acquire(self):
+        with self._lock:
+            if self.grabber is None or not self.grabber.is_alive():
+                self.grabber = FrameGrabber(self.device, scorer=self.scorer, keep=self.keep)
+                self.grabber.start()
+            self._users += 1
+            self.grabber.resume()
+            return self.grabber
+
+    def release(self):
+        with self._lock:
+            self._users = max(0, self._users - 1)
+            if self._users == 0 and self.grabber is not None:
+                self.grabber.pause()
+
+    def latest(self, only_new=False):
+        grabber = self.grabber
+        if grabber is None:
+            return 0, None
+        return grabber.latest(only_new)
+
+    def best(self, max_age_s=1.0):
+        grabber = self.grabber
+        if grabber is None:
+            return 0, None, None
+        return grabber.best(max_age_s)
+
+    def close(self, timeout=2.0):
+        with self._lock:
+            grabber, self.grabber = self.grabber, None
+            self._users = 0
+        if grabber is not None:
+            grabber.stop(wait=True, timeout=timeout)
@@ -0,0 +1,145 @@
+import json
+import time
+from collections import OrderedDict
+
+from PyQt5.QtCore import QAbstractListModel, QModelIndex, QSize, Qt
+from PyQt5.QtGui import QPixmap
+from PyQt5.QtWidgets import QAbstractItemView, QHeaderView, QLabel, QPushButton, QTableView, QVBoxLayout, QWidget
+
+# Rows are loaded from the store in blocks of this many; only a few blocks are kept
+BLOCK_ROWS = 256
+KEEP_BLOCKS = 16
+KEEP_PIXMAPS = 512
+ROW_HEIGHT = 56
+
+
+class HistoryModel(QAbstractListModel):
+    """List model over a ``HistoryStore`` that only loads the rows being looked at.
+
+    The model holds every entry id (8 bytes each); entries and thumbnails are
+    fetched block by block as the view asks for them and dropped again when
+    the view has scrolled far away, so 100k entries cost a few MB.
+    """
+
+    def __init__(self, store, parent=None):
+        super().__init__(parent)
+        self.store = store
+        self._ids = ()
+        self._blocks = OrderedDict()
+        self._pixmaps = OrderedDict()
+
+    def reload(self):
+        self.beginResetModel()
+        self._ids = self.store.ids()
+        self._blocks.clear()
+        self._pixmaps.clear()
+        self.endResetModel()
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._ids)
+
+    def entry(self, row):
+        block = row // BLOCK_ROWS
+        entries = self._blocks.get(block)
+        if entries is None:
+            start = block * BLOCK_ROWS
+            entries = self.store.entries(self._ids[start:start + BLOCK_ROWS])
+            self._blocks[block] = entries
+            if len(self._blocks) > KEEP_BLOCKS:
+                self._blocks.popitem(last=False)
+        else:
+            self._blocks.move_to_end(block)
+        index = row - block * BLOCK_ROWS
+        return entries[index] if index < len(entries) else None
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        entry = self.entry(index.row())
+        if entry is None:
+            return None
+        if role == Qt.DisplayRole:
+            calories = entry['macros']['calories']
+            kcal = f"{calories:.0f} kcal" if calories is not None else "? kcal"
+            when = time.strftime('%a %d %b %Y %H:%M', time.localtime(entry['ts']))
+            latency = f" · {entry['latency_s']:.1f}s" if entry['latency_s'] is not None else ""
+            return f"{entry['ulam_name']} — {kcal}\n{when}{latency}"
+        if role == Qt.DecorationRole:
+            return self._pixmap(entry)
+        if role == Qt.UserRole:
+            return entry
+        return None
+
+    def _pixmap(self, entry):
+        pixmap = self._pixmaps.get(entry['id'])
+        if pixmap is not None:
+            self._pixmaps.move_to_end(entry['id'])
+            return pixmap
+        data = self.store.thumbnail(entry)
+        if not data:
+            return None
+        pixmap = QPixmap()
+        pixmap.loadFromData(data, 'JPG')
+        self._pixmaps[entry['id']] = pixmap
+        if len(self._pixmaps) > KEEP_PIXMAPS:
+            self._pixmaps.popitem(last=False)
+        return pixmap
+
+
+class HistoryPage(QWidget):
+    """Past analyses, newest first, with today's calories and this week's most eaten dishes."""
+
+    def __init__(self, store, parent=None):
+        super().__init__(parent)
+        self.store = store
+        layout = QVBoxLayout()
+        title = QLabel("History")
+        title.setAlignment(Qt.AlignCenter)
+        title.setStyleSheet("font-size: 22px; color: #273c75;")
+        layout.addWidget(title)
+        self.summary_label = QLabel("")
+        self.summary_label.setWordWrap(True)
+        layout.addWidget(self.summary_label)
+
+        self.model = HistoryModel(store, self)
+        # A one-column table rather than a QListView: with fixed row heights it only
+        # ever touches the visible rows, while a list view lays out every row
+        self.view = QTableView()
+        self.view.horizontalHeader().hide()
+        self.view.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
+        self.view.verticalHeader().hide()
+        self.view.verticalHeader().setSectionResizeMode(QHeaderView.Fixed)
+        self.view.verticalHeader().setDefaultSectionSize(ROW_HEIGHT)
+        self.view.setShowGrid(False)
+        self.view.setWordWrap(False)
+        self.view.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.view.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.view.setIconSize(QSize(64, 48))
+        self.view.setModel(self.model)
+        self.view.doubleClicked.connect(self._show_entry)
+        layout.addWidget(self.view, stretch=1)
+
+        self.back_btn = QPushButton("⬅️ Back")
+        layout.addWidget(self.back_btn)
+        self.setLayout(layout)
+
+    def refresh(self):
+        t0 = time.perf_counter()
+        self.model.reload()
+        calories, dishes = self.store.today_calories()
+        top = self.store.top_dishes_this_week()
+        top_text = ", ".join(f"{name} ×{times}" for name, times, _ in top) or "nothing yet"
+        self.summary_label.setText(
+            f"<b>Today:</b> {calories:.0f} kcal from {dishes} dish{'es' if dishes != 1 else ''}<br>"
+            f"<b>Most eaten this week:</b> {top_text}")
+        print(f"[history] {self.model.rowCount()} entries loaded in {(time.perf_counter() - t0) * 1000:.0f} ms.")
+
+    def showEvent(self, event):
+        self.refresh()
+        super().showEvent(event)
+
+    def _show_entry(self, index):
+        entry = self.model.data(index, Qt.UserRole)
+        if entry is not None:
+            from ui.ulam_pages import show_result_dialog
+            show_result_dialog(self, json.loads(entry['result']))
@@ -0,0 +1,88 @@
+import functools
+import time
+
+from PyQt5.QtCore import QObject, pyqtSignal
+
+from ulamlens.analysis import analyze_upload
+from ulamlens.engine import AnalysisEngine, AnalysisQueue
+from ulamlens.history import default_history
+from ulamlens.offline import OfflineDrainer
+
+
+class AnalysisJobs(QObject):
+    """Qt front end of an ``AnalysisQueue``.
+
+    Pages call ``submit`` and get a job id back immediately; progress and
+    results arrive through signals, which Qt delivers on the GUI thread.
+    Cancelled jobs never emit ``job_finished``.
+
+    Photos that could not be sent because the backend was unreachable are
+    kept in the engine's offline queue. Their results go into the history
+    and the result cache whichever page is showing, and are announced
+    through ``offline_result``, possibly after a restart.
+    """
+    # (job id, field name, value) while the answer streams in
+    field_ready = pyqtSignal(str, str, object)
+    # (job id, result dict)
+    job_finished = pyqtSignal(str, dict)
+    # (offline queue job id, result dict, time the photo was taken) for a photo queued while offline
+    offline_result = pyqtSignal(int, dict, float)
+
+    def __init__(self, queue, parent=None, drainer=None):
+        super().__init__(parent)
+        self.queue = queue
+        self.drainer = drainer
+
+    @classmethod
+    def from_env(cls, api_key=None, client=None, parent=None):
+        engine = AnalysisEngine.from_env(api_key, client=client, offline=True)
+        jobs = cls(AnalysisQueue.from_env(engine), parent)
+        if engine.offline is not None:
+            analyze = functools.partial(_analyze_queued, api_key=api_key, client=client)
+            jobs.drainer = OfflineDrainer.from_env(engine.offline, analyze, jobs._deliver_offline).start()
+        return jobs
+
+    @property
+    def engine(self):
+        return self.queue.engine
+
+    def submit(self, image, image_hash=None):
+        job = self.queue.submit(
+            image,
+            image_hash=image_hash,
+            on_field=lambda job, key, value: self.field_ready.emit(job.id, key, value),
+            on_done=self._on_done,
+        )
+        return job.id
+
+    def _on_done(self, job, result):
+        if result.get('queued') is not None and self.drainer is not None:
+            self.drainer.kick()
+        self.job_finished.emit(job.id, result)
+
+    def _deliver_offline(self, job_id, result, meta):
+        # Called on a drainer thread; answers go into the result cache and the history like live ones
+        taken_at = meta.get('taken_at') or time.time()
+        cache = self.engine.cache
+        if 'error' not in result and cache is not None and meta.get('image_hash') is not None:
+            cache.put(meta['image_hash'], result)
+        history = default_history()
+        if history is not None:
+            try:
+                history.add(result, latency_s=time.time() - taken_at, ts=taken_at)
+            except Exception as e:
+                print(f"[history] Could not record result: {e}")
+        self.offline_result.emit(job_id, result, taken_at)
+
+    def cancel(self, job_id, reason='cancelled'):
+        if job_id is not None:
+            self.queue.cancel(job_id, reason)
+
+    def shutdown(self):
+        if self.drainer is not None:
+            self.drainer.stop()
+        self.queue.shutdown()
+
+
+def _analyze_queued(upload_bytes, mime, cancel, api_key=None, client=None):
+    return analyze_upload(upload_bytes, mime, api_key, cancel=cancel, backend=client)
@@ -1,6 +1,7 @@
-from PyQt5.QtWidgets import QMainWindow, QWidget, QVBoxLayout, QPushButton, QLabel
-from PyQt5.QtCore import Qt
-from ui.ulam_pages import TakePicturePage, UploadPicturePage
+import time
+from PyQt5.QtWidgets import QApplication, QMainWindow, QStackedWidget, QWidget, QVBoxLayout, QPushButton, QLabel
+from PyQt5.QtCore import Qt, QEvent, QTimer
+from ulamlens.client import BackendClient
 
 class MainWindow(QMainWindow):
     def __init__(self):
@@ -8,12 +9,38 @@ class MainWindow(QMainWindow):
         self.setWindowTitle("UlamLens")
         self.setGeometry(100, 100, 800, 600)
 
+        # One pooled backend client for the whole app, so connections survive page changes
+        self.backend_client = BackendClient.from_env()
+        if self.backend_client.warm_up_on_start and self.backend_client.api_key:
+            self.backend_client.warm_up()
+        # Opened on the first visit to the camera page, then kept for the app's lifetime
+        self.camera_service = None
+        # Analysis job queue shared by the pages; created once the menu is on screen, because it
+        # also delivers photos queued offline in an earlier session, whichever page is opened
+        self.analysis_jobs = None
+        self._jobs_scheduled = False
+        self.take_picture_page = None
+        self.upload_picture_page = None
+        self.history_page = None
+        self._shut_down = False
+
+        # Pages are built once and switched, not rebuilt on every navigation
+        self.stack = QStackedWidget(self)
+        self.setCentralWidget(self.stack)
+        self.main_menu = self._build_main_menu()
+        self.stack.addWidget(self.main_menu)
+        app = QApplication.instance()
+        if app is not None:
+            app.aboutToQuit.connect(self.shutdown)
+
         self.show_main_menu()
 
     def show_main_menu(self):
+        self.stack.setCurrentWidget(self.main_menu)
+
+    def _build_main_menu(self):
         # Central widget and layout
         central_widget = QWidget(self)
-        self.setCentralWidget(central_widget)
         layout = QVBoxLayout()
         layout.setSpacing(30)
         layout.setContentsMargins(80, 60, 80, 60)
@@ -70,15 +97,113 @@ class MainWindow(QMainWindow):
         layout.addWidget(self.upload_picture_btn)
         self.upload_picture_btn.clicked.connect(self.show_upload_picture_page)
 
+        # Button: History of past analyses
+        self.history_btn = QPushButton("📜 History", self)
+        self.history_btn.setStyleSheet('''
+            QPushButton {
+                background-color: #4cd137;
+                color: white;
+                font-size: 20px;
+                border-radius: 12px;
+                padding: 18px 0;
+                margin-bottom: 10px;
+            }
+            QPushButton:hover {
+                background-color: #44bd32;
+            }
+        ''')
+        layout.addWidget(self.history_btn)
+        self.history_btn.clicked.connect(self.show_history_page)
+
         # Add stretch to center the buttons
         layout.addStretch()
+        return central_widget
+
+    def shutdown(self):
+        """Abort running analyses and release the camera and backend connections; safe to call more than once."""
+        if self._shut_down:
+            return
+        self._shut_down = True
+        if self.take_picture_page is not None:
+            self.take_picture_page._set_analysis_cancelled()
+            self.take_picture_page.stop_camera()
+        if self.upload_picture_page is not None:
+            self.upload_picture_page.stop_batch()
+        if self.analysis_jobs is not None:
+            self.analysis_jobs.shutdown()
+        if self.camera_service is not None:
+            self.camera_service.close()
+        self.backend_client.close()
+
+    def closeEvent(self, event):
+        self.shutdown()
+        super().closeEvent(event)
+
+    def event(self, event):
+        if event.type() == QEvent.Paint and not self._jobs_scheduled:
+            # After the first paint, so importing the analysis modules does not delay the menu
+            self._jobs_scheduled = True
+            QTimer.singleShot(0, self.ensure_analysis_jobs)
+        return super().event(event)
+
+    def ensure_analysis_jobs(self):
+        """Shared ``AnalysisJobs`` (and its offline drainer), created on first use."""
+        if self.analysis_jobs is None and not self._shut_down:
+            from ui.jobs import AnalysisJobs
+            self.analysis_jobs = AnalysisJobs.from_env(self.backend_client.api_key, client=self.backend_client,
+                                                       parent=self)
+            self.analysis_jobs.offline_result.connect(self._on_offline_result)
+        return self.analysis_jobs
+
+    def _on_offline_result(self, queue_id, result_json, taken_at):
+        # Already in the history and cache; just say so without interrupting the current page
+        name = result_json.get('ulam_name')
+        print(f"[offline] Result for queued photo {queue_id}: {name or result_json.get('error')}")
+        when = time.strftime('%H:%M', time.localtime(taken_at))
+        self.statusBar().showMessage(
+            f"Photo taken offline at {when}: {name}" if name else f"Photo taken offline at {when} could not be analysed",
+            10000)
+        if self.history_page is not None and self.stack.currentWidget() is self.history_page:
+            self.history_page.refresh()
+
+    def changeEvent(self, event):
+        # Minimising does not hide child widgets, so tell the page to pause its preview
+        if event.type() == QEvent.WindowStateChange:
+            page = self.stack.currentWidget()
+            if hasattr(page, 'set_preview_paused'):
+                page.set_preview_paused(self.isMinimized() or not page.isVisible())
+        super().changeEvent(event)
 
     def show_take_picture_page(self):
-        self.take_picture_page = TakePicturePage(self)
-        self.setCentralWidget(self.take_picture_page)
-        self.take_picture_page.back_btn.clicked.connect(self.show_main_menu)
+        # Imported on demand: the pages pull in cv2 and the analysis backends
+        if self.take_picture_page is None:
+            from ui.camera import CameraService
+            from ui.ulam_pages import TakePicturePage
+            self.camera_service = CameraService.from_env(0)
+            self.take_picture_page = TakePicturePage(self, backend=self.backend_client, camera=self.camera_service,
+                                                     jobs=self.ensure_analysis_jobs())
+            self.take_picture_page.back_btn.clicked.connect(self.show_main_menu)
+            self.stack.addWidget(self.take_picture_page)
+        self.stack.setCurrentWidget(self.take_picture_page)
 
     def show_upload_picture_page(self):
-        self.upload_picture_page = UploadPicturePage(self)
-        self.setCentralWidget(self.upload_picture_page)
-        self.upload_picture_page.back_btn.clicked.connect(self.show_main_menu)
+        if self.upload_picture_page is None:
+            from ui.ulam_pages import UploadPicturePage
+            self.upload_picture_page = UploadPicturePage(self, backend=self.backend_client)
+            self.upload_picture_page.back_btn.clicked.connect(self.show_main_menu)
+            self.stack.addWidget(self.upload_picture_page)
+        self.stack.setCurrentWidget(self.upload_picture_page)
+
+    def show_history_page(self):
+        if self.history_page is None:
+            from ulamlens.history import default_history
+            store = default_history()
+            if store is None:
+                from PyQt5.QtWidgets import QMessageBox
+                QMessageBox.information(self, "History", "History is turned off (ULAMLENS_HISTORY=0).")
+                return
+            from ui.history import HistoryPage
+            self.history_page = HistoryPage(store, self)
+            self.history_page.back_btn.clicked.connect(self.show_main_menu)
+            self.stack.addWidget(self.history_page)
+        self.stack.setCurrentWidget(self.history_page)
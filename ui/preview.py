@@ -0,0 +1,120 @@
+import cv2
+import numpy as np
+from PyQt5.QtGui import QImage, QPixmap
+
+# Qt >= 5.14 can display BGR data directly; older builds need a (small) swap
+HAS_BGR888 = hasattr(QImage, 'Format_BGR888')
+
+
+class PreviewRenderer:
+    """Turns camera frames into label-sized pixmaps with as few full-frame passes as possible.
+
+    The frame is downscaled first with ``cv2.resize`` into a buffer that is
+    reused across frames, then wrapped as a BGR ``QImage`` without copying or
+    colour-converting the pixels. Only the small, already-scaled image is
+    uploaded into the ``QPixmap``.
+    """
+
+    def __init__(self, interpolation=cv2.INTER_LINEAR):
+        self.interpolation = interpolation
+        self._buf = None
+        self._rgb_buf = None
+
+    def _target_size(self, frame, max_w, max_h):
+        h, w = frame.shape[:2]
+        if max_w <= 0 or max_h <= 0:
+            return w, h
+        scale = min(max_w / w, max_h / h)
+        return max(1, int(w * scale)), max(1, int(h * scale))
+
+    def _buffer(self, attr, w, h):
+        buf = getattr(self, attr)
+        if buf is None or buf.shape[0] != h or buf.shape[1] != w:
+            # Only reallocate when the label is resized
+            buf = np.empty((h, w, 3), dtype=np.uint8)
+            setattr(self, attr, buf)
+        return buf
+
+    def to_qimage(self, frame, max_w, max_h):
+        """Scale ``frame`` (BGR) to fit ``max_w`` x ``max_h``; the QImage is a view of the reused buffer."""
+        tw, th = self._target_size(frame, max_w, max_h)
+        buf = self._buffer('_buf', tw, th)
+        cv2.resize(frame, (tw, th), dst=buf, interpolation=self.interpolation)
+        if HAS_BGR888:
+            return QImage(buf.data, tw, th, buf.strides[0], QImage.Format_BGR888)
+        rgb = self._buffer('_rgb_buf', tw, th)
+        cv2.cvtColor(buf, cv2.COLOR_BGR2RGB, dst=rgb)
+        return QImage(rgb.data, tw, th, rgb.strides[0], QImage.Format_RGB888)
+
+    def render(self, frame, max_w, max_h):
+        """Return a QPixmap of ``frame`` fitted to ``max_w`` x ``max_h`` (aspect ratio kept)."""
+        # QPixmap.fromImage copies the pixels, so the buffer can be reused on the next frame
+        return QPixmap.fromImage(self.to_qimage(frame, max_w, max_h))
+
+
+class FrameRateGovernor:
+    """Picks the preview timer interval from what rendering actually costs.
+
+    Every displayed frame reports how long grabbing, converting and painting
+    took. The interval is kept at ``ui_share`` of the UI thread at most (a
+    10 ms render with ``ui_share=0.5`` means one frame every 20 ms), is never
+    shorter than the camera's own frame period, and stays within
+    ``[min_interval_ms, max_interval_ms]``.
+    """
+
+    def __init__(self, min_interval_ms=15, max_interval_ms=200, ui_share=0.5, smoothing=0.2):
+        self.min_interval_ms = min_interval_ms
+        self.max_interval_ms = max(min_interval_ms, max_interval_ms)
+        self.ui_share = ui_share
+        self.smoothing = smoothing
+        self.reset()
+
+    def reset(self):
+        self.interval_ms = self.min_interval_ms
+        self.cost_ms = 0.0
+        self.source_period_ms = 0.0
+        self.dropped = 0
+        self.frames = 0
+        self._fps = 0.0
+        self._last_id = None
+        self._last_time = None
+
+    def resume(self):
+        """Forget the last frame after a pause so the gap is not counted as drops."""
+        self._last_id = None
+        self._last_time = None
+
+    def _ema(self, old, new):
+        return new if old == 0.0 else old + self.smoothing * (new - old)
+
+    def record(self, frame_id, grab_s, convert_s, paint_s, now):
+        """Account for one displayed frame and return the new interval in milliseconds."""
+        self.frames += 1
+        self.cost_ms = self._ema(self.cost_ms, (grab_s + convert_s + paint_s) * 1000)
+        if self._last_id is not None and frame_id > self._last_id:
+            # Frames the camera delivered that were never shown
+            self.dropped += frame_id - self._last_id - 1
+            dt_ms = (now - self._last_time) * 1000
+            self._fps = self._ema(self._fps, 1000 / dt_ms if dt_ms > 0 else 0.0)
+            self.source_period_ms = self._ema(self.source_period_ms, dt_ms / (frame_id - self._last_id))
+        self._last_id = frame_id
+        self._last_time = now
+
+        target = max(self.cost_ms / self.ui_share, self.source_period_ms)
+        self.interval_ms = int(min(self.max_interval_ms, max(self.min_interval_ms, target)))
+        return self.interval_ms
+
+    @property
+    def fps(self):
+        """Smoothed rate of frames actually shown."""
+        return self._fps
+
+    def stats(self):
+        return {
+            "fps": round(self._fps, 1),
+            "interval_ms": self.interval_ms,
+            "render_cost_ms": round(self.cost_ms, 2),
+            "source_period_ms": round(self.source_period_ms, 2),
+            "frames": self.frames,
+            "dropped": self.dropped,
+        }
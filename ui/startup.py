@@ -0,0 +1,70 @@
+import threading
+import time
+from PyQt5.QtCore import QObject, QEvent
+
+from ulamlens.config import env_bool
+
+
+class StartupTimer(QObject):
+    """Records cold-start phases and, with ULAMLENS_STARTUP_TIMING=1, prints them.
+
+    Phases are measured from ``t0`` (taken at the very top of main.py). The
+    first paint of the main window is detected with an event filter, after
+    which heavy modules are imported on a background thread.
+    """
+
+    def __init__(self, t0, enabled=None):
+        super().__init__()
+        self.t0 = t0
+        self.enabled = env_bool('ULAMLENS_STARTUP_TIMING', False) if enabled is None else enabled
+        self.phases = []
+        self._last = t0
+        self._painted = False
+        self._lock = threading.Lock()
+
+    def mark(self, name):
+        now = time.perf_counter()
+        with self._lock:
+            delta = now - self._last
+            self.phases.append((name, delta, now - self.t0))
+            self._last = now
+        if self.enabled:
+            print(f"[startup] {name}: {delta * 1000:.0f} ms (total {(now - self.t0) * 1000:.0f} ms)")
+
+    def watch_first_paint(self, window, on_first_paint=None):
+        self._window = window
+        self._on_first_paint = on_first_paint
+        window.installEventFilter(self)
+
+    def eventFilter(self, obj, event):
+        if not self._painted and event.type() == QEvent.Paint:
+            self._painted = True
+            obj.removeEventFilter(self)
+            self.mark('time to first paint')
+            if self._on_first_paint is not None:
+                self._on_first_paint()
+        return False
+
+    def report(self):
+        """Phases as ``[(name, phase_ms, total_ms), ...]``."""
+        with self._lock:
+            return [(name, round(d * 1000, 1), round(t * 1000, 1)) for name, d, t in self.phases]
+
+
+def warm_heavy_imports(timer=None):
+    """Import cv2, the camera page and the backend SDKs off the GUI thread."""
+    def run():
+        t0 = time.perf_counter()
+        try:
+            import ui.ulam_pages  # noqa: F401  (pulls in cv2 and the analysis modules)
+            from ulamlens.client import warm_imports
+            warm_imports()
+        except Exception as e:
+            print(f"[startup] Background import failed: {e}")
+            return
+        if timer is not None and timer.enabled:
+            print(f"[startup] background imports: {(time.perf_counter() - t0) * 1000:.0f} ms (off the GUI thread)")
+
+    thread = threading.Thread(target=run, daemon=True, name='ulamlens-warm-imports')
+    thread.start()
+    return thread
@@ -1,36 +1,105 @@
 import os
-import os
 import cv2
-try:
-    import openai
-except Exception:
-    openai = None
-    print('[init] openai package not available; analysis calls will be disabled or use fallback.')
-try:
-    import requests
-except Exception:
-    requests = None
-    print('[init] requests package not available; HTTP fallback disabled.')
-import tempfile
-import json
-import base64
 import threading
-from PyQt5.QtCore import Qt, QTimer
-from PyQt5.QtCore import pyqtSignal
-from PyQt5.QtWidgets import QWidget, QVBoxLayout, QLabel, QPushButton, QHBoxLayout, QApplication, QMessageBox, QTextEdit, QDialog, QDialogButtonBox, QStackedLayout, QSizePolicy, QSpacerItem
-from PyQt5.QtCore import Qt, QTimer
-from PyQt5.QtGui import QImage, QPixmap
+import time
+from PyQt5.QtCore import Qt, QTimer, pyqtSignal
+from PyQt5.QtWidgets import QWidget, QVBoxLayout, QLabel, QPushButton, QHBoxLayout, QApplication, QMessageBox, QTextEdit, QDialog, QDialogButtonBox, QStackedLayout, QSizePolicy, QSpacerItem, QFileDialog, QListWidget, QListWidgetItem, QSpinBox
+from ui.camera import CameraService
+from ulamlens.analysis import NO_KEY_RESULT
+from ulamlens.client import BackendClient
+from ulamlens.batch import BatchRunner, configured_workers, list_images
+from ulamlens.cancel import CancelToken
+from ulamlens.engine import AnalysisEngine
+from ulamlens.history import default_history
+from ulamlens.config import env_bool, env_float, env_int
+from ulamlens.metrics import metrics
+from ulamlens.motion import MotionDetector
+from ulamlens.quality import QualityGate
+from ui.jobs import AnalysisJobs
+from ui.preview import PreviewRenderer, FrameRateGovernor
+
+def result_html(result_json, pending='?'):
+    """HTML for a (possibly still incomplete) result; missing fields show ``pending``."""
+    ulam = result_json.get('ulam_name', 'Unknown' if pending == '?' else pending)
+    if result_json.get('source') == 'local':
+        ulam += f" <small>(on-device, {result_json.get('confidence', 0):.0%} sure)</small>"
+    macros = result_json.get('macros', {})
+    facts = result_json.get('health_facts', '' if pending == '?' else pending)
+    warnings = result_json.get('warnings', '' if pending == '?' else pending)
+    return f"""
+        <h2>{ulam}</h2>
+        <h3>Macros{f" <small>(per {result_json['serving']})</small>" if result_json.get('serving') else ""}</h3>
+        <ul>
+            <li><b>Calories:</b> {macros.get('calories', pending)}</li>
+            <li><b>Protein:</b> {macros.get('protein_g', pending)} g</li>
+            <li><b>Carbs:</b> {macros.get('carbs_g', pending)} g</li>
+            <li><b>Fat:</b> {macros.get('fat_g', pending)} g</li>
+        </ul>
+        <h3>Health Facts</h3>
+        <p>{facts}</p>
+        <h3>Warnings</h3>
+        <p style='color:#e84118'>{warnings}</p>
+        """
+
+def show_result_dialog(parent, result_json, auto_close_s=None, title="Ulam Analysis Result"):
+    """Modal dialog with an analysis result (or its error); closes itself after ``auto_close_s`` if given."""
+    dlg = QDialog(parent)
+    dlg.setWindowTitle(title)
+    dlg.setMinimumWidth(400)
+    layout = QVBoxLayout()
+    dlg.setLayout(layout)
+
+    if 'error' in result_json:
+        label = QLabel(f"<b>Error:</b> {result_json['error']}")
+        layout.addWidget(label)
+        if 'raw' in result_json:
+            text = QTextEdit()
+            text.setReadOnly(True)
+            text.setText(result_json['raw'])
+            layout.addWidget(text)
+    else:
+        # Pretty display
+        label = QLabel(result_html(result_json))
+        label.setWordWrap(True)
+        layout.addWidget(label)
+
+    buttons = QDialogButtonBox(QDialogButtonBox.Ok)
+    buttons.accepted.connect(dlg.accept)
+    layout.addWidget(buttons)
+    if auto_close_s:
+        QTimer.singleShot(int(auto_close_s * 1000), dlg.accept)
+    dlg.exec_()
+
 
 class TakePicturePage(QWidget):
     analysis_finished = pyqtSignal(dict)
 
-    def __init__(self, parent=None):
+    def __init__(self, parent=None, backend=None, camera=None, jobs=None):
         super().__init__(parent)
         self.captured_image = None
         self.camera_active = True
-        self._analysis_cancelled = False
+        # Blurry, dark or empty frames are caught before they cost a model call
+        self.quality_gate = QualityGate.from_env()
+        self.capture_report = None
+        self._capture_tries = 0
+        # Hands-free mode: a plate that enters the frame and settles is captured and analysed
+        self.motion = MotionDetector.from_env()
+        self.auto_mode = False
+        self._auto_pending = False
+        self.auto_result_s = env_float('ULAMLENS_AUTO_RESULT_S', 8.0)
         # OpenAI API key: prefer environment variable, fall back to None
         self.openai_api_key = os.environ.get('OPENAI_API_KEY')
+        # Pooled connections are owned by the application; a page-local client is only a fallback
+        self.backend = backend or BackendClient.from_env(self.openai_api_key)
+        # Analyses run on the shared job queue; only the newest job of this page is shown
+        self.jobs = jobs or AnalysisJobs.from_env(self.openai_api_key, client=self.backend, parent=self)
+        self._job_id = None
+        self._loading = None
+        self._clicked_at = None
+        # Every answer shown here is also kept in the local history (None when turned off)
+        self.history = default_history()
+        self.jobs.field_ready.connect(self._show_field)
+        self.jobs.job_finished.connect(self._on_job_finished)
 
         # Initialize UI; if init_ui is missing for any reason, create a minimal fallback UI
         try:
@@ -38,10 +107,24 @@ class TakePicturePage(QWidget):
         except Exception as e:
             print(f"[init_ui] init_ui failed: {e}. Creating fallback UI.")
             self._init_ui_fallback()
-        self.cap = cv2.VideoCapture(0)
+        # Camera is read on a background thread; the timer only picks up the newest frame.
+        # The camera is normally shared by the whole application and outlives this page.
+        self._owns_camera = camera is None
+        self.camera = camera or CameraService.from_env(0)
+        if env_bool('ULAMLENS_AUTO_CAPTURE', False):
+            self.set_auto_mode(True)
+        self._camera_held = False
+        self.renderer = PreviewRenderer()
+        # Preview interval adapts to measured render cost within these bounds
+        min_ms = max(1, env_int('ULAMLENS_PREVIEW_MIN_MS', 15))
+        self.governor = FrameRateGovernor(
+            min_interval_ms=min_ms,
+            max_interval_ms=max(min_ms, env_int('ULAMLENS_PREVIEW_MAX_MS', 200)),
+        )
+        self._preview_paused = False
         self.timer = QTimer(self)
         self.timer.timeout.connect(self.update_frame)
-        self.timer.start(30)
+        self._sync_preview()
 
         # Ensure the analysis result signal is handled on the UI thread
         try:
@@ -52,55 +135,33 @@ class TakePicturePage(QWidget):
 
         # (moved analyze_btn connection to end of init_ui)
     def analyze_ulam(self):
-        """Start analysis in a background thread with a cancellable dialog."""
+        """Submit the captured image to the analysis queue and show a cancellable dialog."""
         print("[Analyze] Button clicked.")
         if self.captured_image is None:
             print("[Analyze] No image captured.")
             QMessageBox.warning(self, "No Image", "Please capture an image first.")
             return
+        report = self.capture_report or self.quality_gate.assess(self.captured_image)
+        if not report.ok and not self._confirm_poor_photo(report):
+            return
 
-        # Reset cancel flag for this run
-        self._analysis_cancelled = False
+        # An older analysis still in flight is superseded
+        self._clicked_at = time.perf_counter()
+        self.jobs.cancel(self._job_id, 'superseded')
+        self._job_id = None
 
-        # If API key missing, show N/A result immediately
-        if not self.openai_api_key:
-            print("[Analyze] No OpenAI API key set. Showing N/A result.")
-            result_json = {
-                "ulam_name": "N/A",
-                "macros": {"calories": "N/A", "protein_g": "N/A", "carbs_g": "N/A", "fat_g": "N/A"},
-                "health_facts": "N/A",
-                "warnings": "N/A",
-                "error": "OpenAI API key is not set. Please configure your API key to enable analysis."
-            }
-            # emit via signal to unify UI thread handling
-            try:
-                self.analysis_finished.emit(result_json)
-            except Exception:
-                self.show_analysis_result(result_json)
+        # A near-duplicate photo of something already analysed is answered from the local cache
+        cached, image_hash = self.jobs.engine.lookup(self.captured_image)
+        if cached is not None:
+            metrics.observe('click_to_result_seconds', time.perf_counter() - self._clicked_at)
+            self.analysis_finished.emit(cached)
             return
 
-        # Save image to temp file
-        with tempfile.NamedTemporaryFile(suffix='.jpg', delete=False) as tmp:
-            img_path = tmp.name
-            cv2.imwrite(img_path, self.captured_image)
-        print(f"[Analyze] Image saved to {img_path}")
-
-        prompt = (
-            "You are a nutrition and Filipino food expert. "
-            "Given a photo of a Filipino viand (ulam), guess what ulam it is and return a JSON with the following structure: "
-            '{\n'
-            '  "ulam_name": string,\n'
-            '  "macros": {\n'
-            '    "calories": int,\n'
-            '    "protein_g": float,\n'
-            '    "carbs_g": float,\n'
-            '    "fat_g": float\n'
-            '  },\n'
-            '  "health_facts": string,\n'
-            '  "warnings": string\n'
-            '}\n'
-            "If you are unsure, make your best guess."
-        )
+        # Without an API key or a local model, show N/A result immediately
+        if not self.jobs.engine.available():
+            print("[Analyze] No OpenAI API key set. Showing N/A result.")
+            self.analysis_finished.emit(dict(NO_KEY_RESULT))
+            return
 
         # Create cancellable loading dialog
         loading = QDialog(self)
@@ -110,233 +171,105 @@ class TakePicturePage(QWidget):
         msg = QLabel("Analyzing the captured image. Please wait...")
         msg.setAlignment(Qt.AlignCenter)
         dlg_layout.addWidget(msg)
+        # Filled in field by field while the answer streams in
+        self._partial_result = {}
+        self._partial_label = QLabel("")
+        self._partial_label.setWordWrap(True)
+        self._partial_label.setMinimumWidth(400)
+        self._partial_label.hide()
+        dlg_layout.addWidget(self._partial_label)
         cancel_btn = QPushButton("Cancel")
-        cancel_btn.clicked.connect(lambda: self._set_analysis_cancelled(loading))
+        cancel_btn.clicked.connect(lambda: self._set_analysis_cancelled())
         btn_row = QHBoxLayout()
         btn_row.addStretch()
         btn_row.addWidget(cancel_btn)
         btn_row.addStretch()
         dlg_layout.addLayout(btn_row)
+        self._loading = loading
         loading.show()
-        QApplication.processEvents()
 
-        def run_analysis():
-            result_json = {}
-            try:
-                if self._analysis_cancelled:
-                    result_json = {"error": "Analysis cancelled by user."}
-                    return
-                openai.api_key = self.openai_api_key
-
-                with open(img_path, "rb") as f:
-                    image_bytes = f.read()
-                b64 = base64.b64encode(image_bytes).decode('ascii')
-                print(f"[Analyze] Image bytes length: {len(image_bytes)}")
-
-                # Prefer new OpenAI client (openai.OpenAI) if available
-                if openai is None:
-                    result_json = {"error": "openai package not installed. Install 'openai' to enable analysis."}
-                    raw_text = ''
-                elif hasattr(openai, "OpenAI"):
-                    client = openai.OpenAI(api_key=self.openai_api_key)
-                    # Try vision-capable model first; if unavailable, fall back to text-only models
-                    tried_models = []
-                    raw_text = None
-                    vision_models = ["gpt-4-vision-preview"]
-                    text_fallback_models = ["gpt-4", "gpt-3.5-turbo"]
-                    # Attempt vision models
-                    for mname in vision_models:
-                        tried_models.append(mname)
-                        try:
-                            resp = client.responses.create(
-                                model=mname,
-                                input=[
-                                    {"role": "user", "content": [
-                                        {"type": "input_text", "text": prompt},
-                                        {"type": "input_image", "image_url": f"data:image/jpeg;base64,{b64}"}
-                                    ]}
-                                ],
-                                max_output_tokens=500
-                            )
-                            raw_text = getattr(resp, 'output_text', None)
-                            if not raw_text:
-                                parts = []
-                                for item in getattr(resp, 'output', []):
-                                    for c in item.get('content', []):
-                                        txt = c.get('text') or c.get('title') or ''
-                                        if txt:
-                                            parts.append(txt)
-                                raw_text = "\n".join(parts)
-                            print(f"[Analyze] Raw response (new API, {mname}): {raw_text}")
-                            break
-                        except Exception as err:
-                            err_str = str(err)
-                            print(f"[Analyze] Model {mname} failed: {err_str}")
-                            # If model doesn't exist, continue to text-only fallback
-                            continue
-
-                    # If no vision result, try text-only models (image will be omitted; results will be guesses)
-                    if not raw_text:
-                        # Try direct HTTP multipart/form-data upload as a last resort
-                        if requests is not None:
-                            endpoint = os.environ.get('OPENAI_IMAGE_ENDPOINT', 'https://api.openai.com/v1/responses')
-                            model_for_request = 'gpt-4-vision-preview'
-                            headers = {"Authorization": f"Bearer {self.openai_api_key}"}
-                            try:
-                                with open(img_path, 'rb') as imgf:
-                                    files = {"image": (os.path.basename(img_path), imgf, "image/jpeg")}
-                                    data = {"model": model_for_request, "input": prompt}
-                                    print(f"[Analyze] Attempting HTTP POST to {endpoint} with model {model_for_request}")
-                                    resp = requests.post(endpoint, headers=headers, files=files, data=data, timeout=60)
-                                if resp.status_code == 200:
-                                    try:
-                                        rj = resp.json()
-                                    except Exception:
-                                        rj = {}
-                                    # Try common response fields
-                                    raw_text = rj.get('output_text') or rj.get('text') or ''
-                                    if not raw_text:
-                                        out = rj.get('output') or rj.get('choices') or []
-                                        parts = []
-                                        for item in out:
-                                            if isinstance(item, dict):
-                                                # responses API
-                                                for c in item.get('content', []):
-                                                    txt = c.get('text') or c.get('title') or ''
-                                                    if txt:
-                                                        parts.append(txt)
-                                            elif isinstance(item, str):
-                                                parts.append(item)
-                                        raw_text = "\n".join(parts)
-                                    print(f"[Analyze] Raw response (http fallback): {raw_text}")
-                                else:
-                                    print(f"[Analyze] HTTP fallback returned {resp.status_code}: {resp.text}")
-                            except Exception as err:
-                                print(f"[Analyze] HTTP fallback failed: {err}")
-                        else:
-                            print('[Analyze] requests not available; skipping HTTP fallback')
-                        for mname in text_fallback_models:
-                            tried_models.append(mname)
-                            try:
-                                resp = client.responses.create(
-                                    model=mname,
-                                    input=prompt + "\n\nNOTE: The image could not be attached; provide your best-guess JSON based on common Filipino ulam. Mark values as 'estimate' where unsure.",
-                                    max_output_tokens=500
-                                )
-                                raw_text = getattr(resp, 'output_text', None)
-                                if not raw_text:
-                                    parts = []
-                                    for item in getattr(resp, 'output', []):
-                                        for c in item.get('content', []):
-                                            txt = c.get('text') or c.get('title') or ''
-                                            if txt:
-                                                parts.append(txt)
-                                    raw_text = "\n".join(parts)
-                                print(f"[Analyze] Raw response (new API fallback, {mname}): {raw_text}")
-                                break
-                            except Exception as err:
-                                print(f"[Analyze] Text model {mname} failed: {err}")
-                                continue
-                    if not raw_text:
-                        raw_text = ""
-                else:
-                    # Legacy fallback using ChatCompletion (may not support images)
-                    try:
-                        response = openai.ChatCompletion.create(
-                            model="gpt-3.5-turbo",
-                            messages=[
-                                {"role": "system", "content": prompt},
-                                {"role": "user", "content": "Image attachment omitted (vision model unavailable). Please provide best-guess JSON as described."}
-                            ],
-                            max_tokens=500
-                        )
-                        raw_text = response.choices[0].message['content']
-                        print(f"[Analyze] Raw response (legacy fallback): {raw_text}")
-                    except Exception as err:
-                        print(f"[Analyze] Legacy ChatCompletion failed: {err}")
-                        raw_text = ''
-
-                # After obtaining raw_text (from new or legacy API), try to extract JSON
-                try:
-                    json_start = raw_text.find('{')
-                    json_end = raw_text.rfind('}') + 1
-                    json_str = raw_text[json_start:json_end]
-                    result_json = json.loads(json_str)
-                except Exception as ex:
-                    print(f"[Analyze] Failed to parse JSON: {ex}")
-                    result_json = {"error": "Could not parse JSON", "raw": raw_text}
-            except Exception as e:
-                print(f"[Analyze] Exception: {e}")
-                result_json = {"error": str(e)}
-            finally:
-                # close loading dialog in main thread
-                try:
-                    loading.done(0)
-                except Exception:
-                    pass
-                # emit result to main thread
-                try:
-                    self.analysis_finished.emit(result_json)
-                except Exception:
-                    # fallback: call directly
-                    self.show_analysis_result(result_json)
-
-        # run in background
-        thread = threading.Thread(target=run_analysis, daemon=True)
-        thread.start()
+        self._job_id = self.jobs.submit(self.captured_image, image_hash=image_hash)
+
+    def _confirm_poor_photo(self, report):
+        """Ask whether to spend an analysis on a photo that failed the quality gate; False means retake."""
+        print(f"[Analyze] Quality check failed: {report.to_dict()}")
+        answer = QMessageBox.question(
+            self, "Check the photo",
+            f"It looks like {report.message()}. A clearer photo gives a better answer.\n\nAnalyze anyway?",
+            QMessageBox.Yes | QMessageBox.No, QMessageBox.No)
+        if answer == QMessageBox.Yes:
+            metrics.inc('quality_gate_total', result='overridden')
+            return True
+        metrics.inc('quality_gate_total', result='retake')
+        self.retake_picture()
+        return False
 
     def show_analysis_result(self, result_json):
-        dlg = QDialog(self)
-        dlg.setWindowTitle("Ulam Analysis Result")
-        dlg.setMinimumWidth(400)
-        layout = QVBoxLayout()
-        dlg.setLayout(layout)
-
-        if 'error' in result_json:
-            label = QLabel(f"<b>Error:</b> {result_json['error']}")
-            layout.addWidget(label)
-            if 'raw' in result_json:
-                text = QTextEdit()
-                text.setReadOnly(True)
-                text.setText(result_json['raw'])
-                layout.addWidget(text)
-        else:
-            # Pretty display
-            ulam = result_json.get('ulam_name', 'Unknown')
-            macros = result_json.get('macros', {})
-            facts = result_json.get('health_facts', '')
-            warnings = result_json.get('warnings', '')
-            html = f"""
-            <h2>{ulam}</h2>
-            <h3>Macros</h3>
-            <ul>
-                <li><b>Calories:</b> {macros.get('calories', '?')}</li>
-                <li><b>Protein:</b> {macros.get('protein_g', '?')} g</li>
-                <li><b>Carbs:</b> {macros.get('carbs_g', '?')} g</li>
-                <li><b>Fat:</b> {macros.get('fat_g', '?')} g</li>
-            </ul>
-            <h3>Health Facts</h3>
-            <p>{facts}</p>
-            <h3>Warnings</h3>
-            <p style='color:#e84118'>{warnings}</p>
-            """
-            label = QLabel(html)
-            label.setWordWrap(True)
-            layout.addWidget(label)
-
-        buttons = QDialogButtonBox(QDialogButtonBox.Ok)
-        buttons.accepted.connect(dlg.accept)
-        layout.addWidget(buttons)
-        dlg.exec_()
-
-    def _set_analysis_cancelled(self, dlg=None):
-        """Mark analysis as cancelled and close the loading dialog if provided."""
-        self._analysis_cancelled = True
+        latency = time.perf_counter() - self._clicked_at if self._clicked_at is not None else None
+        self._record_history(result_json, self.captured_image, latency)
+        if not self.auto_mode:
+            show_result_dialog(self, result_json)
+            return
+        # Kiosk: show the answer for a while, then go back to watching for the next plate
+        show_result_dialog(self, result_json, auto_close_s=self.auto_result_s)
+        if self.auto_mode and not self.camera_active:
+            self.retake_picture()
+
+    def set_auto_mode(self, enabled):
+        """Turn hands-free capture on or off."""
+        enabled = bool(enabled)
+        button = getattr(self, 'auto_btn', None)
+        if button is not None and button.isChecked() != enabled:
+            button.setChecked(enabled)  # comes back here through the toggled signal
+            return
+        self.auto_mode = enabled
+        self._auto_pending = False
+        self.motion.reset()
+        print(f"[Auto] Hands-free capture {'on' if self.auto_mode else 'off'}.")
+
+    def _auto_capture(self):
+        print(f"[Auto] Plate settled; capturing. {self.motion.stats()}")
+        metrics.inc('auto_captures_total')
+        self._auto_pending = True
+        self.capture_image()
+
+    def _on_job_finished(self, job_id, result_json):
+        # Results of other pages' jobs, or of a superseded job, are not ours to show
+        if job_id != self._job_id:
+            return
+        self._job_id = None
+        self._close_loading()
+        metrics.observe('click_to_result_seconds', time.perf_counter() - self._clicked_at)
+        self.analysis_finished.emit(result_json)
+
+    def _record_history(self, result_json, image=None, latency_s=None, ts=None):
+        if self.history is None:
+            return
         try:
-            if dlg is not None:
-                dlg.done(0)
-        except Exception:
-            pass
+            self.history.add(result_json, image=image, latency_s=latency_s, ts=ts)
+        except Exception as e:
+            print(f"[history] Could not record result: {e}")
+
+    def _show_field(self, job_id, key, value):
+        if job_id != self._job_id:
+            return
+        self._partial_result[key] = value
+        self._partial_label.setText(result_html(self._partial_result, pending='…'))
+        self._partial_label.show()
+
+    def _close_loading(self):
+        if self._loading is not None:
+            try:
+                self._loading.done(0)
+            except Exception:
+                pass
+            self._loading = None
+
+    def _set_analysis_cancelled(self, reason='cancelled'):
+        """Cancel the running analysis (closing its connections) and close the loading dialog."""
+        self.jobs.cancel(self._job_id, reason)
+        self._job_id = None
+        self._close_loading()
 
     def _init_ui_fallback(self):
         """Create a minimal UI if init_ui is unavailable to avoid crashes."""
@@ -451,6 +384,26 @@ class TakePicturePage(QWidget):
         ''')
         self.button_row.addWidget(self.back_btn)
 
+        self.auto_btn = QPushButton("🤖 Auto")
+        self.auto_btn.setCheckable(True)
+        self.auto_btn.setMinimumHeight(60)
+        self.auto_btn.setMinimumWidth(120)
+        self.auto_btn.setToolTip("Capture and analyse automatically when a plate is put down")
+        self.auto_btn.setStyleSheet('''
+            QPushButton {
+                background-color: #353b48;
+                color: white;
+                font-size: 20px;
+                border-radius: 16px;
+                padding: 12px 24px;
+            }
+            QPushButton:checked {
+                background-color: #44bd32;
+            }
+        ''')
+        self.auto_btn.toggled.connect(self.set_auto_mode)
+        self.button_row.addWidget(self.auto_btn)
+
         self.main_layout.addLayout(self.button_row)
 
         # Spacer to push buttons to bottom
@@ -458,37 +411,66 @@ class TakePicturePage(QWidget):
 
     def update_frame(self):
         if self.camera_active:
-            ret, frame = self.cap.read()
-            if ret:
+            t0 = time.perf_counter()
+            frame_id, frame = self.camera.latest(only_new=True)
+            if frame is not None:
+                t1 = time.perf_counter()
                 self.frame = frame
-                rgb_image = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-                h, w, ch = rgb_image.shape
-                bytes_per_line = ch * w
-                qt_image = QImage(rgb_image.data, w, h, bytes_per_line, QImage.Format_RGB888)
-                pixmap = QPixmap.fromImage(qt_image).scaled(self.video_label.width(), self.video_label.height(), Qt.KeepAspectRatio, Qt.SmoothTransformation)
+                pixmap = self.renderer.render(frame, self.video_label.width(), self.video_label.height())
+                t2 = time.perf_counter()
                 self.video_label.setPixmap(pixmap)
+                t3 = time.perf_counter()
+                interval = self.governor.record(frame_id, t1 - t0, t2 - t1, t3 - t2, t3)
+                if interval != self.timer.interval():
+                    self.timer.setInterval(interval)
+                if self.auto_mode and not self._auto_pending and self.motion.update(frame):
+                    self._auto_capture()
                 # Hide loading overlay when first frame is received
                 if self.video_container_layout.currentWidget() == self.loading_label:
                     self.video_container_layout.setCurrentWidget(self.video_label)
 
     def capture_image(self):
+        self._capture_started = time.perf_counter()
+        self._capture_tries = 0
         # Show loading overlay while freezing
         self.video_container_layout.setCurrentWidget(self.loading_label)
         QApplication.processEvents()
-        ret, frame = self.cap.read()
-        if ret:
-            self.captured_image = frame
-            self.camera_active = False
-            self.timer.stop()
-            self.cap.release()
-            self.show_captured_image()
+        self._capture_best()
+
+    def _capture_best(self):
+        # Use the sharpest frame the grabber buffered recently instead of another blocking read()
+        _, frame, _ = self.camera.best()
+        if frame is None or not self.camera_active:
+            self._auto_pending = False
+            return
+        report = self.quality_gate.assess(frame)
+        if not report.ok and self._capture_tries < self.quality_gate.retries:
+            # Give the camera a moment to deliver a steadier, better lit frame
+            self._capture_tries += 1
+            print(f"[Capture] {report.message()}; waiting for a better frame.")
+            QTimer.singleShot(150, self._capture_best)
+            return
+        if self._auto_pending and not report.ok:
+            # Unattended: never send a poor photo; wait for the plate to settle again
+            print(f"[Auto] Skipping capture: {report.message()}.")
+            self._auto_pending = False
+            self.motion.rearm()
+            self.video_container_layout.setCurrentWidget(self.video_label)
+            return
+        self.capture_report = report
+        self.captured_image = frame
+        self.camera_active = False
+        self._sync_preview()
+        self.show_captured_image()
+        metrics.observe('capture_seconds', time.perf_counter() - self._capture_started)
+        metrics.inc('capture_quality_total', result='ok' if report.ok else 'poor')
+        if self._auto_pending:
+            self._auto_pending = False
+            self.analyze_ulam()
 
     def show_captured_image(self):
-        rgb_image = cv2.cvtColor(self.captured_image, cv2.COLOR_BGR2RGB)
-        h, w, ch = rgb_image.shape
-        bytes_per_line = ch * w
-        qt_image = QImage(rgb_image.data, w, h, bytes_per_line, QImage.Format_RGB888)
-        pixmap = QPixmap.fromImage(qt_image).scaled(self.video_label.width(), self.video_label.height(), Qt.KeepAspectRatio, Qt.SmoothTransformation)
+        # Still image is shown once, so favour quality over speed
+        pixmap = PreviewRenderer(cv2.INTER_AREA).render(self.captured_image, self.video_label.width(), self.video_label.height())
         self.video_label.setPixmap(pixmap)
         self.video_container_layout.setCurrentWidget(self.video_label)
         # Show analyze/retake, hide capture
@@ -502,30 +484,191 @@ class TakePicturePage(QWidget):
             self._retake_connected = True
 
     def retake_picture(self):
-        self.cap = cv2.VideoCapture(0)
+        # The answer for the previous photo is no longer wanted
+        self._set_analysis_cancelled(reason='retaken')
+        self.capture_report = None
         self.camera_active = True
-        self.timer.start(30)
+        self.governor.reset()
+        self._sync_preview()
         self.capture_btn.show()
         self.analyze_btn.setEnabled(False)
         self.analyze_btn.hide()
         self.retake_btn.hide()
         self.video_container_layout.setCurrentWidget(self.loading_label)
 
+    def preview_stats(self):
+        """Current preview fps, interval, render cost and dropped-frame count."""
+        return self.governor.stats()
+
+    def set_preview_paused(self, paused):
+        """Stop (or restart) the preview entirely, e.g. while the window is hidden or minimised."""
+        if paused == self._preview_paused:
+            return
+        self._preview_paused = paused
+        self._sync_preview()
+
+    def _sync_preview(self):
+        """Hold the camera only while a live preview is actually on screen."""
+        want = self.camera_active and not self._preview_paused
+        if want and not self._camera_held:
+            self.camera.acquire()
+            self._camera_held = True
+            self.governor.resume()
+            self.timer.start(self.governor.interval_ms)
+        elif not want and self._camera_held:
+            self.timer.stop()
+            self.camera.release()
+            self._camera_held = False
+
+    def showEvent(self, event):
+        super().showEvent(event)
+        self.set_preview_paused(self.window().isMinimized())
+
+    def hideEvent(self, event):
+        super().hideEvent(event)
+        self.set_preview_paused(True)
+
+    def stop_camera(self):
+        self.camera_active = False
+        if hasattr(self, 'camera'):
+            self._sync_preview()
+            if self._owns_camera:
+                self.camera.close()
+
     def closeEvent(self, event):
-        if hasattr(self, 'cap') and self.cap.isOpened():
-            self.cap.release()
+        self._set_analysis_cancelled(reason='closed')
+        self.stop_camera()
         event.accept()
 
 class UploadPicturePage(QWidget):
-    """Page for uploading a picture of an ulam."""
-    def __init__(self, parent=None):
+    """Batch analysis of picked image files or a whole folder."""
+    result_ready = pyqtSignal(str, dict, float)
+    batch_finished = pyqtSignal()
+
+    def __init__(self, parent=None, backend=None):
         super().__init__(parent)
+        self.openai_api_key = os.environ.get('OPENAI_API_KEY')
+        self.backend = backend or BackendClient.from_env(self.openai_api_key)
+        self.engine = AnalysisEngine.from_env(self.openai_api_key, client=self.backend)
+        self.runner = None
+        self._batch_cancel = None
+        self._total = 0
+        self.results = {}
+
         layout = QVBoxLayout()
-        label = QLabel("Upload a picture of an ulam (upload feature coming soon)")
+        label = QLabel("Analyze many pictures of ulam at once")
         label.setAlignment(Qt.AlignCenter)
         label.setStyleSheet("font-size: 22px; color: #273c75;")
         layout.addWidget(label)
+
+        button_row = QHBoxLayout()
+        self.select_files_btn = QPushButton("🖼️ Select images")
+        self.select_files_btn.clicked.connect(self.select_files)
+        button_row.addWidget(self.select_files_btn)
+        self.select_folder_btn = QPushButton("📁 Select folder")
+        self.select_folder_btn.clicked.connect(self.select_folder)
+        button_row.addWidget(self.select_folder_btn)
+        button_row.addWidget(QLabel("Parallel:"))
+        self.workers_spin = QSpinBox()
+        self.workers_spin.setRange(1, 16)
+        self.workers_spin.setValue(configured_workers())
+        button_row.addWidget(self.workers_spin)
+        self.stop_btn = QPushButton("Stop")
+        self.stop_btn.setEnabled(False)
+        self.stop_btn.clicked.connect(self.stop_batch)
+        button_row.addWidget(self.stop_btn)
+        layout.addLayout(button_row)
+
+        self.status_label = QLabel("Pick images or a folder to start.")
+        layout.addWidget(self.status_label)
+
+        # Results appear as they finish; double-click one for details
+        self.results_list = QListWidget()
+        self.results_list.itemDoubleClicked.connect(self._show_item)
+        layout.addWidget(self.results_list, stretch=1)
+
         self.back_btn = QPushButton("⬅️ Back")
+        self.back_btn.clicked.connect(self.stop_batch)
         layout.addWidget(self.back_btn)
-        layout.addStretch()
         self.setLayout(layout)
+
+        self.result_ready.connect(self._add_result)
+        self.batch_finished.connect(self._on_batch_finished)
+
+    def select_files(self):
+        paths, _ = QFileDialog.getOpenFileNames(self, "Select ulam pictures", "", "Images (*.jpg *.jpeg *.png *.bmp *.webp)")
+        if paths:
+            self.start_batch(paths)
+
+    def select_folder(self):
+        folder = QFileDialog.getExistingDirectory(self, "Select a folder of ulam pictures")
+        if folder:
+            self.start_batch(list_images(folder))
+
+    def _analyze_path(self, path, cancel):
+        image = cv2.imread(path)
+        if image is None:
+            return {"error": "Could not read image file."}
+        return self.engine.analyze(image, cancel=cancel)
+
+    def start_batch(self, paths):
+        if self.runner is not None or not paths:
+            return
+        self.results_list.clear()
+        self.results = {}
+        self._total = len(paths)
+        self._batch_cancel = CancelToken()
+        self.runner = BatchRunner.from_env(self._analyze_path, workers=self.workers_spin.value())
+        self.select_files_btn.setEnabled(False)
+        self.select_folder_btn.setEnabled(False)
+        self.stop_btn.setEnabled(True)
+        self.status_label.setText(f"Analyzing {self._total} images...")
+        print(f"[batch] Starting {self._total} images with {self.runner.workers} workers.")
+
+        runner, cancel = self.runner, self._batch_cancel
+
+        def run_batch():
+            try:
+                runner.run(paths, self.result_ready.emit, cancel)
+            finally:
+                self.batch_finished.emit()
+
+        threading.Thread(target=run_batch, daemon=True).start()
+
+    def stop_batch(self):
+        if self._batch_cancel is not None:
+            self._batch_cancel.set()
+
+    def _add_result(self, path, result, seconds):
+        self.results[path] = result
+        name = os.path.basename(path)
+        if 'error' in result:
+            text = f"❌ {name}: {result['error']}"
+        else:
+            calories = result.get('macros', {}).get('calories', '?')
+            text = f"✅ {name}: {result.get('ulam_name', 'Unknown')} ({calories} kcal) in {seconds:.1f}s"
+        item = QListWidgetItem(text)
+        item.setData(Qt.UserRole, path)
+        self.results_list.addItem(item)
+        self._update_status()
+
+    def _update_status(self, finished=False):
+        stats = self.runner.stats()
+        state = "Finished" if finished else "Analyzing"
+        self.status_label.setText(
+            f"{state}: {stats['done']}/{self._total} done, {stats['failed']} failed, "
+            f"{stats['images_per_min']} images/min"
+        )
+
+    def _on_batch_finished(self):
+        self._update_status(finished=True)
+        print(f"[batch] Finished: {self.runner.stats()}")
+        self.runner = None
+        self.select_files_btn.setEnabled(True)
+        self.select_folder_btn.setEnabled(True)
+        self.stop_btn.setEnabled(False)
+
+    def _show_item(self, item):
+        result = self.results.get(item.data(Qt.UserRole))
+        if result is not None:
+            show_result_dialog(self, result)
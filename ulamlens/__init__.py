@@ -0,0 +1 @@
+"""UlamLens core: analysis, caching and other logic that does not depend on Qt."""
@@ -0,0 +1,5 @@
+import sys
+
+from ulamlens.cli import main
+
+sys.exit(main())
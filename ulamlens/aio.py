@@ -0,0 +1,484 @@
+"""asyncio backend layer: every remote call of the process on one event loop.
+
+The threaded path (``ulamlens.dispatch``) spends a thread per backend
+attempt, blocked on the SDK or ``requests``. With ULAMLENS_ASYNC on, remote
+calls instead run as coroutines on a single loop thread using
+``openai.AsyncOpenAI``, so hundreds of analyses can wait on the network at
+once for the cost of a few sockets. A semaphore bounds the requests in flight
+(ULAMLENS_ASYNC_CONCURRENCY) and ``asyncio.wait_for`` bounds each attempt.
+
+Qt talks to the loop through ``AsyncAnalysisQueue``, which has the same
+interface as ``engine.AnalysisQueue``; its callbacks run on the loop thread
+and ``ui.jobs`` turns them into queued signals for the GUI thread.
+"""
+import asyncio
+import base64
+import functools
+import itertools
+import threading
+import time
+
+from ulamlens.analysis import (
+    MAX_OUTPUT_TOKENS, TEXT_FALLBACK_MODELS, TEXT_ONLY_NOTE, VISION_MODELS, _field, _with_compact_fields,
+    _with_table_fields, accept_result, build_attempts, deferred_result, failure_result, max_output_tokens, prompt_for,
+    record_attempts, record_upload, record_usage, response_text, save_debug_copy, with_upload,
+)
+from ulamlens.budget import BudgetDeferred, default_budget
+from ulamlens.cancel import CancelToken, link
+from ulamlens.client import is_connection_error, load_httpx, load_openai
+from ulamlens.config import env_bool, env_int
+from ulamlens.dispatch import Attempt, DispatchResult, Dispatcher, Schedule
+from ulamlens.engine import CANCELLED_RESULT, Backend, Job
+from ulamlens.nutrition import default_table, enrich
+from ulamlens.preprocess import prepare_upload
+from ulamlens.streaming import IncrementalJsonParser
+
+
+class LoopThread:
+    """An asyncio event loop running forever on its own daemon thread.
+
+    ``submit`` schedules a coroutine from any thread and returns a
+    ``concurrent.futures.Future``; ``run`` waits for it. Never ``run`` from
+    the loop thread itself, it would wait on itself.
+    """
+
+    def __init__(self, name='ulamlens-asyncio'):
+        self.loop = asyncio.new_event_loop()
+        self._started = threading.Event()
+        self._thread = threading.Thread(target=self._main, daemon=True, name=name)
+        self._thread.start()
+        self._started.wait()
+
+    def _main(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.call_soon(self._started.set)
+        self.loop.run_forever()
+
+    def submit(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def run(self, coro, timeout=None):
+        if threading.current_thread() is self._thread:
+            raise RuntimeError("LoopThread.run() called from the loop thread; await the coroutine instead")
+        return self.submit(coro).result(timeout)
+
+    def call_soon(self, callback, *args):
+        """Run ``callback(*args)`` on the loop thread; safe from any thread."""
+        if not self.loop.is_closed():
+            self.loop.call_soon_threadsafe(callback, *args)
+
+    def stop(self, timeout=2.0):
+        if self.loop.is_closed():
+            return
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join(timeout)
+        if not self._thread.is_alive():
+            self.loop.close()
+
+
+_default_loop = None
+_default_loop_lock = threading.Lock()
+
+
+def default_loop():
+    """Process-wide loop thread, started on first use."""
+    global _default_loop
+    with _default_loop_lock:
+        if _default_loop is None or _default_loop.loop.is_closed():
+            _default_loop = LoopThread()
+        return _default_loop
+
+
+async def cancelled_by(cancel):
+    """Cancel the current task as soon as the thread-side ``cancel`` token fires; returns the unlink function."""
+    loop = asyncio.get_running_loop()
+    task = asyncio.current_task()
+    return link(cancel, lambda: loop.call_soon_threadsafe(task.cancel))
+
+
+class AsyncBackendClient:
+    """Pooled ``openai.AsyncOpenAI`` client plus the semaphore bounding requests in flight.
+
+    Both belong to the loop they are first used on, which is the loop
+    thread's for everything created through ``from_env``.
+    """
+
+    def __init__(self, api_key, max_concurrency=16, retries=2):
+        self.api_key = api_key
+        self.max_concurrency = max(1, max_concurrency)
+        self.retries = retries
+        self._openai = None
+        self._semaphore = None
+
+    @classmethod
+    def from_env(cls, api_key):
+        return cls(
+            api_key,
+            max_concurrency=env_int('ULAMLENS_ASYNC_CONCURRENCY', 16),
+            retries=env_int('ULAMLENS_HTTP_RETRIES', 2),
+        )
+
+    def openai_client(self):
+        """Shared ``openai.AsyncOpenAI`` instance, or None if the SDK has no async client."""
+        openai = load_openai()
+        if openai is None or not hasattr(openai, 'AsyncOpenAI'):
+            return None
+        if self._openai is None:
+            kwargs = {}
+            if hasattr(openai, 'DefaultAsyncHttpxClient'):
+                httpx = load_httpx()
+                # Connect-only retries, as for the threaded client
+                http_kwargs = {'transport': httpx.AsyncHTTPTransport(retries=self.retries)} if httpx else {}
+                kwargs['http_client'] = openai.DefaultAsyncHttpxClient(**http_kwargs)
+            self._openai = openai.AsyncOpenAI(api_key=self.api_key, max_retries=0, **kwargs)
+        return self._openai
+
+    @property
+    def semaphore(self):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._semaphore
+
+    async def aclose(self):
+        if self._openai is not None:
+            await self._openai.close()
+            self._openai = None
+
+
+_default_client = None
+_default_client_lock = threading.Lock()
+_warned_no_http = False
+
+
+def default_async_client(api_key):
+    """Process-wide ``AsyncBackendClient`` (one connection pool and concurrency limit for every engine)."""
+    global _default_client
+    with _default_client_lock:
+        if _default_client is None or _default_client.api_key != api_key:
+            _default_client = AsyncBackendClient.from_env(api_key)
+        return _default_client
+
+
+def threaded_attempt(attempt, timeout_s):
+    """A threaded ``dispatch.Attempt`` as a coroutine attempt; it runs in the loop's executor.
+
+    Cancelling the task cancels the attempt's token, which closes its connection.
+    """
+    async def call():
+        token = CancelToken()
+        loop = asyncio.get_running_loop()
+        try:
+            return await loop.run_in_executor(None, attempt.call, token, timeout_s)
+        except asyncio.CancelledError:
+            token.cancel('cancelled')
+            raise
+    return Attempt(attempt.name, call)
+
+
+def build_async_attempts(client, upload_bytes, mime, prompt, on_field=None, max_tokens=MAX_OUTPUT_TOKENS):
+    """``(primary, fallback)`` attempts whose ``call()`` is a coroutine returning the raw model text.
+
+    The multipart HTTP upload uses ``requests`` and is added by
+    ``AsyncRemoteBackend`` as a threaded attempt.
+    """
+    sdk = client.openai_client()
+    if sdk is None:
+        return [], []
+    streaming = env_bool('ULAMLENS_STREAM', True)
+    b64 = base64.b64encode(upload_bytes).decode('ascii')
+    owner = []
+
+    def emit(name, key, value):
+        # Only the first attempt to stream a field feeds the display
+        if not owner:
+            owner.append(name)
+        if owner[0] == name and on_field is not None:
+            on_field(key, value)
+
+    async def sdk_call(name, **request):
+        async with client.semaphore:
+            started = time.perf_counter()
+            if not streaming:
+                response = await sdk.responses.create(**request)
+                raw_text = response_text(response)
+                record_usage(name, _field(response, 'usage'), time.perf_counter() - started, request['input'],
+                             raw_text)
+                return raw_text
+            parser = IncrementalJsonParser()
+            usage = None
+            stream = await sdk.responses.create(stream=True, **request)
+            # Leaving the block (also on cancellation) closes the connection
+            async with stream:
+                async for event in stream:
+                    kind = getattr(event, 'type', '')
+                    if kind == 'response.completed':
+                        usage = getattr(getattr(event, 'response', None), 'usage', None)
+                    if kind != 'response.output_text.delta':
+                        continue
+                    for key, value in parser.feed(event.delta):
+                        emit(name, key, value)
+            if owner and owner[0] == name and accept_result(parser.text) is None:
+                owner.clear()
+            record_usage(name, usage, time.perf_counter() - started, request['input'], parser.text)
+            return parser.text
+
+    def vision(mname):
+        async def call():
+            raw_text = await sdk_call(mname, model=mname, max_output_tokens=max_tokens, input=[
+                {"role": "user", "content": [
+                    {"type": "input_text", "text": prompt},
+                    {"type": "input_image", "image_url": f"data:{mime};base64,{b64}"}
+                ]}
+            ])
+            print(f"[Analyze] Raw response (async, {mname}): {raw_text}")
+            return raw_text
+        return call
+
+    def text_only(mname):
+        async def call():
+            raw_text = await sdk_call(mname + ' (text only)', model=mname, input=prompt + TEXT_ONLY_NOTE,
+                                      max_output_tokens=max_tokens)
+            print(f"[Analyze] Raw response (async fallback, {mname}): {raw_text}")
+            return raw_text
+        return call
+
+    primary = [Attempt(mname, vision(mname)) for mname in VISION_MODELS]
+    fallback = [Attempt(mname + ' (text only)', text_only(mname)) for mname in TEXT_FALLBACK_MODELS]
+    return primary, fallback
+
+
+async def dispatch(attempts, accept, dispatcher, strategy=None):
+    """``Dispatcher.run`` for coroutine attempts: sequential, race or hedge, as tasks on the running loop.
+
+    When to start each attempt comes from the same ``dispatch.Schedule`` as
+    the threaded path. Cancelling the calling task cancels every attempt
+    still running.
+    """
+    strategy = strategy or dispatcher.strategy
+    loop = asyncio.get_running_loop()
+    outcome = DispatchResult()
+    schedule = Schedule(strategy, len(attempts), dispatcher.max_parallel, dispatcher.hedge_delay_s)
+    running = {}  # task -> (attempt name, start time)
+
+    def launch(attempt):
+        task = asyncio.ensure_future(asyncio.wait_for(attempt.call(), dispatcher.attempt_timeout_s))
+        running[task] = (attempt.name, loop.time())
+        print(f"[dispatch] Started {attempt.name} ({strategy}, async).")
+
+    def launch_due(ended=0):
+        for _ in range(schedule.due(len(running), loop.time(), ended)):
+            launch(attempts[schedule.started(loop.time())])
+
+    def finish(task, status):
+        name, started = running.pop(task)
+        outcome.attempts.append((name, round(loop.time() - started, 3), status))
+        return name
+
+    try:
+        launch_due()
+        while running:
+            hedge_at = schedule.hedge_at(len(running))
+            timeout = None if hedge_at is None else max(0.0, hedge_at - loop.time())
+            done, _ = await asyncio.wait(list(running), timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            ended = 0
+            for task in done:
+                ended += 1
+                try:
+                    raw_text = task.result()
+                except asyncio.TimeoutError:
+                    name = finish(task, 'timeout')
+                    print(f"[dispatch] {name} exceeded {dispatcher.attempt_timeout_s}s budget.")
+                    continue
+                except Exception as err:
+                    name = finish(task, 'unreachable' if is_connection_error(err) else 'error')
+                    outcome.error = str(err)
+                    print(f"[dispatch] {name} failed: {err}")
+                    continue
+                result = accept(raw_text)
+                name = finish(task, 'ok' if result is not None else 'invalid')
+                outcome.raw_text = raw_text or outcome.raw_text
+                if result is not None:
+                    outcome.name = name
+                    outcome.result = result
+                    return outcome
+            # Failed attempts are replaced right away; a due hedge starts the next one
+            launch_due(ended)
+        return outcome
+    except asyncio.CancelledError:
+        outcome.cancelled = True
+        raise
+    finally:
+        status = 'cancelled' if outcome.cancelled else 'lost'
+        for task in list(running):
+            task.cancel()
+            finish(task, status)
+
+
+class AsyncRemoteBackend(Backend):
+    """``engine.RemoteBackend`` on the event loop; ``analyze`` from a worker thread waits on the loop thread.
+
+    ``http`` is the threaded ``BackendClient`` whose multipart HTTP upload
+    runs in the loop's executor as one more image attempt; without it there
+    is no HTTP fallback.
+    """
+    name = 'remote'
+    cacheable = True
+
+    def __init__(self, api_key, client=None, dispatcher=None, loop=None, http=None):
+        self.api_key = api_key
+        self.client = client or default_async_client(api_key)
+        self.dispatcher = dispatcher or Dispatcher.from_env()
+        self.loop = loop
+        self.http = http
+        global _warned_no_http
+        if http is None and not _warned_no_http:
+            _warned_no_http = True
+            print("[Analyze] Async mode without a BackendClient: the HTTP upload fallback is off.")
+
+    def available(self):
+        return bool(self.api_key)
+
+    def analyze(self, image, cancel=None, on_field=None):
+        loop = self.loop or default_loop()
+        return loop.run(self.analyze_async(image, cancel=cancel, on_field=on_field))
+
+    async def analyze_async(self, image, cancel=None, on_field=None):
+        if load_openai() is None:
+            return {"error": "openai package not installed. Install 'openai' to enable analysis."}
+        unlink = await cancelled_by(cancel)
+        try:
+            return await self._analyze(image, on_field)
+        except asyncio.CancelledError:
+            if cancel is not None and cancel.is_set():
+                print("[Analyze] Attempts cancelled.")
+                return dict(CANCELLED_RESULT)
+            raise
+        finally:
+            unlink()
+
+    async def _analyze(self, image, on_field):
+        loop = asyncio.get_running_loop()
+        try:
+            # Image work is CPU-bound and stays off the loop
+            upload_bytes, upload_info = await loop.run_in_executor(None, prepare_upload, image)
+        except Exception as e:
+            print(f"[Analyze] Preprocessing failed: {e}")
+            return {"error": f"Could not prepare the image for upload: {e}"}
+        print(f"[Analyze] Upload payload: {upload_info}")
+        record_upload(upload_info)
+        save_debug_copy(upload_bytes, upload_info["mime"])
+        table = default_table()
+        if on_field is not None:
+            on_field = _with_compact_fields(_with_table_fields(on_field, table) if table is not None else on_field)
+        prompt, max_tokens = prompt_for(table), max_output_tokens()
+        primary, fallback = build_async_attempts(self.client, upload_bytes, upload_info["mime"],
+                                                 prompt, on_field, max_tokens)
+        if self.http is not None:
+            # Fields are only streamed from the SDK attempts
+            http, _ = build_attempts(self.http, upload_bytes, upload_info["mime"], prompt=prompt,
+                                     max_tokens=max_tokens, sdk=False)
+            primary += [threaded_attempt(attempt, self.dispatcher.attempt_timeout_s) for attempt in http]
+        budget = default_budget()
+        try:
+            reservation = await budget.acquire_async()
+        except BudgetDeferred as e:
+            result = deferred_result(e)
+        else:
+            try:
+                result = await self._dispatch(primary, fallback, table)
+            finally:
+                budget.release(reservation)
+        return with_upload(result, upload_bytes, upload_info["mime"])
+
+    async def _dispatch(self, primary, fallback, table):
+        outcome = await dispatch(primary, accept_result, self.dispatcher)
+        raw_text, error = outcome.raw_text, outcome.error
+        attempts = list(outcome.attempts)
+        if not outcome.ok and fallback:
+            outcome = await dispatch(fallback, accept_result, self.dispatcher, strategy='sequential')
+            raw_text = outcome.raw_text or raw_text
+            error = outcome.error or error
+            attempts += outcome.attempts
+        print(f"[Analyze] Attempts: {attempts}")
+        record_attempts(attempts)
+        if outcome.ok:
+            return enrich(outcome.result, table)
+        if not primary and not fallback:
+            return {"error": "The installed openai package has no async client."}
+        return failure_result(attempts, raw_text, error, table)
+
+
+class AsyncAnalysisQueue:
+    """``engine.AnalysisQueue`` with jobs as tasks on a loop thread instead of pool threads.
+
+    ``workers`` bounds the analyses running at once; further submissions wait
+    on a semaphore without holding a thread. Callbacks run on the loop thread.
+    """
+
+    def __init__(self, engine, workers=16, loop=None):
+        self.engine = engine
+        self.workers = max(1, workers)
+        self.loop = loop or default_loop()
+        self.jobs = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._slots = None
+
+    @classmethod
+    def from_env(cls, engine):
+        return cls(engine, workers=env_int('ULAMLENS_ANALYSIS_WORKERS', 16))
+
+    def submit(self, image, image_hash=None, on_field=None, on_done=None):
+        job = Job(f"job-{next(self._ids)}", CancelToken())
+        with self._lock:
+            self.jobs[job.id] = job
+        job.future = self.loop.submit(self._run(job, image, image_hash, on_field, on_done))
+        return job
+
+    async def _run(self, job, image, image_hash, on_field, on_done):
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.workers)
+        try:
+            async with self._slots:
+                if job.cancelled:
+                    return dict(CANCELLED_RESULT)
+                fields = functools.partial(on_field, job) if on_field is not None else None
+                try:
+                    result = await self.engine.analyze_async(image, cancel=job.token, image_hash=image_hash,
+                                                             on_field=fields)
+                except asyncio.CancelledError:
+                    result = dict(CANCELLED_RESULT)
+                except Exception as e:
+                    print(f"[Analyze] Exception: {e}")
+                    result = {"error": str(e)}
+            if job.cancelled:
+                print(f"[Analyze] {job.id} {job.token.reason}; result discarded.")
+            elif on_done is not None:
+                on_done(job, result)
+            return result
+        finally:
+            with self._lock:
+                self.jobs.pop(job.id, None)
+
+    def cancel(self, job_id, reason='cancelled'):
+        with self._lock:
+            job = self.jobs.get(job_id)
+        if job is not None:
+            job.token.cancel(reason)
+
+    def cancel_all(self, reason='cancelled'):
+        with self._lock:
+            jobs = list(self.jobs.values())
+        for job in jobs:
+            job.token.cancel(reason)
+
+    def in_flight(self):
+        with self._lock:
+            return len(self.jobs)
+
+    def shutdown(self, wait=False, timeout=5.0):
+        self.cancel_all('shutdown')
+        if wait:
+            deadline = time.monotonic() + timeout
+            while self.in_flight() and time.monotonic() < deadline:
+                time.sleep(0.02)
@@ -0,0 +1,572 @@
+"""Request construction, backend calls and response parsing for ulam analysis.
+
+This module has no Qt dependency so the same logic serves the camera page,
+batch uploads and benchmarks.
+"""
+import base64
+import json
+import os
+import threading
+import time
+
+from ulamlens.budget import BudgetDeferred, default_budget, estimate_tokens, usage_tokens
+from ulamlens.cancel import link
+from ulamlens.client import BackendClient, abort_response, load_openai
+from ulamlens.config import env_bool, env_int, env_str
+from ulamlens.dispatch import Attempt, Dispatcher
+from ulamlens.metrics import BYTES_BUCKETS, metrics
+from ulamlens.nutrition import default_table, enrich
+from ulamlens.offline import is_retryable
+from ulamlens.preprocess import prepare_upload
+from ulamlens.streaming import IncrementalJsonParser, sse_text_deltas
+
+PROMPT = (
+    "You are a nutrition and Filipino food expert. "
+    "Given a photo of a Filipino viand (ulam), guess what ulam it is and return a JSON with the following structure: "
+    '{\n'
+    '  "ulam_name": string,\n'
+    '  "macros": {\n'
+    '    "calories": int,\n'
+    '    "protein_g": float,\n'
+    '    "carbs_g": float,\n'
+    '    "fat_g": float\n'
+    '  },\n'
+    '  "health_facts": string,\n'
+    '  "warnings": string\n'
+    '}\n'
+    "If you are unsure, make your best guess."
+)
+# With the nutrition table, common dishes only need to be named: the table's alias and fuzzy
+# matching maps the name and supplies the rest, so the prompt does not list the table's dishes
+IDENTIFY_PROMPT = (
+    "You are a Filipino food expert. Identify the Filipino viand (ulam) in the photo. "
+    "Reply with only the JSON {\"ulam_name\": string}, using its usual name. "
+    "Only if it is not a common Filipino ulam, also add \"macros\" {\"calories\", \"protein_g\", \"carbs_g\", "
+    "\"fat_g\"} for one serving, \"health_facts\" and \"warnings\"."
+)
+# Same answer in fewer tokens: one-letter keys, macros as a list, short texts (see ``expand_compact``)
+COMPACT_PROMPT = (
+    "Identify the Filipino viand (ulam) in the photo and estimate one serving. "
+    'Reply with only minified JSON {"n":name,"m":[calories,protein_g,carbs_g,fat_g],"h":health facts,"w":warnings}, '
+    "h and w at most 12 words each. Best guess if unsure."
+)
+COMPACT_IDENTIFY_PROMPT = (
+    'Name the Filipino ulam in the photo. Reply with only minified JSON {"n":name}; only if it is not a common '
+    'ulam also add "m":[calories,protein_g,carbs_g,fat_g],"h":health facts,"w":warnings (12 words max each).'
+)
+TEXT_ONLY_NOTE = (
+    "\n\nNOTE: The image could not be attached; provide your best-guess JSON based on common Filipino ulam. "
+    "Mark values as 'estimate' where unsure."
+)
+VISION_MODELS = ["gpt-4-vision-preview"]
+HTTP_MODEL = 'gpt-4-vision-preview'
+TEXT_FALLBACK_MODELS = ["gpt-4", "gpt-3.5-turbo"]
+MAX_OUTPUT_TOKENS = 500
+# Input tokens of an attached image when a backend does not report usage (768 px, high detail)
+IMAGE_TOKENS = 765
+COMPACT_MAX_OUTPUT_TOKENS = 150
+MACRO_KEYS = ('calories', 'protein_g', 'carbs_g', 'fat_g')
+COMPACT_KEYS = {'n': 'ulam_name', 'm': 'macros', 'h': 'health_facts', 'w': 'warnings'}
+
+NO_KEY_RESULT = {
+    "ulam_name": "N/A",
+    "macros": {"calories": "N/A", "protein_g": "N/A", "carbs_g": "N/A", "fat_g": "N/A"},
+    "health_facts": "N/A",
+    "warnings": "N/A",
+    "error": "OpenAI API key is not set. Please configure your API key to enable analysis.",
+}
+# Every attempt failed without a reply; the engine can keep the photo and retry later (``ulamlens.offline``)
+UNREACHABLE_RESULT = {"error": "Could not reach the analysis service.", "unreachable": True}
+
+
+def prompt_style():
+    """``'full'`` (the default) or ``'compact'``, from ULAMLENS_PROMPT."""
+    return 'compact' if env_str('ULAMLENS_PROMPT', 'full').lower() == 'compact' else 'full'
+
+
+def prompt_for(table, style=None):
+    """Identification prompt when there is a nutrition ``table``, otherwise the full PROMPT."""
+    compact = (style or prompt_style()) == 'compact'
+    if table is None:
+        return COMPACT_PROMPT if compact else PROMPT
+    return COMPACT_IDENTIFY_PROMPT if compact else IDENTIFY_PROMPT
+
+
+def max_output_tokens(style=None):
+    """Answer length cap: ULAMLENS_MAX_OUTPUT_TOKENS, or the default of the prompt style."""
+    default = COMPACT_MAX_OUTPUT_TOKENS if (style or prompt_style()) == 'compact' else MAX_OUTPUT_TOKENS
+    return env_int('ULAMLENS_MAX_OUTPUT_TOKENS', default)
+
+
+def expand_compact(data):
+    """Result in the usual schema from a compact answer (``{"n": ..., "m": [...]}``); others pass through."""
+    if not isinstance(data, dict) or 'n' not in data or 'ulam_name' in data:
+        return data
+    result = {}
+    for short, key in COMPACT_KEYS.items():
+        if short in data:
+            result[key] = _expand_field(short, data[short])
+    return result
+
+
+def _expand_field(short, value):
+    if short == 'm' and isinstance(value, (list, tuple)):
+        return dict(zip(MACRO_KEYS, value))
+    return value
+
+
+def _field(obj, name, default=None):
+    # SDK responses are objects, HTTP responses are dicts
+    if isinstance(obj, dict):
+        return obj.get(name, default)
+    return getattr(obj, name, default)
+
+
+def output_parts_text(output):
+    """Join the text parts of a responses-API ``output`` list."""
+    parts = []
+    for item in output or []:
+        if isinstance(item, str):
+            parts.append(item)
+            continue
+        for c in _field(item, 'content', None) or []:
+            txt = _field(c, 'text') or _field(c, 'title') or ''
+            if txt:
+                parts.append(txt)
+    return "\n".join(parts)
+
+
+def response_text(resp):
+    """Text of an SDK response object or a decoded HTTP JSON response."""
+    raw_text = _field(resp, 'output_text') or _field(resp, 'text') or ''
+    if not raw_text:
+        raw_text = output_parts_text(_field(resp, 'output') or _field(resp, 'choices') or [])
+    return raw_text
+
+
+def parse_result(raw_text):
+    """Extract the JSON object from the model text; errors are reported in the dict."""
+    raw_text = raw_text or ''
+    try:
+        with metrics.timer('parse_seconds'):
+            json_start = raw_text.find('{')
+            json_end = raw_text.rfind('}') + 1
+            return expand_compact(json.loads(raw_text[json_start:json_end]))
+    except Exception as ex:
+        print(f"[Analyze] Failed to parse JSON: {ex}")
+        return {"error": "Could not parse JSON", "raw": raw_text}
+
+
+def accept_result(raw_text):
+    """Parsed result if ``raw_text`` holds valid JSON, otherwise None (for the dispatcher)."""
+    if not raw_text:
+        return None
+    result = parse_result(raw_text)
+    return None if 'error' in result else result
+
+
+class _FieldRelay:
+    """Forwards streamed fields to ``on_field`` from one attempt at a time.
+
+    With several attempts in flight, the first one to produce a field owns
+    the display; the others stay silent unless the owner fails.
+    """
+
+    def __init__(self, on_field):
+        self.on_field = on_field
+        self.owner = None
+        self._lock = threading.Lock()
+
+    def emit(self, name, key, value):
+        with self._lock:
+            if self.owner is None:
+                self.owner = name
+            if self.owner != name:
+                return
+        self.on_field(key, value)
+
+    def release(self, name):
+        with self._lock:
+            if self.owner == name:
+                self.owner = None
+
+
+def stream_deltas(events, on_completed=None):
+    """Output-text deltas of an SDK response stream; ``on_completed(usage)`` gets the final token usage."""
+    for event in events:
+        kind = getattr(event, 'type', '')
+        if kind == 'response.output_text.delta':
+            yield event.delta
+        elif kind == 'response.completed' and on_completed is not None:
+            on_completed(getattr(getattr(event, 'response', None), 'usage', None))
+
+
+def record_usage(model, usage, seconds, request_input, raw_text):
+    """Account a completed call with the budget meter; usage is estimated from the text if not reported."""
+    tokens = usage_tokens(usage)
+    estimated = tokens is None
+    if estimated:
+        tokens = (_input_tokens(request_input), estimate_tokens(raw_text))
+    try:
+        default_budget().record(model, tokens[0], tokens[1], seconds=seconds, estimated=estimated)
+    except Exception as e:
+        print(f"[budget] Could not record usage: {e}")
+
+
+def _input_tokens(request_input):
+    # A prompt string, or messages / content parts as sent to the responses API
+    if isinstance(request_input, str):
+        return estimate_tokens(request_input)
+    parts = []
+    for item in request_input or []:
+        parts.extend(item.get('content', [item]))
+    text = " ".join(p.get('text', '') for p in parts if p.get('type') == 'input_text')
+    return estimate_tokens(text) + sum(IMAGE_TOKENS for p in parts if p.get('type') == 'input_image')
+
+
+def consume_stream(deltas, on_field=None, cancel=None):
+    """Join streamed text ``deltas``, calling ``on_field(key, value)`` as each field completes."""
+    parser = IncrementalJsonParser()
+    for delta in deltas:
+        if cancel is not None and cancel.is_set():
+            break
+        for key, value in parser.feed(delta):
+            if on_field is not None:
+                on_field(key, value)
+    # A stream closed by cancellation may simply end early
+    if cancel is not None and cancel.is_set():
+        raise RuntimeError("cancelled while streaming")
+    return parser.text
+
+
+def build_attempts(backend, upload_bytes, mime, prompt=PROMPT, on_field=None, max_tokens=MAX_OUTPUT_TOKENS,
+                   sdk=True):
+    """Return ``(primary, fallback)`` attempt lists using the pooled ``backend`` client.
+
+    Primary attempts send the image; fallbacks are text-only guesses that are
+    only worth trying once every image-capable backend has failed.
+
+    With ULAMLENS_STREAM on (the default) responses are streamed, so that
+    cancelling an attempt closes its connection at once, and ``on_field``
+    receives each result field as soon as it is complete. Token usage and
+    latency of every completed call go to the ``ulamlens.budget`` meter.
+    With ``sdk=False`` only the HTTP upload is built (the async path has its
+    own SDK attempts).
+    """
+    primary, fallback = [], []
+    openai = load_openai()
+    if openai is None:
+        return primary, fallback
+    api_key = backend.api_key
+    b64 = base64.b64encode(upload_bytes).decode('ascii')
+    upload_name = 'ulam.' + mime.split('/')[-1]
+
+    if sdk and not hasattr(openai, "OpenAI"):
+        def legacy_chat(cancel, timeout_s):
+            # Legacy fallback using ChatCompletion (may not support images)
+            openai.api_key = api_key
+            response = openai.ChatCompletion.create(
+                model="gpt-3.5-turbo",
+                messages=[
+                    {"role": "system", "content": prompt},
+                    {"role": "user", "content": "Image attachment omitted (vision model unavailable). Please provide best-guess JSON as described."}
+                ],
+                max_tokens=max_tokens,
+                request_timeout=timeout_s,
+            )
+            raw_text = response.choices[0].message['content']
+            print(f"[Analyze] Raw response (legacy fallback): {raw_text}")
+            return raw_text
+        fallback.append(Attempt('legacy-chat', legacy_chat))
+        return primary, fallback
+
+    client = backend.openai_client() if sdk else None
+    session = backend.session()
+    streaming = env_bool('ULAMLENS_STREAM', True)
+    relay = _FieldRelay(on_field) if on_field is not None and streaming else None
+
+    def read_stream(name, response, deltas, cancel):
+        # Cancelling shuts the connection down, which aborts a read blocked on the socket
+        unlink = link(cancel, lambda: abort_response(response))
+        try:
+            raw_text = consume_stream(deltas, (lambda k, v: relay.emit(name, k, v)) if relay else None, cancel)
+        except Exception:
+            if relay is not None:
+                relay.release(name)
+            raise
+        finally:
+            unlink()
+        if relay is not None and accept_result(raw_text) is None:
+            relay.release(name)
+        return raw_text
+
+    def sdk_call(name, cancel, timeout_s, **request):
+        if cancel is not None and cancel.is_set():
+            raise RuntimeError("cancelled before start")
+        started = time.perf_counter()
+        if not streaming:
+            response = client.responses.create(timeout=timeout_s, **request)
+            raw_text = response_text(response)
+            record_usage(name, _field(response, 'usage'), time.perf_counter() - started, request['input'], raw_text)
+            return raw_text
+        usage = []
+        with client.responses.create(stream=True, timeout=timeout_s, **request) as stream:
+            raw_text = read_stream(name, stream, stream_deltas(stream, usage.append), cancel)
+        record_usage(name, usage[0] if usage else None, time.perf_counter() - started, request['input'], raw_text)
+        return raw_text
+
+    def sdk_vision(mname):
+        def call(cancel, timeout_s):
+            raw_text = sdk_call(
+                mname, cancel, timeout_s,
+                model=mname,
+                input=[
+                    {"role": "user", "content": [
+                        {"type": "input_text", "text": prompt},
+                        {"type": "input_image", "image_url": f"data:{mime};base64,{b64}"}
+                    ]}
+                ],
+                max_output_tokens=max_tokens,
+            )
+            print(f"[Analyze] Raw response (new API, {mname}): {raw_text}")
+            return raw_text
+        return call
+
+    def http_upload(cancel, timeout_s):
+        endpoint = backend.image_endpoint
+        headers = {"Authorization": f"Bearer {api_key}"}
+        files = {"image": (upload_name, upload_bytes, mime)}
+        data = {"model": HTTP_MODEL, "input": prompt}
+        if streaming:
+            data["stream"] = "true"
+        if cancel is not None and cancel.is_set():
+            raise RuntimeError("cancelled before start")
+        print(f"[Analyze] Attempting HTTP POST to {endpoint} with model {HTTP_MODEL}")
+        started = time.perf_counter()
+        usage = []
+        resp = session.post(endpoint, headers=headers, files=files, data=data,
+                            timeout=backend.timeout(timeout_s), stream=streaming)
+        with resp:
+            if resp.status_code != 200:
+                raise RuntimeError(f"HTTP fallback returned {resp.status_code}: {resp.text}")
+            if resp.headers.get('Content-Type', '').startswith('text/event-stream'):
+                raw_text = read_stream('http-upload', resp, sse_text_deltas(resp.iter_lines(), usage.append), cancel)
+            else:
+                try:
+                    rj = resp.json()
+                except Exception:
+                    rj = {}
+                raw_text = response_text(rj)
+                usage.append(_field(rj, 'usage'))
+        record_usage('http-upload', usage[0] if usage else None, time.perf_counter() - started,
+                     [{"type": "input_text", "text": prompt}, {"type": "input_image"}], raw_text)
+        print(f"[Analyze] Raw response (http fallback): {raw_text}")
+        return raw_text
+
+    def sdk_text(mname):
+        def call(cancel, timeout_s):
+            raw_text = sdk_call(
+                mname + ' (text only)', cancel, timeout_s,
+                model=mname,
+                input=prompt + TEXT_ONLY_NOTE,
+                max_output_tokens=max_tokens,
+            )
+            print(f"[Analyze] Raw response (new API fallback, {mname}): {raw_text}")
+            return raw_text
+        return call
+
+    if sdk:
+        for mname in VISION_MODELS:
+            primary.append(Attempt(mname, sdk_vision(mname)))
+    if session is not None:
+        primary.append(Attempt('http-upload', http_upload))
+    else:
+        print('[Analyze] requests not available; skipping HTTP fallback')
+    if sdk:
+        for mname in TEXT_FALLBACK_MODELS:
+            fallback.append(Attempt(mname + ' (text only)', sdk_text(mname)))
+    return primary, fallback
+
+
+def analyze_upload(upload_bytes, mime, api_key, dispatcher=None, cancel=None, backend=None, on_field=None):
+    """Analyse an encoded image and return the result dict (errors under ``'error'``).
+
+    Pass the application's long-lived ``backend`` client so connections are
+    reused; without one a throwaway client is created for this call.
+    ``on_field(key, value)`` receives result fields while they stream in,
+    from a worker thread.
+    """
+    if not api_key:
+        return dict(NO_KEY_RESULT)
+    if load_openai() is None:
+        return {"error": "openai package not installed. Install 'openai' to enable analysis."}
+    # Over the token budget this waits (backpressure); far over it the photo is deferred
+    budget = default_budget()
+    try:
+        reservation = budget.acquire(cancel=cancel)
+    except BudgetDeferred as e:
+        return deferred_result(e)
+    if reservation is None:
+        return {"error": "Analysis cancelled by user."}
+    dispatcher = dispatcher or Dispatcher.from_env()
+    owns_backend = backend is None
+    if owns_backend:
+        backend = BackendClient.from_env(api_key)
+    try:
+        return _dispatch(backend, dispatcher, upload_bytes, mime, cancel, on_field)
+    finally:
+        budget.release(reservation)
+        if owns_backend:
+            backend.close()
+
+
+def deferred_result(deferred):
+    """Error result for an analysis postponed by the token budget (``BudgetDeferred``)."""
+    print(f"[budget] Deferring analysis: {deferred}")
+    return {"error": f"Analysis budget: {deferred.reason}.", "deferred": True,
+            "retry_after": round(deferred.retry_after, 1)}
+
+
+def _dispatch(backend, dispatcher, upload_bytes, mime, cancel, on_field=None):
+    table = default_table()
+    if on_field is not None:
+        on_field = _with_compact_fields(_with_table_fields(on_field, table) if table is not None else on_field)
+    primary, fallback = build_attempts(backend, upload_bytes, mime, prompt=prompt_for(table), on_field=on_field,
+                                       max_tokens=max_output_tokens())
+
+    outcome = dispatcher.run(primary, accept_result, cancel=cancel)
+    raw_text, error = outcome.raw_text, outcome.error
+    attempts = list(outcome.attempts)
+    if not outcome.ok and not outcome.cancelled and fallback:
+        # Text-only guesses never race the image backends
+        outcome = dispatcher.run(fallback, accept_result, cancel=cancel, strategy='sequential')
+        raw_text = outcome.raw_text or raw_text
+        error = outcome.error or error
+        attempts += outcome.attempts
+    print(f"[Analyze] Attempts: {attempts}")
+    record_attempts(attempts)
+    if outcome.cancelled:
+        return {"error": "Analysis cancelled by user."}
+    if outcome.ok:
+        return enrich(outcome.result, table)
+    return failure_result(attempts, raw_text, error, table)
+
+
+def failure_result(attempts, raw_text, error, table=None):
+    """Result of a dispatch that no attempt answered usefully."""
+    if unreachable(attempts, raw_text):
+        return dict(UNREACHABLE_RESULT)
+    if not raw_text and error:
+        return {"error": f"The analysis service returned an error: {error}"}
+    return enrich(parse_result(raw_text), table)
+
+
+def _with_table_fields(on_field, table):
+    """Wrap ``on_field`` so a streamed ``ulam_name`` is followed at once by the table's fields.
+
+    Values the model streams afterwards for those fields are not shown, since
+    the final result takes them from the table too.
+    """
+    from_table = set()
+
+    def emit(key, value):
+        if key in from_table:
+            return
+        on_field(key, value)
+        if key == 'ulam_name' and isinstance(value, str):
+            known = enrich({'ulam_name': value}, table)
+            for name in ('macros', 'health_facts', 'warnings'):
+                if name in known and 'nutrition_match' in known:
+                    from_table.add(name)
+                    on_field(name, known[name])
+    return emit
+
+
+def _with_compact_fields(on_field):
+    """Wrap ``on_field`` so fields of a compact answer arrive under their usual names."""
+    def emit(key, value):
+        if key in COMPACT_KEYS:
+            key, value = COMPACT_KEYS[key], _expand_field(key, value)
+        on_field(key, value)
+    return emit
+
+
+def unreachable(attempts, raw_text):
+    """True when attempts were made but none could reach its backend (connection errors and network timeouts).
+
+    Errors the backend answered with (bad key, unknown model, 5xx) are shown
+    to the user instead; queueing would only retry them forever.
+    """
+    return not raw_text and bool(attempts) and all(status == 'unreachable' for _, _, status in attempts)
+
+
+def record_attempts(attempts):
+    """Per-backend latency and outcome of dispatched ``(name, seconds, status)`` attempts."""
+    if not metrics.enabled:
+        return
+    for name, seconds, status in attempts:
+        metrics.observe('backend_request_seconds', seconds, backend=name, status=status)
+        metrics.inc('backend_requests_total', backend=name, status=status)
+
+
+def record_upload(upload_info):
+    """Preparation time and size of an upload (``preprocess.prepare_upload`` info)."""
+    if not metrics.enabled:
+        return
+    metrics.observe('preprocess_seconds', upload_info['preprocess_ms'] / 1000)
+    metrics.observe('encode_seconds', upload_info['encode_ms'] / 1000)
+    metrics.observe('upload_bytes', upload_info['bytes'], buckets=BYTES_BUCKETS)
+
+
+def save_debug_copy(upload_bytes, mime):
+    """Write the upload to ULAMLENS_DEBUG_SAVE_DIR when that debug option is set."""
+    debug_dir = os.environ.get('ULAMLENS_DEBUG_SAVE_DIR')
+    if not debug_dir:
+        return
+    try:
+        os.makedirs(debug_dir, exist_ok=True)
+        debug_path = os.path.join(debug_dir, f"{int(time.time() * 1000)}_ulam.{mime.split('/')[-1]}")
+        with open(debug_path, 'wb') as f:
+            f.write(upload_bytes)
+        print(f"[Analyze] Debug copy saved to {debug_path}")
+    except OSError as e:
+        print(f"[Analyze] Could not save debug copy: {e}")
+
+
+def analyze_remote(image, api_key, dispatcher=None, cancel=None, backend=None, on_field=None):
+    """Remote tier: preprocess a BGR image and analyse it with the configured backends.
+
+    A result worth retrying later carries the encoded upload under ``'_upload'``
+    (see ``with_upload``); the engine takes it off again.
+    """
+    try:
+        # Crop, downscale and re-encode before upload to keep the request small
+        upload_bytes, upload_info = prepare_upload(image)
+    except Exception as e:
+        print(f"[Analyze] Preprocessing failed: {e}")
+        return {"error": f"Could not prepare the image for upload: {e}"}
+    print(f"[Analyze] Upload payload: {upload_info}")
+    record_upload(upload_info)
+    # The encoded buffer stays in memory; it is only written out when debugging
+    save_debug_copy(upload_bytes, upload_info["mime"])
+    result = analyze_upload(upload_bytes, upload_info["mime"], api_key, dispatcher=dispatcher, cancel=cancel,
+                            backend=backend, on_field=on_field)
+    return with_upload(result, upload_bytes, upload_info["mime"])
+
+
+def with_upload(result, upload_bytes, mime):
+    """Attach ``(upload_bytes, mime)`` to a retryable result, so the offline queue keeps exactly what was sent."""
+    if is_retryable(result):
+        result['_upload'] = (upload_bytes, mime)
+    return result
+
+
+def analyze_image(image, api_key, dispatcher=None, cancel=None, backend=None, image_hash=None, on_field=None):
+    """Full analysis of a BGR image through the default engine (cache, local model, remote model).
+
+    Kept for callers that analyse a single image; see ``ulamlens.engine``
+    for the tiers and the job queue.
+    """
+    from ulamlens.engine import AnalysisEngine  # the engine builds on this module
+    engine = AnalysisEngine.from_env(api_key, client=backend, dispatcher=dispatcher)
+    return engine.analyze(image, cancel=cancel, image_hash=image_hash, on_field=on_field)
@@ -0,0 +1,147 @@
+"""Bounded-concurrency batch analysis with optional rate limiting."""
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from ulamlens.cancel import CancelToken
+from ulamlens.config import env_float, env_int
+
+IMAGE_EXTS = ('.jpg', '.jpeg', '.png', '.bmp', '.webp')
+
+
+def list_images(folder):
+    """Image files directly inside ``folder``, sorted by name."""
+    return [
+        os.path.join(folder, name)
+        for name in sorted(os.listdir(folder))
+        if name.lower().endswith(IMAGE_EXTS)
+    ]
+
+
+def iter_images(folder, recursive=False):
+    """Yield image paths under ``folder`` lazily, in sorted order per directory."""
+    if not recursive:
+        yield from list_images(folder)
+        return
+    for root, dirs, files in os.walk(folder):
+        dirs.sort()
+        for name in sorted(files):
+            if name.lower().endswith(IMAGE_EXTS):
+                yield os.path.join(root, name)
+
+
+def configured_workers():
+    return env_int('ULAMLENS_BATCH_WORKERS', 3)
+
+
+class RateLimiter:
+    """Token bucket allowing ``rate_per_min`` starts per minute (0 disables it)."""
+
+    def __init__(self, rate_per_min=0, burst=1):
+        self.rate_per_s = rate_per_min / 60.0
+        self.capacity = max(1, burst)
+        self._tokens = float(self.capacity)
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, cancel=None):
+        """Block until a token is available; returns False if ``cancel`` was set meanwhile."""
+        if self.rate_per_s <= 0:
+            return True
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate_per_s)
+                self._last = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return True
+                wait = (1 - self._tokens) / self.rate_per_s
+            if cancel is not None:
+                if cancel.wait(wait):
+                    return False
+            else:
+                time.sleep(wait)
+
+
+class BatchRunner:
+    """Runs ``analyze(path, cancel)`` over many inputs with at most ``workers`` in flight.
+
+    Results are delivered through ``on_result(path, result, seconds)`` as soon
+    as each one finishes, from the worker thread that produced it.
+    """
+
+    def __init__(self, analyze, workers=3, rate_per_min=0):
+        self.analyze = analyze
+        self.workers = max(1, workers)
+        self.limiter = RateLimiter(rate_per_min)
+        self.done = 0
+        self.failed = 0
+        self.started_at = None
+        self.finished_at = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, analyze, workers=None):
+        return cls(
+            analyze,
+            workers=workers or configured_workers(),
+            rate_per_min=env_float('ULAMLENS_BATCH_RATE_PER_MIN', 0),
+        )
+
+    def run(self, items, on_result, cancel=None):
+        """Process ``items`` (any iterable, consumed lazily); blocks until all are done or cancelled."""
+        self.started_at = time.monotonic()
+        self.finished_at = None
+        cancel = cancel or CancelToken()
+        # Only a couple of items per worker are queued, so huge inputs stream through
+        slots = threading.Semaphore(self.workers * 2)
+
+        def work(item):
+            try:
+                if cancel.is_set() or not self.limiter.acquire(cancel):
+                    return
+                t0 = time.monotonic()
+                try:
+                    result = self.analyze(item, cancel)
+                except Exception as e:
+                    print(f"[batch] {item} failed: {e}")
+                    result = {"error": str(e)}
+                with self._lock:
+                    self.done += 1
+                    if 'error' in result:
+                        self.failed += 1
+                on_result(item, result, time.monotonic() - t0)
+            finally:
+                slots.release()
+
+        try:
+            with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='ulamlens-batch') as pool:
+                for item in items:
+                    while not slots.acquire(timeout=0.25):
+                        if cancel.is_set():
+                            break
+                    if cancel.is_set():
+                        break
+                    pool.submit(work, item)
+        except BaseException:
+            # e.g. Ctrl+C: let queued work bail out instead of running to completion
+            cancel.set()
+            raise
+        finally:
+            self.finished_at = time.monotonic()
+
+    def stats(self):
+        """Completed and failed counts and throughput in images per minute."""
+        with self._lock:
+            done, failed = self.done, self.failed
+        if self.started_at is None:
+            return {"done": 0, "failed": 0, "elapsed_s": 0.0, "images_per_min": 0.0}
+        elapsed = (self.finished_at or time.monotonic()) - self.started_at
+        return {
+            "done": done,
+            "failed": failed,
+            "elapsed_s": round(elapsed, 2),
+            "images_per_min": round(done * 60 / elapsed, 1) if elapsed > 0 else 0.0,
+        }
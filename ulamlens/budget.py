@@ -0,0 +1,300 @@
+"""Token accounting and spend limits for backend calls.
+
+Every completed model call reports its input and output tokens (from the
+API's ``usage``, or estimated from the text when a backend does not report
+it) and latency to ``TokenBudget.record``. Totals per model, per minute and
+per local day are kept; the day's totals are saved under the data dir so a
+restart does not reset the daily budget.
+
+Before an analysis is sent, ``acquire`` reserves the tokens it is expected
+to use. When that would go over ``per_minute`` or ``per_day`` tokens (or the
+daily spend cap), the caller waits until the budget has room: a few seconds
+for the per-minute window. Waits longer than ``max_wait_s``, such as a day
+budget that is used up, raise ``BudgetDeferred`` instead, and the engine then
+keeps the photo in the offline queue until then (see ``ulamlens.offline``).
+All limits are off (0) by default.
+"""
+import asyncio
+import atexit
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import deque
+
+from ulamlens.config import data_dir, env_float, env_int, env_str
+from ulamlens.metrics import metrics
+
+# Tokens of one analysis before any call has been measured (prompt, image and answer)
+DEFAULT_ESTIMATE = 1500
+# The day's totals are written at most this often (and at exit)
+SAVE_INTERVAL_S = 5.0
+
+
+def estimate_tokens(text):
+    """Rough token count of ``text`` (about four characters per token)."""
+    return max(1, len(text or '') // 4)
+
+
+def usage_tokens(usage):
+    """``(input_tokens, output_tokens)`` of an API ``usage`` object or dict, or None."""
+    if usage is None:
+        return None
+
+    def get(*names):
+        for name in names:
+            value = usage.get(name) if isinstance(usage, dict) else getattr(usage, name, None)
+            if value is not None:
+                return int(value)
+        return None
+    tokens_in = get('input_tokens', 'prompt_tokens')
+    tokens_out = get('output_tokens', 'completion_tokens')
+    if tokens_in is None and tokens_out is None:
+        return None
+    return tokens_in or 0, tokens_out or 0
+
+
+def _next_midnight(now):
+    t = time.localtime(now)
+    return time.mktime((t.tm_year, t.tm_mon, t.tm_mday + 1, 0, 0, 0, 0, 0, -1))
+
+
+class BudgetDeferred(Exception):
+    """The budget has no room for a long time; try again in ``retry_after`` seconds."""
+
+    def __init__(self, retry_after, reason):
+        super().__init__(f"{reason}; retry in {retry_after:.0f}s")
+        self.retry_after = retry_after
+        self.reason = reason
+
+
+class TokenBudget:
+    """Per-minute and per-day token limits plus a daily spend cap; 0 turns a limit off.
+
+    Prices are in US dollars per million tokens and only used for the spend
+    figures and ``usd_per_day``.
+    """
+
+    def __init__(self, per_minute=0, per_day=0, usd_per_day=0.0, input_price=0.0, output_price=0.0,
+                 max_wait_s=30.0, path=None):
+        self.per_minute = per_minute
+        self.per_day = per_day
+        self.usd_per_day = usd_per_day
+        self.input_price = input_price
+        self.output_price = output_price
+        self.max_wait_s = max_wait_s
+        self.path = path
+        self.models = {}
+        self._minute = deque()  # (time, tokens) of the last 60 seconds
+        self._minute_tokens = 0
+        self._reserved = 0
+        self._estimate = None
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()
+        self._saved_at = 0.0
+        self._day, self._day_tokens, self._day_usd = time.strftime('%Y-%m-%d'), 0, 0.0
+        self._load()
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            per_minute=env_int('ULAMLENS_BUDGET_TOKENS_PER_MIN', 0),
+            per_day=env_int('ULAMLENS_BUDGET_TOKENS_PER_DAY', 0),
+            usd_per_day=env_float('ULAMLENS_BUDGET_USD_PER_DAY', 0.0),
+            input_price=env_float('ULAMLENS_PRICE_INPUT_PER_MTOK', 0.0),
+            output_price=env_float('ULAMLENS_PRICE_OUTPUT_PER_MTOK', 0.0),
+            max_wait_s=env_float('ULAMLENS_BUDGET_MAX_WAIT_S', 30.0),
+            path=env_str('ULAMLENS_BUDGET_PATH') or os.path.join(data_dir(), 'budget.json'),
+        )
+
+    @property
+    def limited(self):
+        return bool(self.per_minute or self.per_day or self.usd_per_day)
+
+    def cost(self, input_tokens, output_tokens):
+        return (input_tokens * self.input_price + output_tokens * self.output_price) / 1e6
+
+    def record(self, model, input_tokens, output_tokens, seconds=None, estimated=False):
+        """Account one completed call."""
+        total = input_tokens + output_tokens
+        usd = self.cost(input_tokens, output_tokens)
+        with self._lock:
+            now = time.time()
+            self._roll_day(now)
+            self._minute.append((now, total))
+            self._minute_tokens += total
+            self._day_tokens += total
+            self._day_usd += usd
+            # Smoothed tokens per call, used to size the next reservation
+            self._estimate = total if self._estimate is None else 0.8 * self._estimate + 0.2 * total
+            stats = self.models.setdefault(model, {'calls': 0, 'input_tokens': 0, 'output_tokens': 0,
+                                                   'seconds': 0.0, 'usd': 0.0})
+            stats['calls'] += 1
+            stats['input_tokens'] += input_tokens
+            stats['output_tokens'] += output_tokens
+            stats['seconds'] += seconds or 0.0
+            stats['usd'] += usd
+            day_tokens, day_usd = self._day_tokens, self._day_usd
+        metrics.inc('tokens_total', input_tokens, model=model, kind='input')
+        metrics.inc('tokens_total', output_tokens, model=model, kind='output')
+        print(f"[budget] {model}: {input_tokens} in / {output_tokens} out tokens"
+              f"{' (estimated)' if estimated else ''}{f' in {seconds:.2f}s' if seconds is not None else ''}; "
+              f"today {day_tokens} tokens, ${day_usd:.4f}")
+        if time.monotonic() - self._saved_at >= SAVE_INTERVAL_S:
+            self.save()
+
+    def estimate(self):
+        """Tokens one analysis is expected to use."""
+        with self._lock:
+            return round(self._estimate) if self._estimate is not None else DEFAULT_ESTIMATE
+
+    def acquire(self, tokens=None, cancel=None):
+        """Reserve ``tokens``, waiting while the budget is full; returns the reservation, or None if cancelled.
+
+        Without limits this returns 0 straight away.
+
+        Raises ``BudgetDeferred`` when the wait would be longer than ``max_wait_s``.
+        """
+        if not self.limited:
+            return 0
+        tokens = self.estimate() if tokens is None else tokens
+        started = time.monotonic()
+        while True:
+            wait = self._try_reserve(tokens)
+            if wait is None:
+                self._waited(started)
+                return tokens
+            if cancel is not None:
+                if cancel.wait(min(wait, 1.0)):
+                    return None
+            else:
+                time.sleep(min(wait, 1.0))
+
+    async def acquire_async(self, tokens=None):
+        """``acquire`` for the event loop (cancel by cancelling the task)."""
+        if not self.limited:
+            return 0
+        tokens = self.estimate() if tokens is None else tokens
+        started = time.monotonic()
+        while True:
+            wait = self._try_reserve(tokens)
+            if wait is None:
+                self._waited(started)
+                return tokens
+            await asyncio.sleep(min(wait, 1.0))
+
+    def release(self, reservation):
+        """Return a reservation once its calls are done (they were ``record``-ed separately)."""
+        if reservation:
+            with self._lock:
+                self._reserved = max(0, self._reserved - reservation)
+
+    def _try_reserve(self, tokens):
+        # None means reserved; otherwise the seconds to wait before asking again
+        with self._lock:
+            now = time.time()
+            self._roll_day(now)
+            while self._minute and now - self._minute[0][0] >= 60:
+                self._minute_tokens -= self._minute.popleft()[1]
+            wait, reason = 0.0, None
+            if self.per_day and self._day_tokens + self._reserved + tokens > self.per_day and \
+                    self._day_tokens + self._reserved:
+                wait, reason = _next_midnight(now) - now, "daily token budget used up"
+            elif self.usd_per_day and self._day_usd + self.cost(tokens, 0) > self.usd_per_day:
+                wait, reason = _next_midnight(now) - now, "daily spend limit reached"
+            elif self.per_minute and self._minute_tokens + self._reserved + tokens > self.per_minute and \
+                    self._minute_tokens + self._reserved:
+                # Until enough of the last minute's calls fall out of the window
+                wait, freed = 0.25, 0  # reservations of calls in flight free up when they finish
+                for at, used in self._minute:
+                    freed += used
+                    if self._minute_tokens - freed + self._reserved + tokens <= self.per_minute:
+                        wait = at + 60 - now
+                        break
+                reason = "per-minute token budget used up"
+            if reason is None:
+                self._reserved += tokens
+                return None
+        if wait > self.max_wait_s:
+            metrics.inc('budget_deferred_total')
+            raise BudgetDeferred(wait, reason)
+        return max(0.01, wait)
+
+    def _waited(self, started):
+        waited = time.monotonic() - started
+        if waited > 0.01:
+            print(f"[budget] Waited {waited:.1f}s for budget.")
+        metrics.observe('budget_wait_seconds', waited)
+
+    def _roll_day(self, now):
+        day = time.strftime('%Y-%m-%d', time.localtime(now))
+        if day != self._day:
+            self._day, self._day_tokens, self._day_usd = day, 0, 0.0
+
+    def _load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                saved = json.load(f)
+            if saved.get('day') == self._day:
+                self._day_tokens = int(saved.get('tokens', 0))
+                self._day_usd = float(saved.get('usd', 0.0))
+        except (OSError, ValueError) as e:
+            print(f"[budget] Could not read {self.path}: {e}")
+
+    def save(self):
+        """Write the day's totals; never replaces a larger total for the same day (e.g. from another process)."""
+        if not self.path:
+            return
+        with self._save_lock:
+            self._saved_at = time.monotonic()
+            with self._lock:
+                day, tokens, usd = self._day, self._day_tokens, self._day_usd
+            tmp = None
+            try:
+                try:
+                    with open(self.path, encoding='utf-8') as f:
+                        saved = json.load(f)
+                    if saved.get('day') == day and int(saved.get('tokens', 0)) > tokens:
+                        return
+                except (OSError, ValueError):
+                    pass
+                fd, tmp = tempfile.mkstemp(prefix='.budget-', dir=os.path.dirname(os.path.abspath(self.path)))
+                with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                    json.dump({'day': day, 'tokens': tokens, 'usd': round(usd, 6)}, f)
+                os.replace(tmp, self.path)
+                tmp = None
+            except OSError as e:
+                print(f"[budget] Could not write {self.path}: {e}")
+            finally:
+                if tmp is not None:
+                    os.unlink(tmp)
+
+    def stats(self):
+        with self._lock:
+            models = {name: dict(s, usd=round(s['usd'], 6), avg_seconds=round(s['seconds'] / s['calls'], 3))
+                      for name, s in self.models.items()}
+            return {
+                "day": self._day,
+                "day_tokens": self._day_tokens,
+                "day_usd": round(self._day_usd, 6),
+                "minute_tokens": self._minute_tokens,
+                "reserved": self._reserved,
+                "models": models,
+            }
+
+
+_default_budget = None
+_default_lock = threading.Lock()
+
+
+def default_budget():
+    """Process-wide budget configured from the environment."""
+    global _default_budget
+    with _default_lock:
+        if _default_budget is None:
+            _default_budget = TokenBudget.from_env()
+            atexit.register(_default_budget.save)
+        return _default_budget
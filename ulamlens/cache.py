@@ -0,0 +1,158 @@
+"""On-disk cache of analysis results keyed by a perceptual hash of the photo.
+
+Two photos of the same dish taken seconds apart are never byte-identical, so
+entries are matched by the Hamming distance between 64-bit difference hashes
+(dHash) instead of an exact key.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+
+import cv2
+
+from ulamlens.config import env_bool, env_float, env_int, env_str, data_dir
+
+
+def dhash(image, hash_size=8):
+    """64-bit difference hash of a BGR (or grayscale) image."""
+    gray = image if image.ndim == 2 else cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    small = cv2.resize(gray, (hash_size + 1, hash_size), interpolation=cv2.INTER_AREA)
+    bits = (small[:, 1:] > small[:, :-1]).flatten()
+    value = 0
+    for bit in bits:
+        value = (value << 1) | int(bit)
+    return value
+
+
+def hamming(a, b):
+    return bin(a ^ b).count('1')
+
+
+def _to_signed(value):
+    # SQLite integers are signed 64-bit
+    return value - (1 << 64) if value >= (1 << 63) else value
+
+
+def _to_unsigned(value):
+    return value + (1 << 64) if value < 0 else value
+
+
+class AnalysisCache:
+    """SQLite-backed result cache with a Hamming-distance match, TTL and LRU eviction.
+
+    Hashes are mirrored in memory so a lookup is a linear scan of a few
+    hundred integers; SQLite is only touched on hits, inserts and evictions.
+    """
+
+    def __init__(self, path, max_distance=6, ttl_s=7 * 24 * 3600, max_entries=500):
+        self.path = path
+        self.max_distance = max_distance
+        self.ttl_s = ttl_s
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS results ("
+            "id INTEGER PRIMARY KEY, phash INTEGER NOT NULL, result TEXT NOT NULL, "
+            "created REAL NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS results_last_used ON results(last_used)")
+        self._db.commit()
+        self._hashes = {}
+        for row_id, phash, created in self._db.execute("SELECT id, phash, created FROM results"):
+            self._hashes[row_id] = (_to_unsigned(phash), created)
+
+    @classmethod
+    def from_env(cls):
+        path = env_str('ULAMLENS_CACHE_PATH') or os.path.join(data_dir(), 'analysis_cache.sqlite')
+        return cls(
+            path,
+            max_distance=env_int('ULAMLENS_CACHE_DISTANCE', 6),
+            ttl_s=env_float('ULAMLENS_CACHE_TTL_S', 7 * 24 * 3600),
+            max_entries=env_int('ULAMLENS_CACHE_MAX_ENTRIES', 500),
+        )
+
+    def get(self, phash):
+        """Return the cached result closest to ``phash`` within ``max_distance``, or None."""
+        now = time.time()
+        with self._lock:
+            self._expire(now)
+            best_id, best_dist = None, self.max_distance + 1
+            for row_id, (other, _) in self._hashes.items():
+                dist = hamming(phash, other)
+                if dist < best_dist:
+                    best_id, best_dist = row_id, dist
+            if best_id is None:
+                self.misses += 1
+                return None
+            row = self._db.execute("SELECT result FROM results WHERE id = ?", (best_id,)).fetchone()
+            self._db.execute("UPDATE results SET last_used = ? WHERE id = ?", (now, best_id))
+            self._db.commit()
+            self.hits += 1
+        print(f"[cache] Hit at distance {best_dist}.")
+        return json.loads(row[0])
+
+    def put(self, phash, result):
+        now = time.time()
+        with self._lock:
+            cur = self._db.execute(
+                "INSERT INTO results (phash, result, created, last_used) VALUES (?, ?, ?, ?)",
+                (_to_signed(phash), json.dumps(result), now, now),
+            )
+            self._hashes[cur.lastrowid] = (phash, now)
+            overflow = len(self._hashes) - self.max_entries
+            if overflow > 0:
+                # Least recently used entries go first
+                old_ids = [r[0] for r in self._db.execute(
+                    "SELECT id FROM results ORDER BY last_used LIMIT ?", (overflow,))]
+                self._delete(old_ids)
+            self._db.commit()
+
+    def _expire(self, now):
+        if not self.ttl_s:
+            return
+        stale = [row_id for row_id, (_, created) in self._hashes.items() if now - created > self.ttl_s]
+        if stale:
+            self._delete(stale)
+            self._db.commit()
+
+    def _delete(self, row_ids):
+        self._db.executemany("DELETE FROM results WHERE id = ?", [(i,) for i in row_ids])
+        for row_id in row_ids:
+            self._hashes.pop(row_id, None)
+        self.evictions += len(row_ids)
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._hashes),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / total, 3) if total else 0.0,
+            }
+
+
+_default_cache = None
+_default_lock = threading.Lock()
+
+
+def default_cache():
+    """Process-wide cache configured from the environment, or None when disabled."""
+    global _default_cache
+    if not env_bool('ULAMLENS_CACHE', True):
+        return None
+    with _default_lock:
+        if _default_cache is None:
+            try:
+                _default_cache = AnalysisCache.from_env()
+            except Exception as e:
+                print(f"[cache] Could not open analysis cache: {e}")
+                return None
+        return _default_cache
@@ -0,0 +1,74 @@
+"""Cancellation tokens that reach into in-flight backend calls.
+
+A ``CancelToken`` works wherever a ``threading.Event`` is expected
+(``is_set``/``set``/``wait``), and additionally runs registered callbacks the
+moment it is cancelled. Backend attempts register a callback that closes
+their open response, so a cancelled request gives up its connection and
+worker thread at once instead of running to completion.
+"""
+import threading
+
+
+class CancelToken:
+    """Event-compatible cancel flag with ``on_cancel`` callbacks and child tokens."""
+
+    def __init__(self, parent=None):
+        self._event = threading.Event()
+        self._callbacks = []
+        self._lock = threading.Lock()
+        self.reason = None
+        if parent is not None:
+            link(parent, self.cancel)
+
+    def cancel(self, reason='cancelled'):
+        with self._lock:
+            if self._event.is_set():
+                return
+            self.reason = reason
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                print(f"[cancel] Cancel callback failed: {e}")
+
+    # threading.Event interface
+    def set(self):
+        self.cancel()
+
+    def is_set(self):
+        return self._event.is_set()
+
+    def wait(self, timeout=None):
+        return self._event.wait(timeout)
+
+    @property
+    def cancelled(self):
+        return self._event.is_set()
+
+    def on_cancel(self, callback):
+        """Run ``callback()`` on cancellation (right away if already cancelled); returns an unregister function."""
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(callback)
+                return lambda: self._discard(callback)
+        callback()
+        return lambda: None
+
+    def _discard(self, callback):
+        with self._lock:
+            if callback in self._callbacks:
+                self._callbacks.remove(callback)
+
+    def child(self):
+        """A token that is cancelled together with this one (but not the other way round)."""
+        return CancelToken(parent=self)
+
+
+def link(cancel, callback):
+    """Call ``callback`` when ``cancel`` fires. Plain events cannot notify, so they are only polled."""
+    if isinstance(cancel, CancelToken):
+        return cancel.on_cancel(callback)
+    return lambda: None
+
@@ -0,0 +1,159 @@
+"""Headless command line entry point (no Qt required).
+
+    python -m ulamlens analyze DIR --out results.jsonl [--workers 4] [--recursive]
+
+Each analysed image becomes one JSON line in the output file. Re-running the
+same command resumes: images already present in the output are skipped and a
+line cut off by an interrupted run is discarded.
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+
+from ulamlens.batch import BatchRunner, RateLimiter, configured_workers, iter_images
+from ulamlens.cancel import CancelToken
+
+
+def load_done(out_path, retry_errors=False):
+    """Paths already recorded in ``out_path``; truncates a trailing partial line.
+
+    With ``retry_errors`` the error lines are removed from the file, so each
+    retried image ends up with a single line.
+    """
+    done = set()
+    if not os.path.exists(out_path):
+        return done
+    valid_end = 0
+    kept, dropped = [], 0
+    with open(out_path, 'rb') as f:
+        offset = 0
+        for raw in f:
+            offset += len(raw)
+            if not raw.endswith(b'\n'):
+                break
+            try:
+                record = json.loads(raw)
+            except ValueError:
+                break
+            valid_end = offset
+            if retry_errors and 'error' in record.get('result', {}):
+                dropped += 1
+                continue
+            kept.append(raw)
+            done.add(record.get('path'))
+    if dropped:
+        print(f"[cli] Removing {dropped} error lines from {out_path} to retry them.", file=sys.stderr)
+        tmp_path = out_path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.writelines(kept)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, out_path)
+    elif valid_end != os.path.getsize(out_path):
+        print(f"[cli] Discarding a partial line at the end of {out_path}.", file=sys.stderr)
+        with open(out_path, 'r+b') as f:
+            f.truncate(valid_end)
+    return done
+
+
+def analyze_command(args):
+    if not os.path.isdir(args.dir):
+        print(f"[cli] Not a directory: {args.dir}", file=sys.stderr)
+        return 2
+    api_key = os.environ.get('OPENAI_API_KEY')
+    from ulamlens.local_model import local_model_configured
+    if not api_key and not local_model_configured():
+        print("[cli] Neither OPENAI_API_KEY nor ULAMLENS_LOCAL_MODEL is set.", file=sys.stderr)
+        return 2
+
+    # Imported here so `--help` stays instant
+    import cv2
+    from ulamlens.budget import default_budget
+    from ulamlens.client import BackendClient
+    from ulamlens.dispatch import Dispatcher
+    from ulamlens.engine import AnalysisEngine
+    from ulamlens.metrics import start_exporters
+
+    done = load_done(args.out, args.retry_errors)
+    if done:
+        print(f"[cli] Resuming: {len(done)} images already in {args.out}.", file=sys.stderr)
+    backend = BackendClient.from_env(api_key)
+    dispatcher = Dispatcher.from_env()
+    if args.dispatch:
+        dispatcher.strategy = args.dispatch
+    engine = AnalysisEngine.from_env(api_key, client=backend, dispatcher=dispatcher)
+    # A batch always sits out the per-minute window; a used-up day budget still ends in
+    # errors, which a later run with --retry-errors picks up again
+    budget = default_budget()
+    budget.max_wait_s = max(budget.max_wait_s, 60.0)
+    start_exporters()
+
+    def analyze_path(path, cancel):
+        image = cv2.imread(path)
+        if image is None:
+            return {"error": "Could not read image file."}
+        return engine.analyze(image, cancel=cancel)
+
+    runner = BatchRunner.from_env(analyze_path, workers=args.workers)
+    if args.rate_per_min is not None:
+        runner.limiter = RateLimiter(args.rate_per_min)
+    write_lock = threading.Lock()
+    pending = (p for p in iter_images(args.dir, args.recursive) if os.path.abspath(p) not in done)
+
+    with open(args.out, 'a', encoding='utf-8') as out:
+        def on_result(path, result, seconds):
+            line = json.dumps({
+                "path": os.path.abspath(path),
+                "result": result,
+                "seconds": round(seconds, 3),
+                "finished_at": time.time(),
+            }, ensure_ascii=False)
+            with write_lock:
+                out.write(line + '\n')
+                out.flush()
+            stats = runner.stats()
+            print(f"[cli] {stats['done']} done ({stats['failed']} failed, "
+                  f"{stats['images_per_min']} images/min): {path}", file=sys.stderr)
+
+        cancel = CancelToken()
+        try:
+            runner.run(pending, on_result, cancel)
+        except KeyboardInterrupt:
+            cancel.set()
+            print("[cli] Interrupted; re-run the same command to resume.", file=sys.stderr)
+            return 130
+        finally:
+            backend.close()
+
+    stats = runner.stats()
+    print(f"[cli] Finished: {json.dumps(stats)}", file=sys.stderr)
+    print(f"[cli] Tokens: {json.dumps(budget.stats())}", file=sys.stderr)
+    return 1 if stats['failed'] else 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='python -m ulamlens', description="UlamLens headless tools.")
+    sub = parser.add_subparsers(dest='command')
+    analyze = sub.add_parser('analyze', help='analyse every image in a folder into a JSON-lines file')
+    analyze.add_argument('dir', help='folder of images')
+    analyze.add_argument('--out', required=True, help='JSON-lines output file (appended to, resumable)')
+    analyze.add_argument('--workers', type=int, default=None,
+                         help=f'images analysed in parallel (default {configured_workers()})')
+    analyze.add_argument('--rate-per-min', type=float, default=None, help='max analyses started per minute')
+    analyze.add_argument('--dispatch', choices=('sequential', 'race', 'hedge'), help='backend dispatch strategy')
+    analyze.add_argument('--recursive', action='store_true', help='include sub-folders')
+    analyze.add_argument('--retry-errors', action='store_true', help='re-analyse images whose earlier result was an error (their error lines are removed first)')
+    analyze.set_defaults(func=analyze_command)
+    return parser
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if not getattr(args, 'func', None):
+        parser.print_help()
+        return 2
+    return args.func(args)
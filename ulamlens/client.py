@@ -0,0 +1,229 @@
+"""Long-lived, pooled connections to the analysis backends.
+
+Creating a new ``openai.OpenAI`` client and calling bare ``requests.post`` on
+every analysis pays for DNS, TCP and TLS setup each time. A BackendClient is
+created once per application and keeps both the SDK's and the HTTP
+fallback's connections alive between analyses.
+"""
+import importlib
+import os
+import socket
+import sys
+import threading
+
+from ulamlens.config import env_bool, env_float, env_int
+
+DEFAULT_IMAGE_ENDPOINT = 'https://api.openai.com/v1/responses'
+
+# The SDK and requests are slow to import and not needed until the first
+# analysis, so they are loaded on first use (or by a background warm-up).
+_modules = {}
+_modules_lock = threading.Lock()
+
+
+def _load(name, missing_message):
+    with _modules_lock:
+        if name not in _modules:
+            try:
+                _modules[name] = importlib.import_module(name)
+            except Exception:
+                _modules[name] = None
+                if missing_message:
+                    print(missing_message)
+        return _modules[name]
+
+
+def load_openai():
+    """The ``openai`` module, or None if it is not installed."""
+    return _load('openai', '[init] openai package not available; analysis calls will be disabled or use fallback.')
+
+
+def load_requests():
+    """The ``requests`` module, or None if it is not installed."""
+    return _load('requests', '[init] requests package not available; HTTP fallback disabled.')
+
+
+def load_httpx():
+    """The ``httpx`` module the SDK is built on, or None if it is not importable."""
+    return _load('httpx', None)
+
+
+def is_connection_error(err):
+    """True if ``err`` means the backend could not be reached (network down, DNS, connect or read timeout).
+
+    API errors with a status (bad key, unknown model, bad request, 5xx) are
+    answers from the backend and do not count.
+    """
+    kinds = [ConnectionError, TimeoutError, socket.timeout]
+    # A library that was never loaded raised nothing; do not import it here, on the dispatch path
+    openai = sys.modules.get('openai')
+    if openai is not None:
+        kinds += [openai.APIConnectionError]  # APITimeoutError is a subclass
+    requests = sys.modules.get('requests')
+    if requests is not None:
+        kinds += [requests.ConnectionError, requests.Timeout]
+    return isinstance(err, tuple(kinds))
+
+
+def warm_imports():
+    """Import the backend libraries ahead of time (call from a background thread)."""
+    load_openai()
+    load_requests()
+
+
+def response_socket(response):
+    """The socket under a streamed ``requests``/httpx response or SDK stream, or None."""
+    response = getattr(response, 'response', response)  # SDK Stream wraps an httpx response
+    network_stream = (getattr(response, 'extensions', None) or {}).get('network_stream')
+    if network_stream is not None:
+        return network_stream.get_extra_info('socket')
+    connection = getattr(getattr(response, 'raw', None), '_connection', None)
+    return getattr(connection, 'sock', None)
+
+
+def abort_response(response):
+    """Abort a streamed response from any thread, waking up a read blocked on it.
+
+    Closing alone does not interrupt a read in progress on another thread;
+    shutting the socket down does. The broken connection is then discarded
+    by the pool instead of being reused.
+    """
+    try:
+        sock = response_socket(response)
+        if sock is not None:
+            sock.shutdown(socket.SHUT_RDWR)
+    except OSError:
+        pass  # already closed
+    except Exception as e:
+        print(f"[client] Could not shut down response socket: {e}")
+
+
+class BackendClient:
+    """Pooled OpenAI SDK client plus a ``requests.Session`` for the HTTP fallback.
+
+    ``pool_size`` bounds the keep-alive connections per host, ``retries`` and
+    ``backoff_s`` control retry with exponential backoff (both the SDK and
+    the HTTP upload only retry failed connections: every request that reaches
+    the model is billed, and error answers are left to the dispatcher's other
+    attempts),
+    and ``connect_timeout_s`` caps connection setup (the read timeout comes
+    from each attempt's latency budget).
+    """
+
+    def __init__(self, api_key, pool_size=4, retries=2, backoff_s=0.5, connect_timeout_s=5.0, warm_up_on_start=False):
+        self.api_key = api_key
+        self.warm_up_on_start = warm_up_on_start
+        self.pool_size = pool_size
+        self.retries = retries
+        self.backoff_s = backoff_s
+        self.connect_timeout_s = connect_timeout_s
+        self._lock = threading.Lock()
+        self._openai = None
+        self._http_client = None
+        self._session = None
+
+    @classmethod
+    def from_env(cls, api_key=None):
+        return cls(
+            api_key if api_key is not None else os.environ.get('OPENAI_API_KEY'),
+            pool_size=env_int('ULAMLENS_HTTP_POOL', 4),
+            retries=env_int('ULAMLENS_HTTP_RETRIES', 2),
+            backoff_s=env_float('ULAMLENS_HTTP_BACKOFF_S', 0.5),
+            connect_timeout_s=env_float('ULAMLENS_CONNECT_TIMEOUT_S', 5.0),
+            warm_up_on_start=env_bool('ULAMLENS_WARMUP', False),
+        )
+
+    @property
+    def image_endpoint(self):
+        return os.environ.get('OPENAI_IMAGE_ENDPOINT', DEFAULT_IMAGE_ENDPOINT)
+
+    def openai_client(self):
+        """Shared ``openai.OpenAI`` instance, or None if the SDK (or its client class) is missing."""
+        openai = load_openai()
+        if openai is None or not hasattr(openai, 'OpenAI'):
+            return None
+        httpx = load_httpx()
+        with self._lock:
+            if self._openai is None:
+                kwargs = {}
+                if hasattr(openai, 'DefaultHttpxClient'):
+                    http_kwargs = {}
+                    if httpx is not None:
+                        # The transport retries failed connections only; the SDK's own
+                        # retries would resend 429/5xx answers as well
+                        http_kwargs['transport'] = httpx.HTTPTransport(
+                            limits=httpx.Limits(
+                                max_connections=self.pool_size * 2,
+                                max_keepalive_connections=self.pool_size,
+                            ),
+                            retries=self.retries,
+                        )
+                    self._http_client = openai.DefaultHttpxClient(**http_kwargs)
+                    kwargs['http_client'] = self._http_client
+                self._openai = openai.OpenAI(api_key=self.api_key, max_retries=0, **kwargs)
+            return self._openai
+
+    def session(self):
+        """Shared ``requests.Session`` with a pooled, retrying adapter, or None without requests."""
+        requests = load_requests()
+        if requests is None:
+            return None
+        from requests.adapters import HTTPAdapter
+        from urllib3.util.retry import Retry
+        with self._lock:
+            if self._session is None:
+                # Only connections that never reached the server are retried; a repeated
+                # POST would be another billed model call
+                retry = Retry(
+                    total=self.retries,
+                    connect=self.retries,
+                    read=0,
+                    status=0,
+                    backoff_factor=self.backoff_s,
+                    raise_on_status=False,
+                )
+                adapter = HTTPAdapter(pool_connections=self.pool_size, pool_maxsize=self.pool_size, max_retries=retry)
+                session = requests.Session()
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                self._session = session
+            return self._session
+
+    def timeout(self, read_timeout_s):
+        """``(connect, read)`` timeout tuple for requests calls."""
+        return (self.connect_timeout_s, read_timeout_s)
+
+    def warm_up(self, background=True):
+        """Open connections (DNS, TCP, TLS) ahead of the first analysis."""
+        if background:
+            thread = threading.Thread(target=self._warm_up, daemon=True, name='ulamlens-warmup')
+            thread.start()
+            return thread
+        self._warm_up()
+
+    def _warm_up(self):
+        session = self.session()
+        if session is not None:
+            try:
+                # Any answer (even 404/405) leaves a kept-alive connection in the pool
+                session.head(self.image_endpoint, timeout=self.timeout(self.connect_timeout_s))
+                print(f"[client] Warmed up HTTP connection to {self.image_endpoint}.")
+            except Exception as e:
+                print(f"[client] HTTP warm-up failed: {e}")
+        client = self.openai_client()
+        if client is not None and self._http_client is not None:
+            try:
+                self._http_client.head(str(client.base_url), timeout=self.connect_timeout_s)
+                print(f"[client] Warmed up SDK connection to {client.base_url}.")
+            except Exception as e:
+                print(f"[client] SDK warm-up failed: {e}")
+
+    def close(self):
+        with self._lock:
+            if self._session is not None:
+                self._session.close()
+                self._session = None
+            if self._openai is not None:
+                self._openai.close()
+                self._openai = None
+                self._http_client = None
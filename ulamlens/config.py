@@ -0,0 +1,37 @@
+"""Small helpers for reading ULAMLENS_* settings from the environment."""
+import os
+
+
+def env_str(name, default=None):
+    value = os.environ.get(name)
+    return default if value is None or value == '' else value
+
+
+def env_int(name, default):
+    try:
+        return int(os.environ.get(name, default))
+    except (TypeError, ValueError):
+        print(f"[config] {name} is not an integer; using {default}.")
+        return default
+
+
+def env_float(name, default):
+    try:
+        return float(os.environ.get(name, default))
+    except (TypeError, ValueError):
+        print(f"[config] {name} is not a number; using {default}.")
+        return default
+
+
+def env_bool(name, default=False):
+    value = os.environ.get(name)
+    if value is None or value == '':
+        return default
+    return value.strip().lower() in ('1', 'true', 'yes', 'on')
+
+
+def data_dir():
+    """Directory for UlamLens' local files (cache, queues, history)."""
+    path = env_str('ULAMLENS_DATA_DIR') or os.path.join(os.path.expanduser('~'), '.ulamlens')
+    os.makedirs(path, exist_ok=True)
+    return path
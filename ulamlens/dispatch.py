@@ -0,0 +1,223 @@
+"""Run several analysis backends with a sequential, racing or hedged strategy.
+
+Each backend attempt runs on its own daemon thread and receives a cancel
+token plus its latency budget. The dispatcher returns the first attempt whose
+output passes ``accept`` and cancels the ones still running, which closes
+their connections (see ``ulamlens.cancel``).
+"""
+import queue
+import threading
+import time
+
+from ulamlens.cancel import CancelToken, link
+from ulamlens.client import is_connection_error
+from ulamlens.config import env_float, env_int, env_str
+
+STRATEGIES = ('sequential', 'race', 'hedge')
+
+
+class Attempt:
+    """One backend call. ``call(cancel_token, timeout_s)`` returns the raw model text."""
+
+    def __init__(self, name, call):
+        self.name = name
+        self.call = call
+
+
+class DispatchResult:
+    """Outcome of ``Dispatcher.run``.
+
+    Attempt statuses are ``ok``, ``invalid`` (answer not accepted), ``error``
+    (the backend answered with an error), ``unreachable`` (connection error
+    or network timeout), ``timeout`` (over the attempt budget), ``lost`` and
+    ``cancelled``.
+    """
+
+    def __init__(self, name=None, raw_text='', result=None, cancelled=False):
+        self.name = name
+        self.raw_text = raw_text
+        self.result = result
+        self.cancelled = cancelled
+        self.error = None  # message of the last attempt that raised
+        # (attempt name, seconds, status) for every attempt that was started
+        self.attempts = []
+
+    @property
+    def ok(self):
+        return self.result is not None
+
+
+class Schedule:
+    """When to start the next attempt under a strategy; shared by ``Dispatcher`` and ``ulamlens.aio``.
+
+    The caller owns the clock (``time.monotonic`` or the event loop's) and
+    reports how many attempts are running; ``due`` says how many to start
+    and ``started`` hands out their indexes in order.
+    """
+
+    def __init__(self, strategy, count, max_parallel=2, hedge_delay_s=5.0):
+        self.strategy = strategy
+        self.count = count
+        self.limit = 1 if strategy == 'sequential' else max(1, max_parallel)
+        self.hedge_delay_s = hedge_delay_s
+        self.next_index = 0
+        self.last_launch = None
+
+    def hedge_at(self, in_flight):
+        """Time the next hedged attempt is due, or None when no hedge is pending."""
+        if self.strategy != 'hedge' or self.last_launch is None or self.next_index >= self.count or \
+                in_flight >= self.limit:
+            return None
+        return self.last_launch + self.hedge_delay_s
+
+    def due(self, in_flight, now, ended=0):
+        """Attempts to start now, with ``in_flight`` running and ``ended`` that just failed or timed out."""
+        if self.last_launch is None:
+            target = self.limit if self.strategy == 'race' else 1
+        elif self.strategy == 'race':
+            target = self.limit  # race keeps every slot busy
+        else:
+            target = min(self.limit, in_flight + ended)
+            hedge_at = self.hedge_at(in_flight)
+            if hedge_at is not None and now >= hedge_at:
+                target = max(target, in_flight + 1)
+        return max(0, min(self.count - self.next_index, target - in_flight))
+
+    def started(self, now):
+        """Record a launch and return the index of the attempt to start."""
+        self.last_launch = now
+        self.next_index += 1
+        return self.next_index - 1
+
+
+class Dispatcher:
+    """Strategy for running a list of attempts.
+
+    ``sequential`` tries one attempt at a time, in order. ``race`` starts up to
+    ``max_parallel`` attempts at once. ``hedge`` starts the first attempt and
+    launches the next one whenever ``hedge_delay_s`` passes without an answer
+    (or immediately when an attempt fails). Every attempt is abandoned and
+    cancelled once it exceeds ``attempt_timeout_s``.
+    """
+
+    def __init__(self, strategy='hedge', hedge_delay_s=5.0, attempt_timeout_s=30.0, max_parallel=2):
+        if strategy not in STRATEGIES:
+            raise ValueError(f"Unknown dispatch strategy {strategy!r}; expected one of {STRATEGIES}")
+        self.strategy = strategy
+        self.hedge_delay_s = hedge_delay_s
+        self.attempt_timeout_s = attempt_timeout_s
+        self.max_parallel = max(1, max_parallel)
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            strategy=env_str('ULAMLENS_DISPATCH', 'hedge'),
+            hedge_delay_s=env_float('ULAMLENS_HEDGE_DELAY_S', 5.0),
+            attempt_timeout_s=env_float('ULAMLENS_ATTEMPT_TIMEOUT_S', 30.0),
+            max_parallel=env_int('ULAMLENS_MAX_PARALLEL', 2),
+        )
+
+    def run(self, attempts, accept, cancel=None, strategy=None):
+        """Run ``attempts`` until one is accepted.
+
+        ``accept(raw_text)`` returns the parsed result, or None to reject it.
+        ``cancel`` is an optional event or ``CancelToken`` that aborts the
+        whole dispatch; a token does so immediately, a plain event is polled.
+        ``strategy`` overrides the configured one for this call.
+        """
+        outcome = DispatchResult()
+        if not attempts:
+            return outcome
+        if strategy is not None and strategy != self.strategy:
+            return Dispatcher(strategy, self.hedge_delay_s, self.attempt_timeout_s, self.max_parallel).run(
+                attempts, accept, cancel)
+
+        results = queue.Queue()
+        # Wake the loop (which then cancels every attempt) as soon as an outside token is cancelled
+        unlink = link(cancel, lambda: results.put(None))
+        try:
+            return self._run(attempts, accept, cancel, outcome, results)
+        finally:
+            unlink()
+
+    def _run(self, attempts, accept, cancel, outcome, results):
+        in_flight = {}  # index -> (cancel token, start time)
+        schedule = Schedule(self.strategy, len(attempts), self.max_parallel, self.hedge_delay_s)
+
+        def launch(index):
+            attempt = attempts[index]
+            event = CancelToken()
+            in_flight[index] = (event, time.monotonic())
+            budget = self.attempt_timeout_s
+
+            def work():
+                try:
+                    results.put((index, attempt.call(event, budget), None))
+                except Exception as err:
+                    results.put((index, None, err))
+
+            threading.Thread(target=work, daemon=True, name=f"ulamlens-{attempt.name}").start()
+            print(f"[dispatch] Started {attempt.name} ({self.strategy}).")
+
+        def launch_due(ended=0):
+            for _ in range(schedule.due(len(in_flight), time.monotonic(), ended)):
+                launch(schedule.started(time.monotonic()))
+
+        def finish(index, status):
+            event, started = in_flight.pop(index)
+            outcome.attempts.append((attempts[index].name, round(time.monotonic() - started, 3), status))
+            return event
+
+        def cancel_all(status):
+            for index in list(in_flight):
+                finish(index, status).cancel(status)
+
+        launch_due()
+        while in_flight:
+            if cancel is not None and cancel.is_set():
+                cancel_all('cancelled')
+                outcome.cancelled = True
+                return outcome
+            now = time.monotonic()
+            deadline = min(started + self.attempt_timeout_s for _, started in in_flight.values())
+            hedge_at = schedule.hedge_at(len(in_flight))
+            if hedge_at is not None:
+                deadline = min(deadline, hedge_at)
+            # Wake up regularly so an outside cancel is noticed promptly
+            wait = max(0.0, min(deadline - now, 0.25))
+            ended = 0
+            try:
+                item = results.get(timeout=wait)
+                if item is None:
+                    continue  # outside cancel; handled at the top of the loop
+                index, raw_text, err = item
+            except queue.Empty:
+                now = time.monotonic()
+                for index, (event, started) in list(in_flight.items()):
+                    if now - started >= self.attempt_timeout_s:
+                        print(f"[dispatch] {attempts[index].name} exceeded {self.attempt_timeout_s}s budget.")
+                        finish(index, 'timeout').cancel('timeout')
+                        ended += 1
+            else:
+                if index not in in_flight:
+                    # Late answer from an attempt that already timed out
+                    continue
+                result = None
+                if err is not None:
+                    print(f"[dispatch] {attempts[index].name} failed: {err}")
+                    outcome.error = str(err)
+                    finish(index, 'unreachable' if is_connection_error(err) else 'error')
+                else:
+                    result = accept(raw_text)
+                    finish(index, 'ok' if result is not None else 'invalid')
+                    outcome.raw_text = raw_text or outcome.raw_text
+                if result is not None:
+                    outcome.name = attempts[index].name
+                    outcome.raw_text = raw_text
+                    outcome.result = result
+                    cancel_all('lost')
+                    return outcome
+                ended = 1
+            # Failed attempts are replaced right away; a due hedge starts the next one
+            launch_due(ended)
+        return outcome
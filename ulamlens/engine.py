@@ -0,0 +1,349 @@
+"""Analysis engine: tiered backends behind one ``analyze(image)`` call, plus a job queue.
+
+The engine is Qt-free. The camera page submits jobs to an ``AnalysisQueue``
+(through ``ui.jobs`` signals), the upload page and the CLI call
+``AnalysisEngine.analyze`` from their own workers, and benchmarks can drive
+either directly.
+
+Backends are tried in order. A backend's answer is used when it has no
+``error`` and is not marked ``tentative``; tentative answers (e.g. an unsure
+on-device guess) and errors fall through to the next backend and are only
+returned when nothing better comes along.
+
+With an offline queue (``ulamlens.offline``), a photo that no backend could
+be reached for is kept on disk and analysed once the connection returns;
+the caller gets an error saying so, with the queue job id under ``'queued'``.
+Photos the token budget (``ulamlens.budget``) defers are kept the same way.
+"""
+import asyncio
+import functools
+import itertools
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from ulamlens.analysis import NO_KEY_RESULT, analyze_remote
+from ulamlens.cache import default_cache, dhash
+from ulamlens.cancel import CancelToken
+from ulamlens.config import env_bool, env_int
+from ulamlens.local_model import default_classifier, local_model_configured, local_result
+from ulamlens.metrics import metrics
+from ulamlens.nutrition import enrich
+from ulamlens.offline import OfflineQueue, is_retryable
+
+CANCELLED_RESULT = {"error": "Analysis cancelled by user."}
+
+
+class Backend:
+    """Interface of an analysis backend.
+
+    ``analyze`` returns a result dict in the usual schema (errors under
+    ``'error'``; ``'tentative': True`` for answers that should be escalated),
+    or None when the backend has nothing to say. It is called from worker
+    threads and should give up promptly once ``cancel`` is set.
+    """
+    name = 'backend'
+    # Whether answers are worth keeping in the result cache
+    cacheable = False
+
+    def available(self):
+        return True
+
+    def analyze(self, image, cancel=None, on_field=None):
+        raise NotImplementedError
+
+    async def analyze_async(self, image, cancel=None, on_field=None):
+        """``analyze`` for the event loop; blocking backends run in the loop's default executor."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, functools.partial(self.analyze, image, cancel=cancel, on_field=on_field))
+
+
+class LocalBackend(Backend):
+    """On-device classifier (``ulamlens.local_model``); unsure answers are tentative."""
+    name = 'local'
+
+    def __init__(self, classifier=None):
+        self.classifier = classifier
+
+    def available(self):
+        return self.classifier is not None or local_model_configured()
+
+    def analyze(self, image, cancel=None, on_field=None):
+        classifier = self.classifier or default_classifier()
+        if classifier is None:
+            return None
+        try:
+            label, confidence = classifier.classify(image)
+        except Exception as e:
+            print(f"[Analyze] Local classifier failed: {e}")
+            return None
+        result = enrich(local_result(label, confidence))
+        if confidence < classifier.min_confidence:
+            result["tentative"] = True
+            result["warnings"] = ("Low-confidence guess from the on-device model. " + result["warnings"]).strip()
+        return result
+
+
+class RemoteBackend(Backend):
+    """Remote vision models through the pooled ``client`` and the ``dispatcher`` strategy."""
+    name = 'remote'
+    cacheable = True
+
+    def __init__(self, api_key, client=None, dispatcher=None):
+        self.api_key = api_key
+        self.client = client
+        self.dispatcher = dispatcher
+
+    def available(self):
+        return bool(self.api_key)
+
+    def analyze(self, image, cancel=None, on_field=None):
+        # Backends are tried according to ULAMLENS_DISPATCH (sequential, race or hedge)
+        return analyze_remote(image, self.api_key, dispatcher=self.dispatcher, cancel=cancel,
+                              backend=self.client, on_field=on_field)
+
+
+class AnalysisEngine:
+    """Runs ``backends`` in order for one image, with the perceptual-hash result cache in front."""
+
+    def __init__(self, backends, cache=None, offline=None):
+        self.backends = list(backends)
+        self.cache = cache
+        self.offline = offline
+
+    @classmethod
+    def from_env(cls, api_key=None, client=None, dispatcher=None, offline=False):
+        """Cache, on-device model (if configured) and remote models, as configured by the environment.
+
+        ``offline=True`` adds the on-disk queue for photos taken while the
+        backend is unreachable (someone then has to run an ``OfflineDrainer``).
+        """
+        backends = []
+        if local_model_configured():
+            backends.append(LocalBackend())
+        if env_bool('ULAMLENS_ASYNC', False):
+            from ulamlens.aio import AsyncRemoteBackend  # builds on this module
+            backends.append(AsyncRemoteBackend(api_key, dispatcher=dispatcher, http=client))
+        else:
+            backends.append(RemoteBackend(api_key, client=client, dispatcher=dispatcher))
+        queue = None
+        if offline:
+            queue = OfflineQueue.from_env()
+        return cls(backends, cache=default_cache(), offline=queue)
+
+    def available(self):
+        """True if at least one backend can answer (e.g. an API key or a local model is set)."""
+        return any(backend.available() for backend in self.backends)
+
+    def lookup(self, image):
+        """``(cached_result or None, image_hash)``; the hash is None without a cache."""
+        if self.cache is None:
+            return None, None
+        image_hash = dhash(image)
+        cached = self.cache.get(image_hash)
+        metrics.inc('cache_lookups_total', result='miss' if cached is None else 'hit')
+        print(f"[Analyze] Cache stats: {self.cache.stats()}")
+        return cached, image_hash
+
+    def analyze(self, image, cancel=None, image_hash=None, on_field=None):
+        """Result dict for a BGR image (errors under ``'error'``); blocks the calling thread.
+
+        Pass ``image_hash`` when the caller already did ``lookup``. ``on_field``
+        receives result fields while they stream in, from a worker thread.
+        """
+        if image_hash is None:
+            cached, image_hash = self.lookup(image)
+            if cached is not None:
+                return cached
+        tiers = _Tiers(self, image_hash, cancel)
+        for backend in tiers.candidates():
+            started = time.perf_counter()
+            result = backend.analyze(image, cancel=cancel, on_field=on_field)
+            result = tiers.offer(backend, result, time.perf_counter() - started)
+            if result is not None:
+                return result
+        return self._queue_if_unreachable(image, image_hash, tiers.final())
+
+    async def analyze_async(self, image, cancel=None, image_hash=None, on_field=None):
+        """``analyze`` as a coroutine; backends with a native ``analyze_async`` never block the loop."""
+        if image_hash is None:
+            loop = asyncio.get_running_loop()
+            cached, image_hash = await loop.run_in_executor(None, self.lookup, image)
+            if cached is not None:
+                return cached
+        tiers = _Tiers(self, image_hash, cancel)
+        for backend in tiers.candidates():
+            started = time.perf_counter()
+            result = await backend.analyze_async(image, cancel=cancel, on_field=on_field)
+            result = tiers.offer(backend, result, time.perf_counter() - started)
+            if result is not None:
+                return result
+        result = tiers.final()
+        if is_retryable(result) and self.offline is not None:
+            loop = asyncio.get_running_loop()
+            result = await loop.run_in_executor(None, self._queue_if_unreachable, image, image_hash, result)
+        result.pop('_upload', None)
+        return result
+
+    def _queue_if_unreachable(self, image, image_hash, result):
+        """Keep the photo in the offline queue when no backend could be reached or the budget is used up.
+
+        The upload the remote tier already prepared (``'_upload'``) is stored
+        as is; only results without one are encoded again from ``image``.
+        """
+        upload = result.pop('_upload', None)
+        if not is_retryable(result) or self.offline is None:
+            return result
+        meta = {'image_hash': image_hash, 'taken_at': time.time()}
+        job_id = self.offline.put(*upload, meta) if upload else self.offline.put_image(image, meta)
+        if job_id is None:
+            return result
+        if result.get('deferred'):
+            return {
+                "error": "The analysis budget is used up for now. The photo was saved and will be analysed later.",
+                "deferred": True,
+                "retry_after": result.get('retry_after'),
+                "queued": job_id,
+            }
+        return {
+            "error": "No connection to the analysis service. The photo was saved and will be analysed "
+                     "when the connection returns.",
+            "unreachable": True,
+            "queued": job_id,
+        }
+
+
+class _Tiers:
+    """Fallback bookkeeping of one ``AnalysisEngine.analyze`` call."""
+
+    def __init__(self, engine, image_hash, cancel):
+        self.engine = engine
+        self.image_hash = image_hash
+        self.cancel = cancel
+        self.fallback = None
+        self.tried = False
+
+    def candidates(self):
+        for backend in self.engine.backends:
+            if self.cancel is not None and self.cancel.is_set():
+                return
+            if backend.available():
+                self.tried = True
+                yield backend
+
+    def offer(self, backend, result, seconds):
+        """``result`` if it is the final answer, otherwise None (keep going)."""
+        if metrics.enabled:
+            outcome = 'none' if result is None else 'error' if 'error' in result else \
+                'tentative' if result.get('tentative') else 'ok'
+            metrics.observe('analysis_seconds', seconds, tier=backend.name)
+            metrics.inc('analyses_total', tier=backend.name, outcome=outcome)
+        if result is None:
+            return None
+        if 'error' in result or result.get('tentative'):
+            # Keep the best answer so far: a tentative guess beats an error
+            if self.fallback is None or 'error' in self.fallback:
+                self.fallback = result
+            return None
+        cache = self.engine.cache
+        if backend.cacheable and cache is not None and self.image_hash is not None:
+            cache.put(self.image_hash, result)
+        return result
+
+    def final(self):
+        if self.cancel is not None and self.cancel.is_set():
+            return dict(CANCELLED_RESULT)
+        if not self.tried:
+            return dict(NO_KEY_RESULT)
+        if self.fallback is None:
+            return {"error": "No backend could analyse the image."}
+        if self.fallback.pop('tentative', False):
+            print("[Analyze] No confident answer; using the on-device guess.")
+        return self.fallback
+
+
+class Job:
+    """One queued analysis. ``token`` cancels it; ``future`` resolves to the result dict."""
+
+    def __init__(self, job_id, token):
+        self.id = job_id
+        self.token = token
+        self.future = None
+        self.submitted_at = time.monotonic()
+
+    @property
+    def cancelled(self):
+        return self.token.cancelled
+
+
+class AnalysisQueue:
+    """Bounded pool of analysis workers; ``submit`` never blocks the caller.
+
+    ``on_field(job, key, value)`` and ``on_done(job, result)`` are called
+    from the worker thread. ``on_done`` is skipped for cancelled jobs, so a
+    cancelled or superseded analysis never reports a result.
+    """
+
+    def __init__(self, engine, workers=2):
+        self.engine = engine
+        self.workers = max(1, workers)
+        self.jobs = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='ulamlens-analysis')
+
+    @classmethod
+    def from_env(cls, engine):
+        """Thread pool queue, or the event-loop queue (``ulamlens.aio``) with ULAMLENS_ASYNC on."""
+        if env_bool('ULAMLENS_ASYNC', False):
+            from ulamlens.aio import AsyncAnalysisQueue
+            return AsyncAnalysisQueue.from_env(engine)
+        return cls(engine, workers=env_int('ULAMLENS_ANALYSIS_WORKERS', 2))
+
+    def submit(self, image, image_hash=None, on_field=None, on_done=None):
+        job = Job(f"job-{next(self._ids)}", CancelToken())
+        with self._lock:
+            self.jobs[job.id] = job
+
+        def run():
+            try:
+                if job.cancelled:
+                    return dict(CANCELLED_RESULT)
+                fields = (lambda k, v: on_field(job, k, v)) if on_field is not None else None
+                try:
+                    result = self.engine.analyze(image, cancel=job.token, image_hash=image_hash, on_field=fields)
+                except Exception as e:
+                    print(f"[Analyze] Exception: {e}")
+                    result = {"error": str(e)}
+                if job.cancelled:
+                    print(f"[Analyze] {job.id} {job.token.reason}; result discarded.")
+                elif on_done is not None:
+                    on_done(job, result)
+                return result
+            finally:
+                with self._lock:
+                    self.jobs.pop(job.id, None)
+
+        job.future = self._pool.submit(run)
+        return job
+
+    def cancel(self, job_id, reason='cancelled'):
+        with self._lock:
+            job = self.jobs.get(job_id)
+        if job is not None:
+            job.token.cancel(reason)
+
+    def cancel_all(self, reason='cancelled'):
+        with self._lock:
+            jobs = list(self.jobs.values())
+        for job in jobs:
+            job.token.cancel(reason)
+
+    def in_flight(self):
+        with self._lock:
+            return len(self.jobs)
+
+    def shutdown(self, wait=False):
+        self.cancel_all('shutdown')
+        # Queued jobs still start, but see their cancelled token and return at once
+        self._pool.shutdown(wait=wait)
@@ -0,0 +1,237 @@
+"""Local history of analysed dishes.
+
+Every result shown on the camera page is kept with its time, dish name,
+macros, the time it took and a small JPEG thumbnail. Rows live in SQLite
+(indexed on time), thumbnails are appended to one packed file next to it
+and read back through a memory map, so 100k entries are two files rather
+than 100k small ones.
+
+Queries are sized for the history view: ``ids()`` returns every row id
+newest first as a compact integer array, and ``entries(ids)`` loads one
+page of rows by primary key range, so a list can show any row without
+loading the others. ``calories_between`` and ``top_dishes`` are answered
+from a covering index without touching the row data.
+"""
+import json
+import mmap
+import os
+import sqlite3
+import threading
+import time
+from array import array
+
+import cv2
+
+from ulamlens.config import data_dir, env_bool, env_str
+
+THUMB_WIDTH = 64
+THUMB_QUALITY = 60
+
+COLUMNS = "id, ts, ulam_name, calories, protein_g, carbs_g, fat_g, latency_s, source, thumb_offset, thumb_len, result"
+
+
+def _number(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None  # "N/A", "estimate", missing
+
+
+def start_of_day(now=None, days_ago=0):
+    """Local midnight ``days_ago`` days before ``now`` as a timestamp."""
+    t = time.localtime(time.time() if now is None else now)
+    return time.mktime((t.tm_year, t.tm_mon, t.tm_mday - days_ago, 0, 0, 0, 0, 0, -1))
+
+
+def encode_thumbnail(image, width=THUMB_WIDTH):
+    """Small JPEG of a BGR image, or None."""
+    if image is None:
+        return None
+    h, w = image.shape[:2]
+    small = cv2.resize(image, (width, max(1, round(h * width / w))), interpolation=cv2.INTER_AREA)
+    ok, data = cv2.imencode('.jpg', small, [cv2.IMWRITE_JPEG_QUALITY, THUMB_QUALITY])
+    return data.tobytes() if ok else None
+
+
+class ThumbnailPack:
+    """Append-only file of thumbnails addressed by ``(offset, length)``; reads go through a memory map."""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._file = open(path, 'ab+')
+        self._map = None
+        self._mapped = 0
+
+    def append(self, data):
+        with self._lock:
+            self._file.seek(0, os.SEEK_END)
+            offset = self._file.tell()
+            self._file.write(data)
+            self._file.flush()
+            return offset
+
+    def read(self, offset, length):
+        with self._lock:
+            if offset + length > self._mapped:
+                self._remap()
+            if offset + length > self._mapped:
+                return None  # the pack was truncated (e.g. copied while being written)
+            return self._map[offset:offset + length]
+
+    def _remap(self):
+        size = os.fstat(self._file.fileno()).st_size
+        if not size:
+            return
+        if self._map is not None:
+            self._map.close()
+        self._map = mmap.mmap(self._file.fileno(), size, access=mmap.ACCESS_READ)
+        self._mapped = size
+
+    def size(self):
+        return os.fstat(self._file.fileno()).st_size
+
+    def close(self):
+        with self._lock:
+            if self._map is not None:
+                self._map.close()
+                self._map = None
+                self._mapped = 0
+            self._file.close()
+
+
+class HistoryStore:
+    """SQLite index of past analyses plus a ``ThumbnailPack``; safe to use from any thread."""
+
+    def __init__(self, folder):
+        self.folder = folder
+        os.makedirs(folder, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(os.path.join(folder, 'history.sqlite'), check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, ts REAL NOT NULL, ulam_name TEXT NOT NULL, "
+            "calories REAL, protein_g REAL, carbs_g REAL, fat_g REAL, latency_s REAL, source TEXT, "
+            "thumb_offset INTEGER, thumb_len INTEGER, result TEXT NOT NULL)"
+        )
+        # Covering index: daily totals and dish rankings never read the table itself
+        self._db.execute("CREATE INDEX IF NOT EXISTS entries_ts ON entries(ts, ulam_name, calories)")
+        self._db.commit()
+        self.thumbs = ThumbnailPack(os.path.join(folder, 'history.thumbs'))
+
+    @classmethod
+    def from_env(cls):
+        return cls(env_str('ULAMLENS_HISTORY_DIR') or os.path.join(data_dir(), 'history'))
+
+    def add(self, result, image=None, latency_s=None, ts=None, source='camera'):
+        """Record a successful result (errors are not history); returns the new id or None."""
+        if not result or 'error' in result or not result.get('ulam_name'):
+            return None
+        thumb = encode_thumbnail(image)
+        offset = self.thumbs.append(thumb) if thumb else None
+        macros = result.get('macros') or {}
+        row = (
+            time.time() if ts is None else ts, str(result['ulam_name']),
+            _number(macros.get('calories')), _number(macros.get('protein_g')),
+            _number(macros.get('carbs_g')), _number(macros.get('fat_g')),
+            latency_s, source, offset, len(thumb) if thumb else None, json.dumps(result),
+        )
+        with self._lock:
+            cur = self._db.execute(
+                "INSERT INTO entries (ts, ulam_name, calories, protein_g, carbs_g, fat_g, latency_s, source, "
+                "thumb_offset, thumb_len, result) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", row)
+            self._db.commit()
+            return cur.lastrowid
+
+    def count(self):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+
+    def ids(self):
+        """Every entry id, newest first, as an ``array('q')`` (8 bytes per entry)."""
+        with self._lock:
+            rows = self._db.execute("SELECT id FROM entries ORDER BY id DESC")
+            return array('q', (r[0] for r in rows))
+
+    def entries(self, ids):
+        """Entry dicts for a contiguous slice of ``ids()`` (newest first), in the same order."""
+        if not ids:
+            return []
+        low, high = min(ids), max(ids)
+        with self._lock:
+            rows = self._db.execute(
+                f"SELECT {COLUMNS} FROM entries WHERE id BETWEEN ? AND ? ORDER BY id DESC", (low, high)).fetchall()
+        wanted = set(ids)
+        return [self._entry(r) for r in rows if r[0] in wanted]
+
+    def page(self, before_id=None, limit=50):
+        """Up to ``limit`` entries older than ``before_id`` (keyset paging), newest first."""
+        with self._lock:
+            rows = self._db.execute(
+                f"SELECT {COLUMNS} FROM entries WHERE id < ? ORDER BY id DESC LIMIT ?",
+                (before_id if before_id is not None else 1 << 62, limit)).fetchall()
+        return [self._entry(r) for r in rows]
+
+    @staticmethod
+    def _entry(row):
+        return {
+            'id': row[0], 'ts': row[1], 'ulam_name': row[2],
+            'macros': {'calories': row[3], 'protein_g': row[4], 'carbs_g': row[5], 'fat_g': row[6]},
+            'latency_s': row[7], 'source': row[8], 'thumb': (row[9], row[10]) if row[9] is not None else None,
+            'result': row[11],  # JSON text; decode only when the full result is needed
+        }
+
+    def thumbnail(self, entry):
+        """JPEG bytes of an entry's thumbnail, or None."""
+        if not entry.get('thumb'):
+            return None
+        return self.thumbs.read(*entry['thumb'])
+
+    def calories_between(self, start, end=None):
+        """``(total calories, number of dishes)`` eaten in ``[start, end)``."""
+        with self._lock:
+            total, dishes = self._db.execute(
+                "SELECT SUM(calories), COUNT(*) FROM entries WHERE ts >= ? AND ts < ?",
+                (start, end if end is not None else float('inf'))).fetchone()
+        return total or 0.0, dishes
+
+    def today_calories(self, now=None):
+        return self.calories_between(start_of_day(now))
+
+    def top_dishes(self, since, limit=5):
+        """``[(ulam_name, times, total calories)]`` since ``since``, most frequent first."""
+        with self._lock:
+            return self._db.execute(
+                "SELECT ulam_name, COUNT(*) AS n, SUM(calories) FROM entries WHERE ts >= ? "
+                "GROUP BY ulam_name ORDER BY n DESC, ulam_name LIMIT ?", (since, limit)).fetchall()
+
+    def top_dishes_this_week(self, limit=5, now=None):
+        return self.top_dishes(start_of_day(now, days_ago=6), limit)
+
+    def stats(self):
+        return {"entries": self.count(), "thumbs_bytes": self.thumbs.size()}
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+        self.thumbs.close()
+
+
+_default_history = None
+_default_lock = threading.Lock()
+
+
+def default_history():
+    """Process-wide history store, or None when ULAMLENS_HISTORY is off or it cannot be opened."""
+    global _default_history
+    if not env_bool('ULAMLENS_HISTORY', True):
+        return None
+    with _default_lock:
+        if _default_history is None:
+            try:
+                _default_history = HistoryStore.from_env()
+            except Exception as e:
+                print(f"[history] Could not open history: {e}")
+                return None
+        return _default_history
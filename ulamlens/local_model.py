@@ -0,0 +1,154 @@
+"""On-device ulam classifier used as the first analysis tier.
+
+A compact image classifier exported to ONNX (e.g. a MobileNet fine-tuned on
+ulam photos) runs on the CPU through ONNX Runtime when it is installed, or
+OpenCV's DNN module otherwise. When its top class is confident enough the
+answer is used directly and the remote model is never called; otherwise
+the analysis escalates to the remote backends.
+
+Configure with ULAMLENS_LOCAL_MODEL (path to the ``.onnx`` file) and
+ULAMLENS_LOCAL_LABELS (one class name per line, in the model's output
+order; defaults to ``labels.txt`` next to the model).
+"""
+import os
+import threading
+import time
+
+import cv2
+import numpy as np
+
+from ulamlens.config import env_float, env_int, env_str
+
+ENGINES = ('auto', 'onnxruntime', 'opencv')
+# ImageNet statistics, which most small pretrained backbones expect
+MEAN = (0.485, 0.456, 0.406)
+STD = (0.229, 0.224, 0.225)
+
+
+def load_labels(path):
+    with open(path, encoding='utf-8') as f:
+        return [line.strip() for line in f if line.strip()]
+
+
+def softmax(logits):
+    logits = np.asarray(logits, dtype=np.float64).ravel()
+    if logits.min() >= 0 and abs(logits.sum() - 1.0) < 1e-3:
+        return logits  # the model already ends in a softmax
+    exp = np.exp(logits - logits.max())
+    return exp / exp.sum()
+
+
+class LocalClassifier:
+    """Top-1 classifier over ``labels``; ``classify(image)`` returns ``(label, confidence)``.
+
+    ``engine`` is ``onnxruntime``, ``opencv`` or ``auto`` (ONNX Runtime if
+    importable). ``input_size`` is the square model input; inputs are RGB,
+    scaled to 0-1 and normalised with the ImageNet mean and std.
+    """
+
+    def __init__(self, model_path, labels, input_size=224, min_confidence=0.85, engine='auto', threads=2):
+        if engine not in ENGINES:
+            raise ValueError(f"Unknown local engine {engine!r}; expected one of {ENGINES}")
+        self.model_path = model_path
+        self.labels = list(labels)
+        self.input_size = input_size
+        self.min_confidence = min_confidence
+        self.threads = threads
+        self._lock = threading.Lock()
+        self._run = self._load(engine)
+
+    @classmethod
+    def from_env(cls):
+        """Classifier configured by ULAMLENS_LOCAL_*, or None when no model is configured."""
+        model_path = env_str('ULAMLENS_LOCAL_MODEL')
+        if not model_path:
+            return None
+        labels_path = env_str('ULAMLENS_LOCAL_LABELS') or os.path.join(os.path.dirname(model_path), 'labels.txt')
+        return cls(
+            model_path,
+            load_labels(labels_path),
+            input_size=env_int('ULAMLENS_LOCAL_INPUT', 224),
+            min_confidence=env_float('ULAMLENS_LOCAL_MIN_CONFIDENCE', 0.85),
+            engine=env_str('ULAMLENS_LOCAL_ENGINE', 'auto'),
+            threads=env_int('ULAMLENS_LOCAL_THREADS', 2),
+        )
+
+    def _load(self, engine):
+        if engine in ('auto', 'onnxruntime'):
+            try:
+                import onnxruntime
+            except ImportError:
+                if engine == 'onnxruntime':
+                    raise
+            else:
+                options = onnxruntime.SessionOptions()
+                options.intra_op_num_threads = self.threads
+                session = onnxruntime.InferenceSession(self.model_path, options, providers=['CPUExecutionProvider'])
+                input_name = session.get_inputs()[0].name
+                self.engine = 'onnxruntime'
+                return lambda blob: session.run(None, {input_name: blob})[0]
+        # OpenCV's default backend and target are the plain CPU ones
+        net = cv2.dnn.readNetFromONNX(self.model_path)
+        self.engine = 'opencv'
+
+        def run(blob):
+            net.setInput(blob)
+            return net.forward()
+        return run
+
+    def blob(self, image):
+        """NCHW float32 model input for a BGR image."""
+        size = (self.input_size, self.input_size)
+        blob = cv2.dnn.blobFromImage(image, 1.0 / 255, size, swapRB=True, crop=True)
+        mean = np.asarray(MEAN, dtype=np.float32).reshape(1, 3, 1, 1)
+        std = np.asarray(STD, dtype=np.float32).reshape(1, 3, 1, 1)
+        return (blob - mean) / std
+
+    def classify(self, image):
+        """``(label, confidence)`` of the most likely class."""
+        blob = self.blob(image)
+        t0 = time.perf_counter()
+        # Neither engine's session is guaranteed to be safe for concurrent runs
+        with self._lock:
+            output = self._run(blob)
+        probs = softmax(output)
+        best = int(probs.argmax())
+        label = self.labels[best] if best < len(self.labels) else f"class {best}"
+        print(f"[local] {label} ({probs[best]:.2f}) in {(time.perf_counter() - t0) * 1000:.0f} ms via {self.engine}")
+        return label, float(probs[best])
+
+
+def local_result(label, confidence):
+    """Result dict in the usual schema for a locally identified dish."""
+    return {
+        "ulam_name": label,
+        "macros": {"calories": "N/A", "protein_g": "N/A", "carbs_g": "N/A", "fat_g": "N/A"},
+        "health_facts": "",
+        "warnings": "",
+        "source": "local",
+        "confidence": round(confidence, 3),
+    }
+
+
+def local_model_configured():
+    """Cheap check (nothing is loaded) whether a local model is set up."""
+    return bool(env_str('ULAMLENS_LOCAL_MODEL'))
+
+
+_default_classifier = None
+_default_loaded = False
+_default_lock = threading.Lock()
+
+
+def default_classifier():
+    """Process-wide classifier from the environment (loaded on first use), or None."""
+    global _default_classifier, _default_loaded
+    with _default_lock:
+        if not _default_loaded:
+            _default_loaded = True
+            try:
+                _default_classifier = LocalClassifier.from_env()
+            except Exception as e:
+                print(f"[local] Could not load the local model: {e}")
+                _default_classifier = None
+        return _default_classifier
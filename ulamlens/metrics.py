@@ -0,0 +1,288 @@
+"""Counters and histograms for the capture-to-result pipeline.
+
+Off by default and then free: every recording call returns after one
+attribute check. Turn on with ULAMLENS_METRICS=1; the numbers can then be
+written to ULAMLENS_METRICS_FILE (JSON, or Prometheus text for a ``.prom``
+file) every ULAMLENS_METRICS_INTERVAL_S seconds and at exit, and/or served
+on ``http://127.0.0.1:ULAMLENS_METRICS_PORT/metrics`` (``/metrics.json`` for
+JSON).
+
+Recorded series (labels in brackets):
+
+- ``capture_seconds``: Capture press until the frame is frozen (including quality retries)
+- ``capture_quality_total`` [result], ``quality_gate_total`` [result]: frames failing the quality gate
+- ``preprocess_seconds``, ``encode_seconds``, ``upload_bytes``: upload preparation
+- ``backend_request_seconds`` [backend, status], ``backend_requests_total`` [backend, status]
+- ``parse_seconds``: extracting the result JSON from the model text
+- ``analysis_seconds`` [tier], ``analyses_total`` [tier, outcome]: one engine call
+- ``click_to_result_seconds``: Analyze click until the result is shown
+- ``cache_lookups_total`` [result]
+- ``auto_captures_total``: hands-free captures triggered by the motion detector
+- ``offline_queue_depth`` (gauge), ``offline_enqueued_total``, ``offline_retries_total``,
+  ``offline_jobs_total`` [outcome], ``offline_wait_seconds``: the offline queue (enqueue until answered)
+- ``tokens_total`` [model, kind]: input and output tokens of completed model calls
+- ``budget_wait_seconds``, ``budget_deferred_total``: time spent waiting for the token budget, and
+  analyses put off because the wait would have been too long
+"""
+import atexit
+import bisect
+import json
+import os
+import threading
+import time
+
+from ulamlens.config import env_bool, env_float, env_int, env_str
+
+# Upper bounds of the histogram buckets
+SECONDS_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+BYTES_BUCKETS = (10_000, 25_000, 50_000, 100_000, 250_000, 500_000, 1_000_000, 4_000_000)
+
+
+class Histogram:
+    """Fixed-bucket histogram with count, sum, min and max."""
+
+    def __init__(self, buckets=SECONDS_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # the last one is +Inf
+        self.count = 0
+        self.sum = 0.0
+        self.min = None
+        self.max = None
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def quantile(self, q):
+        """Estimate of the ``q`` quantile, interpolated inside its bucket."""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            if n and seen + n >= rank:
+                low = self.buckets[i - 1] if i > 0 else min(self.min, self.buckets[0])
+                high = self.buckets[i] if i < len(self.buckets) else self.max
+                low, high = max(low, self.min), min(high, self.max)
+                return low + (high - low) * (rank - seen) / n
+            seen += n
+        return self.max
+
+    def to_dict(self):
+        return {
+            'count': self.count,
+            'sum': round(self.sum, 6),
+            'min': self.min,
+            'max': self.max,
+            'p50': _round(self.quantile(0.5)),
+            'p95': _round(self.quantile(0.95)),
+            'p99': _round(self.quantile(0.99)),
+        }
+
+
+def _round(value):
+    return None if value is None else round(value, 6)
+
+
+def _label_text(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{k}="{v}"' for k, v in pairs) + '}'
+
+
+class Metrics:
+    """Registry of labelled counters, gauges and histograms; safe to use from any thread."""
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self.started_at = time.time()
+        self._counters = {}
+        self._gauges = {}
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    def inc(self, name, value=1, **labels):
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def set(self, name, value, **labels):
+        """Set a gauge (a value that goes up and down, e.g. a queue depth)."""
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._gauges[key] = value
+
+    def observe(self, name, value, buckets=SECONDS_BUCKETS, **labels):
+        if not self.enabled or value is None:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram(buckets)
+            histogram.observe(value)
+
+    def timer(self, name, **labels):
+        """Context manager observing the seconds spent inside it."""
+        if not self.enabled:
+            return _NULL_TIMER
+        return _Timer(self, name, labels)
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._gauges.clear()
+            self._histograms.clear()
+
+    def snapshot(self):
+        """Plain-dict view: ``{'counters': [...], 'gauges': [...], 'histograms': [...]}``."""
+        with self._lock:
+            counters = [{'name': n, 'labels': dict(l), 'value': v} for (n, l), v in sorted(self._counters.items())]
+            gauges = [{'name': n, 'labels': dict(l), 'value': v} for (n, l), v in sorted(self._gauges.items())]
+            histograms = [dict({'name': n, 'labels': dict(l)}, **h.to_dict())
+                          for (n, l), h in sorted(self._histograms.items())]
+        return {'uptime_s': round(time.time() - self.started_at, 1), 'counters': counters, 'gauges': gauges,
+                'histograms': histograms}
+
+    def to_json(self):
+        return json.dumps(self.snapshot(), indent=2)
+
+    def to_prometheus(self):
+        lines = []
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted(self._histograms.items())
+            typed = set()
+            for (name, labels), value in counters:
+                if name not in typed:
+                    typed.add(name)
+                    lines.append(f'# TYPE ulamlens_{name} counter')
+                lines.append(f'ulamlens_{name}{_label_text(labels)} {value}')
+            for (name, labels), value in sorted(self._gauges.items()):
+                if name not in typed:
+                    typed.add(name)
+                    lines.append(f'# TYPE ulamlens_{name} gauge')
+                lines.append(f'ulamlens_{name}{_label_text(labels)} {value}')
+            for (name, labels), h in histograms:
+                if name not in typed:
+                    typed.add(name)
+                    lines.append(f'# TYPE ulamlens_{name} histogram')
+                cumulative = 0
+                for bound, n in zip(h.buckets + ('+Inf',), h.counts):
+                    cumulative += n
+                    lines.append(f'ulamlens_{name}_bucket{_label_text(labels, [("le", bound)])} {cumulative}')
+                lines.append(f'ulamlens_{name}_sum{_label_text(labels)} {h.sum}')
+                lines.append(f'ulamlens_{name}_count{_label_text(labels)} {h.count}')
+        return '\n'.join(lines) + '\n'
+
+    def dump(self, path):
+        """Write the metrics to ``path`` (Prometheus text for ``.prom``, JSON otherwise)."""
+        text = self.to_prometheus() if path.endswith('.prom') else self.to_json()
+        tmp = path + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            f.write(text)
+        # Readers never see a half-written file
+        os.replace(tmp, path)
+
+
+class _Timer:
+    __slots__ = ('metrics', 'name', 'labels', 'start')
+
+    def __init__(self, metrics, name, labels):
+        self.metrics = metrics
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.metrics.observe(self.name, time.perf_counter() - self.start, **self.labels)
+        return False
+
+
+class _NullTimer:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+# Process-wide registry used by the pipeline
+metrics = Metrics(enabled=env_bool('ULAMLENS_METRICS', False))
+
+_exporting = False
+
+
+def start_exporters():
+    """Start the file writer and/or HTTP endpoint configured by the environment (once)."""
+    global _exporting
+    if not metrics.enabled or _exporting:
+        return
+    _exporting = True
+    path = env_str('ULAMLENS_METRICS_FILE')
+    if path:
+        interval = env_float('ULAMLENS_METRICS_INTERVAL_S', 10.0)
+
+        def write():
+            try:
+                metrics.dump(path)
+            except OSError as e:
+                print(f"[metrics] Could not write {path}: {e}")
+
+        def loop():
+            while True:
+                time.sleep(interval)
+                write()
+
+        threading.Thread(target=loop, daemon=True, name='ulamlens-metrics').start()
+        atexit.register(write)
+        print(f"[metrics] Writing metrics to {path} every {interval:g}s.")
+    port = env_int('ULAMLENS_METRICS_PORT', 0)
+    if port:
+        serve(port)
+
+
+def serve(port, host='127.0.0.1'):
+    """Serve ``/metrics`` (Prometheus text) and ``/metrics.json`` on a background thread."""
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.startswith('/metrics.json'):
+                body, kind = metrics.to_json().encode(), 'application/json'
+            elif self.path.startswith('/metrics'):
+                body, kind = metrics.to_prometheus().encode(), 'text/plain; version=0.0.4'
+            else:
+                self.send_error(404)
+                return
+            self.send_response(200)
+            self.send_header('Content-Type', kind)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    try:
+        httpd = ThreadingHTTPServer((host, port), Handler)
+    except OSError as e:
+        print(f"[metrics] Could not listen on {host}:{port}: {e}")
+        return None
+    httpd.daemon_threads = True
+    threading.Thread(target=httpd.serve_forever, daemon=True, name='ulamlens-metrics-http').start()
+    print(f"[metrics] Serving http://{host}:{port}/metrics")
+    return httpd
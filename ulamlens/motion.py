@@ -0,0 +1,139 @@
+"""Plate detection for hands-free capture.
+
+``MotionDetector.update`` is fed preview frames and returns True once a
+plate has entered the frame and held still long enough to photograph. It
+works on a tiny blurred grayscale copy (64 px wide) and compares it with
+the previous frame (motion) and with a slowly learned picture of the empty
+scene (presence), so each frame costs a fraction of a millisecond.
+
+After a trigger the detector stays quiet until the scene changes again
+(the plate is taken away or replaced), so the same plate is never submitted
+twice. If frames get more expensive than ``budget_ms`` (slow hardware,
+large frames), it skips frames rather than slowing the preview down.
+"""
+import time
+
+import cv2
+import numpy as np
+
+from ulamlens.config import env_float
+
+THUMB_WIDTH = 64
+
+
+def thumbnail(frame, width=THUMB_WIDTH):
+    """Small blurred float32 grayscale copy of a BGR frame."""
+    h, w = frame.shape[:2]
+    step = max(1, w // (width * 4))
+    # Plain slicing first: resizing the full frame would cost more than everything else together
+    small = frame[::step, ::step]
+    small = cv2.resize(small, (width, max(1, round(h * width / w))), interpolation=cv2.INTER_AREA)
+    if small.ndim == 3:
+        small = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+    return cv2.GaussianBlur(small, (5, 5), 0).astype(np.float32)
+
+
+class MotionDetector:
+    """Empty -> moving -> still for ``settle_s`` -> trigger -> wait for the scene to change.
+
+    ``motion_threshold`` and ``presence_threshold`` are mean absolute gray
+    level differences (0-255) to the previous frame and to the empty
+    background. ``cooldown_s`` is the least time between two triggers.
+    """
+
+    def __init__(self, motion_threshold=4.0, presence_threshold=10.0, settle_s=0.8, cooldown_s=3.0,
+                 background_rate=0.05, budget_ms=1.0):
+        self.motion_threshold = motion_threshold
+        self.presence_threshold = presence_threshold
+        self.settle_s = settle_s
+        self.cooldown_s = cooldown_s
+        self.background_rate = background_rate
+        self.budget_ms = budget_ms
+        self.reset()
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            motion_threshold=env_float('ULAMLENS_AUTO_MOTION', 4.0),
+            presence_threshold=env_float('ULAMLENS_AUTO_PRESENCE', 10.0),
+            settle_s=env_float('ULAMLENS_AUTO_SETTLE_S', 0.8),
+            cooldown_s=env_float('ULAMLENS_AUTO_COOLDOWN_S', 3.0),
+            budget_ms=env_float('ULAMLENS_AUTO_BUDGET_MS', 1.0),
+        )
+
+    def reset(self):
+        """Forget the scene; the next frame is taken as the empty background."""
+        self.state = 'empty'
+        self.background = None
+        self._prev = None
+        self._captured = None
+        self._still_since = None
+        self._last_trigger = -float('inf')
+        self._cost_ms = 0.0
+        self._stride = 1
+        self._frame_count = 0
+
+    def rearm(self):
+        """Allow another trigger for the current scene (e.g. the captured frame was unusable)."""
+        if self.state == 'triggered':
+            self.state = 'moving'
+            self._still_since = None
+
+    def update(self, frame, now=None):
+        """Feed a preview frame; True means "capture now"."""
+        self._frame_count += 1
+        if self._frame_count % self._stride:
+            return False
+        now = time.monotonic() if now is None else now
+        t0 = time.perf_counter()
+        try:
+            return self._update(thumbnail(frame), now)
+        finally:
+            self._budget((time.perf_counter() - t0) * 1000)
+
+    def _budget(self, cost_ms):
+        # Smoothed cost per analysed frame; skip frames while it is over budget
+        self._cost_ms = cost_ms if not self._cost_ms else 0.9 * self._cost_ms + 0.1 * cost_ms
+        if self._cost_ms > self.budget_ms and self._stride < 8:
+            self._stride += 1
+        elif self._cost_ms < self.budget_ms / 2 and self._stride > 1:
+            self._stride -= 1
+
+    def _update(self, small, now):
+        if self.background is None or self.background.shape != small.shape:
+            self.background = small
+            self._prev = small
+            return False
+        motion = float(cv2.absdiff(small, self._prev).mean())
+        presence = float(cv2.absdiff(small, self.background).mean())
+        self._prev = small
+
+        if self.state == 'triggered':
+            # Debounce: stay quiet until the plate is removed or replaced
+            if float(cv2.absdiff(small, self._captured).mean()) < self.presence_threshold:
+                return False
+            self.state = 'moving'
+            self._still_since = None
+
+        if presence < self.presence_threshold:
+            if motion < self.motion_threshold:
+                # Follow slow lighting changes of the empty scene
+                cv2.accumulateWeighted(small, self.background, self.background_rate)
+            self.state = 'empty'
+            self._still_since = None
+            return False
+        if motion >= self.motion_threshold:
+            self.state = 'moving'
+            self._still_since = None
+            return False
+        if self._still_since is None:
+            self._still_since = now
+        if now - self._still_since < self.settle_s or now - self._last_trigger < self.cooldown_s:
+            return False
+        self.state = 'triggered'
+        self._captured = small
+        self._last_trigger = now
+        return True
+
+    def stats(self):
+        return {'state': self.state, 'cost_ms': round(self._cost_ms, 3), 'stride': self._stride}
@@ -0,0 +1,150 @@
+"""Bundled nutrition table for common Filipino ulam.
+
+Once the dish is identified, macros, health facts and warnings come from
+``data/nutrition.csv`` instead of being generated by the model on every
+request, so the same dish always gets the same numbers. Names are matched
+through aliases, Filipino/English word equivalents ("adobong manok" is
+"chicken adobo") and, for typos, the closest known word.
+"""
+import csv
+import difflib
+import os
+import re
+import threading
+import unicodedata
+from functools import lru_cache
+
+from ulamlens.config import env_bool, env_str
+
+DEFAULT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'nutrition.csv')
+MACRO_FIELDS = ('calories', 'protein_g', 'carbs_g', 'fat_g')
+
+# Filipino words mapped to the English word used in the table's names
+SYNONYMS = {
+    'manok': 'chicken', 'baboy': 'pork', 'baka': 'beef', 'isda': 'fish', 'hipon': 'shrimp',
+    'pusit': 'squid', 'pansit': 'pancit', 'longanisa': 'longganisa', 'caldereta': 'kaldereta',
+    'prito': 'fried', 'pritong': 'fried', 'inihaw': 'grilled',
+}
+# Linking words that never tell dishes apart
+STOPWORDS = {'na', 'ng', 'sa', 'at', 'with', 'the', 'and', 'style'}
+
+
+def tokens(name, vocabulary=None):
+    """Normalised word set of a dish name.
+
+    Accents, case and punctuation are ignored, Filipino ligatures are
+    dropped ("adobong" -> "adobo") when the bare word is known, and with a
+    ``vocabulary`` unknown words are replaced by the closest known one.
+    """
+    text = unicodedata.normalize('NFKD', name or '').encode('ascii', 'ignore').decode().lower()
+    words = []
+    for word in re.split(r'[^a-z0-9]+', text):
+        if not word or word in STOPWORDS:
+            continue
+        word = SYNONYMS.get(word, word)
+        if vocabulary is not None and word not in vocabulary:
+            if word.endswith('ng') and word[:-2] in vocabulary:
+                word = word[:-2]
+            else:
+                close = difflib.get_close_matches(word, vocabulary, n=1, cutoff=0.8)
+                if close:
+                    word = close[0]
+        words.append(word)
+    return frozenset(words)
+
+
+class NutritionTable:
+    """In-memory index of the nutrition CSV; ``lookup(name)`` returns a row dict or None."""
+
+    def __init__(self, rows, min_score=0.6):
+        self.rows = rows
+        self.min_score = min_score
+        self.names = [row['name'] for row in rows]
+        # Exact index on the normalised word set of every name and alias, plus a word index for fuzzy matches
+        self.vocabulary = set()
+        keyed = []
+        for row in rows:
+            for name in [row['name']] + row['aliases']:
+                words = tokens(name)
+                self.vocabulary.update(words)
+                keyed.append((words, row))
+        self._exact = {}
+        self._by_word = {}
+        for words, row in keyed:
+            self._exact.setdefault(words, row)
+            for word in words:
+                self._by_word.setdefault(word, []).append((words, row))
+        self.lookup = lru_cache(maxsize=1024)(self._lookup)
+
+    @classmethod
+    def load(cls, path=DEFAULT_PATH):
+        rows = []
+        with open(path, newline='', encoding='utf-8') as f:
+            for raw in csv.DictReader(f):
+                row = {
+                    'name': raw['name'].strip(),
+                    'aliases': [a.strip() for a in (raw.get('aliases') or '').split('|') if a.strip()],
+                    'serving': raw.get('serving', '').strip(),
+                    'health_facts': raw.get('health_facts', '').strip(),
+                    'warnings': raw.get('warnings', '').strip(),
+                }
+                for field in MACRO_FIELDS:
+                    value = float(raw[field])
+                    row[field] = int(value) if field == 'calories' else value
+                rows.append(row)
+        return cls(rows)
+
+    def _lookup(self, name):
+        words = tokens(name, self.vocabulary)
+        if not words:
+            return None
+        row = self._exact.get(words)
+        if row is not None:
+            return row
+        # Best overlap among names sharing at least one word
+        best, best_score = None, 0.0
+        for word in words:
+            for candidate, row in self._by_word.get(word, ()):
+                score = len(words & candidate) / len(words | candidate)
+                if score > best_score:
+                    best, best_score = row, score
+        return best if best_score >= self.min_score else None
+
+
+_default_table = None
+_default_lock = threading.Lock()
+
+
+def default_table():
+    """Bundled (or ULAMLENS_NUTRITION_PATH) table, loaded on first use; None when disabled."""
+    global _default_table
+    if not env_bool('ULAMLENS_NUTRITION', True):
+        return None
+    with _default_lock:
+        if _default_table is None:
+            try:
+                _default_table = NutritionTable.load(env_str('ULAMLENS_NUTRITION_PATH') or DEFAULT_PATH)
+            except Exception as e:
+                print(f"[nutrition] Could not load nutrition table: {e}")
+                return None
+        return _default_table
+
+
+def enrich(result, table=None):
+    """Fill macros, health facts and warnings of ``result`` from the table when the dish is known.
+
+    Returns ``result`` itself (updated in place); unknown dishes and error
+    results are left as they are.
+    """
+    table = table or default_table()
+    if table is None or 'error' in result or not isinstance(result.get('ulam_name'), str):
+        return result
+    row = table.lookup(result['ulam_name'])
+    if row is None:
+        return result
+    result['macros'] = {field: row[field] for field in MACRO_FIELDS}
+    result['health_facts'] = row['health_facts']
+    result['warnings'] = row['warnings']
+    result['serving'] = row['serving']
+    result['nutrition_match'] = row['name']
+    return result
@@ -0,0 +1,355 @@
+"""Durable queue for analyses that could not reach the backend.
+
+When no backend could be reached at all (network down, DNS failure,
+connection timeouts), the engine stores the encoded upload in a small SQLite file
+instead of losing the photo. ``OfflineDrainer`` works through the queue in
+the background with exponential backoff per job and delivers each result
+once the backend answers again. Jobs survive restarts: a job that was being
+sent when the app quit is simply sent again.
+
+While the backend is unreachable only one job is tried at a time (a probe);
+the first success wakes every waiting job and the drainer goes back to
+``workers`` jobs in parallel. Photos the token budget deferred
+(``ulamlens.budget``) are queued too; they are retried once the budget has
+room again and never count as an outage or as failed attempts.
+"""
+import json
+import os
+import random
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from ulamlens.cancel import CancelToken
+from ulamlens.config import data_dir, env_bool, env_float, env_int, env_str
+from ulamlens.metrics import metrics
+from ulamlens.preprocess import prepare_upload
+
+
+def is_retryable(result):
+    """True for results that mean "no backend answered" or "not yet" (token budget), as opposed to a real answer."""
+    return bool(result) and 'error' in result and bool(result.get('unreachable') or result.get('deferred'))
+
+
+class OfflineJob:
+    __slots__ = ('id', 'created', 'upload_bytes', 'mime', 'meta', 'attempts')
+
+    def __init__(self, job_id, created, upload_bytes, mime, meta, attempts):
+        self.id = job_id
+        self.created = created
+        self.upload_bytes = upload_bytes
+        self.mime = mime
+        self.meta = meta
+        self.attempts = attempts
+
+
+class OfflineQueue:
+    """SQLite-backed job store. Jobs go pending -> running -> done/failed -> deleted once delivered.
+
+    ``max_jobs`` bounds the pending jobs kept on disk; ``max_attempts`` is
+    how often one job is tried before it is given up as failed.
+    """
+
+    def __init__(self, path, max_jobs=500, max_attempts=20):
+        self.path = path
+        self.max_jobs = max_jobs
+        self.max_attempts = max_attempts
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        # WAL keeps an enqueue from waiting on a long read and survives a crash mid-write
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, created REAL NOT NULL, image BLOB, mime TEXT NOT NULL, "
+            "meta TEXT NOT NULL, status TEXT NOT NULL, attempts INTEGER NOT NULL DEFAULT 0, "
+            "next_try REAL NOT NULL, last_error TEXT, result TEXT, finished REAL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS jobs_status_next_try ON jobs(status, next_try)")
+        # Jobs that were being sent when the app stopped are sent again
+        self._db.execute("UPDATE jobs SET status = 'pending' WHERE status = 'running'")
+        self._db.commit()
+        self._update_depth()
+
+    @classmethod
+    def from_env(cls):
+        """Queue configured by the environment, or None when ULAMLENS_OFFLINE is off or the file cannot be opened."""
+        if not env_bool('ULAMLENS_OFFLINE', True):
+            return None
+        path = env_str('ULAMLENS_OFFLINE_PATH') or os.path.join(data_dir(), 'offline_queue.sqlite')
+        try:
+            return cls(path, max_jobs=env_int('ULAMLENS_OFFLINE_MAX_JOBS', 500),
+                       max_attempts=env_int('ULAMLENS_OFFLINE_MAX_ATTEMPTS', 20))
+        except Exception as e:
+            print(f"[offline] Could not open offline queue: {e}")
+            return None
+
+    def put_image(self, image, meta=None):
+        """Encode a BGR image the way it would be uploaded and queue it; returns the job id or None."""
+        try:
+            upload_bytes, upload_info = prepare_upload(image)
+        except Exception as e:
+            print(f"[offline] Could not encode the image: {e}")
+            return None
+        return self.put(upload_bytes, upload_info['mime'], meta)
+
+    def put(self, upload_bytes, mime, meta=None):
+        """Queue an encoded image; returns the job id, or None when the queue is full."""
+        now = time.time()
+        with self._lock:
+            pending = self._db.execute("SELECT COUNT(*) FROM jobs WHERE status IN ('pending', 'running')").fetchone()[0]
+            if pending >= self.max_jobs:
+                print(f"[offline] Queue full ({pending} jobs); photo not saved.")
+                return None
+            cur = self._db.execute(
+                "INSERT INTO jobs (created, image, mime, meta, status, next_try) VALUES (?, ?, ?, ?, 'pending', ?)",
+                (now, upload_bytes, mime, json.dumps(meta or {}), now),
+            )
+            self._db.commit()
+            job_id = cur.lastrowid
+        metrics.inc('offline_enqueued_total')
+        self._update_depth()
+        print(f"[offline] Queued job {job_id} ({len(upload_bytes)} bytes).")
+        return job_id
+
+    def claim(self, limit=1, now=None):
+        """Mark up to ``limit`` due jobs as running and return them, oldest first."""
+        if limit <= 0:
+            return []
+        now = time.time() if now is None else now
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT id, created, image, mime, meta, attempts FROM jobs "
+                "WHERE status = 'pending' AND next_try <= ? ORDER BY next_try, id LIMIT ?",
+                (now, limit),
+            ).fetchall()
+            self._db.executemany("UPDATE jobs SET status = 'running' WHERE id = ?", [(r[0],) for r in rows])
+            self._db.commit()
+        return [OfflineJob(r[0], r[1], r[2], r[3], json.loads(r[4]), r[5]) for r in rows]
+
+    def complete(self, job_id, result):
+        """Store the answer of a job; the photo itself is no longer needed."""
+        self._finish(job_id, 'done', result)
+
+    def fail(self, job_id, result):
+        """Give up on a job and keep its last error as the result."""
+        self._finish(job_id, 'failed', result)
+
+    def _finish(self, job_id, status, result):
+        with self._lock:
+            self._db.execute(
+                "UPDATE jobs SET status = ?, result = ?, image = NULL, finished = ?, "
+                "attempts = attempts + 1 WHERE id = ?",
+                (status, json.dumps(result), time.time(), job_id),
+            )
+            self._db.commit()
+        self._update_depth()
+
+    def retry(self, job_id, error, delay_s):
+        """Put a job back to be tried again in ``delay_s`` seconds; returns its attempt count."""
+        with self._lock:
+            self._db.execute(
+                "UPDATE jobs SET status = 'pending', attempts = attempts + 1, last_error = ?, next_try = ? "
+                "WHERE id = ?",
+                (error, time.time() + delay_s, job_id),
+            )
+            self._db.commit()
+            return self._db.execute("SELECT attempts FROM jobs WHERE id = ?", (job_id,)).fetchone()[0]
+
+    def wake(self):
+        """Make every waiting job due now (the backend is reachable again)."""
+        with self._lock:
+            self._db.execute("UPDATE jobs SET next_try = ? WHERE status = 'pending'", (time.time(),))
+            self._db.commit()
+
+    def next_due(self):
+        """Time of the next pending job, or None when nothing is pending."""
+        with self._lock:
+            return self._db.execute("SELECT MIN(next_try) FROM jobs WHERE status = 'pending'").fetchone()[0]
+
+    def finished(self):
+        """``(job_id, result, meta, created)`` of done or failed jobs whose result was not delivered yet."""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT id, result, meta, created FROM jobs WHERE status IN ('done', 'failed') ORDER BY id"
+            ).fetchall()
+        return [(r[0], json.loads(r[1]), json.loads(r[2]), r[3]) for r in rows]
+
+    def delivered(self, job_id):
+        """Forget a job whose result reached the user."""
+        with self._lock:
+            self._db.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+            self._db.commit()
+
+    def depth(self):
+        """Jobs still waiting for an answer."""
+        with self._lock:
+            return self._db.execute(
+                "SELECT COUNT(*) FROM jobs WHERE status IN ('pending', 'running')").fetchone()[0]
+
+    def _update_depth(self):
+        if metrics.enabled:
+            metrics.set('offline_queue_depth', self.depth())
+
+    def stats(self):
+        with self._lock:
+            counts = dict(self._db.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+            oldest = self._db.execute(
+                "SELECT MIN(created) FROM jobs WHERE status IN ('pending', 'running')").fetchone()[0]
+        return {
+            "pending": counts.get('pending', 0),
+            "running": counts.get('running', 0),
+            "done": counts.get('done', 0),
+            "failed": counts.get('failed', 0),
+            "oldest_s": round(time.time() - oldest, 1) if oldest else 0.0,
+        }
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+class OfflineDrainer:
+    """Background sender for an ``OfflineQueue``.
+
+    ``analyze(upload_bytes, mime, cancel)`` returns a result dict;
+    ``on_result(job_id, result, meta)`` is called from a worker thread for
+    every finished job (answers and given-up failures alike). A job whose
+    ``on_result`` raises keeps its result in the queue and is delivered
+    again on the next start.
+    """
+
+    def __init__(self, queue, analyze, on_result, workers=2, base_delay_s=5.0, max_delay_s=300.0):
+        self.queue = queue
+        self.analyze = analyze
+        self.on_result = on_result
+        self.workers = max(1, workers)
+        self.base_delay_s = base_delay_s
+        self.max_delay_s = max_delay_s
+        self.sent = 0
+        self.retries = 0
+        self.started_at = time.monotonic()
+        self._reachable = True
+        self._running = 0
+        self._lock = threading.Lock()  # guards _reachable and _running, shared by the worker threads
+        self._wake = threading.Event()
+        self._stop = CancelToken()
+        self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='ulamlens-offline')
+        self._thread = None
+
+    @classmethod
+    def from_env(cls, queue, analyze, on_result):
+        return cls(
+            queue, analyze, on_result,
+            workers=env_int('ULAMLENS_OFFLINE_WORKERS', 2),
+            base_delay_s=env_float('ULAMLENS_OFFLINE_BACKOFF_S', 5.0),
+            max_delay_s=env_float('ULAMLENS_OFFLINE_MAX_BACKOFF_S', 300.0),
+        )
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, daemon=True, name='ulamlens-offline-drainer')
+            self._thread.start()
+        return self
+
+    def kick(self):
+        """Look at the queue now (e.g. right after a job was added)."""
+        self._wake.set()
+
+    def stop(self):
+        self._stop.cancel('shutdown')
+        self._wake.set()
+        # Jobs in flight are cancelled and go back to pending when the app starts again
+        self._pool.shutdown(wait=False)
+
+    def _run(self):
+        # Results that finished before a restart but never reached the user
+        for job_id, result, meta, _ in self.queue.finished():
+            self._deliver(job_id, result, meta)
+        while not self._stop.is_set():
+            with self._lock:
+                # One probe at a time while the backend is unreachable
+                free = (self.workers if self._reachable else 1) - self._running
+            jobs = self.queue.claim(free) if free > 0 else []
+            for job in jobs:
+                with self._lock:
+                    self._running += 1
+                self._pool.submit(self._process, job)
+            if jobs:
+                continue
+            due = self.queue.next_due()
+            wait = 60.0 if due is None else min(60.0, max(0.05, due - time.time()))
+            self._wake.wait(wait)
+            self._wake.clear()
+
+    def _process(self, job):
+        try:
+            try:
+                result = self.analyze(job.upload_bytes, job.mime, self._stop)
+            except Exception as e:
+                print(f"[offline] Job {job.id} failed: {e}")
+                result = {"error": str(e), "unreachable": True}
+            if self._stop.is_set():
+                return
+            if is_retryable(result):
+                self._retry(job, result)
+                return
+            with self._lock:
+                was_reachable, self._reachable = self._reachable, True
+            if not was_reachable:
+                print("[offline] Backend reachable again; sending queued photos.")
+                self.queue.wake()
+            result.pop('unreachable', None)
+            if 'error' in result:
+                self.queue.fail(job.id, result)
+            else:
+                self.queue.complete(job.id, result)
+            self.sent += 1
+            metrics.inc('offline_jobs_total', outcome='failed' if 'error' in result else 'done')
+            metrics.observe('offline_wait_seconds', time.time() - job.created)
+            self._deliver(job.id, result, job.meta)
+        except Exception as e:
+            print(f"[offline] Job {job.id}: {e}")
+        finally:
+            with self._lock:
+                self._running -= 1
+            self._wake.set()
+
+    def _retry(self, job, result):
+        self.retries += 1
+        metrics.inc('offline_retries_total')
+        if result.get('deferred'):
+            # The backend is fine but the token budget is not; try again once it has room
+            delay = max(1.0, float(result.get('retry_after') or self.base_delay_s))
+            self.queue.retry(job.id, result.get('error'), delay)
+            print(f"[offline] Job {job.id} deferred by the token budget; retrying in {delay:.0f}s.")
+            return
+        with self._lock:
+            self._reachable = False
+        attempts = job.attempts + 1
+        if attempts >= self.queue.max_attempts:
+            print(f"[offline] Job {job.id} gave up after {attempts} attempts.")
+            result.pop('unreachable', None)
+            self.queue.fail(job.id, result)
+            metrics.inc('offline_jobs_total', outcome='gave_up')
+            self._deliver(job.id, result, job.meta)
+            return
+        # Exponential backoff with jitter so many kiosks do not retry in lockstep
+        delay = min(self.max_delay_s, self.base_delay_s * 2 ** (attempts - 1)) * random.uniform(0.5, 1.0)
+        self.queue.retry(job.id, result.get('error'), delay)
+        print(f"[offline] Job {job.id} still unreachable ({result.get('error')}); retrying in {delay:.0f}s.")
+
+    def _deliver(self, job_id, result, meta):
+        try:
+            self.on_result(job_id, result, meta)
+        except Exception as e:
+            print(f"[offline] Could not deliver job {job_id}: {e}")
+            return
+        self.queue.delivered(job_id)
+
+    def stats(self):
+        elapsed = max(1e-6, time.monotonic() - self.started_at)
+        with self._lock:
+            running, reachable = self._running, self._reachable
+        return dict(self.queue.stats(), sent=self.sent, retries=self.retries, in_flight=running,
+                    reachable=reachable, sent_per_min=round(self.sent * 60 / elapsed, 2))
@@ -0,0 +1,135 @@
+"""Shrink a captured frame before it is uploaded for analysis.
+
+The model only needs to recognise the dish, so the frame is cropped to the
+plate, downscaled to a maximum edge and re-encoded at a tuned quality. This
+cuts request bytes (and upload time) several-fold compared with a
+full-resolution default-quality JPEG.
+"""
+import time
+
+import cv2
+
+from ulamlens.config import env_int, env_str
+
+FORMATS = {
+    'jpeg': ('.jpg', 'image/jpeg', cv2.IMWRITE_JPEG_QUALITY),
+    'webp': ('.webp', 'image/webp', cv2.IMWRITE_WEBP_QUALITY),
+}
+
+
+class PreprocessConfig:
+    """How frames are prepared for upload.
+
+    ``crop`` is ``'none'``, ``'center'`` (keep the middle ``center_ratio`` of
+    each side) or ``'auto'`` (find the plate, falling back to ``'center'``).
+    ``max_edge`` of 0 disables downscaling.
+    """
+
+    def __init__(self, crop='auto', center_ratio=0.8, max_edge=768, fmt='jpeg', quality=80):
+        if fmt not in FORMATS:
+            raise ValueError(f"Unsupported image format {fmt!r}; expected one of {sorted(FORMATS)}")
+        if crop not in ('none', 'center', 'auto'):
+            raise ValueError(f"Unsupported crop mode {crop!r}")
+        self.crop = crop
+        self.center_ratio = center_ratio
+        self.max_edge = max_edge
+        self.fmt = fmt
+        self.quality = quality
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            crop=env_str('ULAMLENS_UPLOAD_CROP', 'auto'),
+            center_ratio=env_int('ULAMLENS_UPLOAD_CENTER_PCT', 80) / 100,
+            max_edge=env_int('ULAMLENS_UPLOAD_MAX_EDGE', 768),
+            fmt=env_str('ULAMLENS_UPLOAD_FORMAT', 'jpeg'),
+            quality=env_int('ULAMLENS_UPLOAD_QUALITY', 80),
+        )
+
+    @property
+    def mime(self):
+        return FORMATS[self.fmt][1]
+
+
+def center_crop(image, ratio):
+    h, w = image.shape[:2]
+    ch, cw = int(h * ratio), int(w * ratio)
+    y, x = (h - ch) // 2, (w - cw) // 2
+    return image[y:y + ch, x:x + cw]
+
+
+def find_plate(image, work_edge=320):
+    """Return the ``(x, y, w, h)`` box of the most prominent plate-like circle, or None.
+
+    Runs on a small grayscale copy so it costs a few milliseconds.
+    """
+    h, w = image.shape[:2]
+    scale = work_edge / max(h, w)
+    small = cv2.resize(image, (max(1, int(w * scale)), max(1, int(h * scale))), interpolation=cv2.INTER_AREA)
+    gray = cv2.medianBlur(cv2.cvtColor(small, cv2.COLOR_BGR2GRAY), 5)
+    sh, sw = gray.shape
+    radii = dict(minRadius=min(sh, sw) // 5, maxRadius=min(sh, sw) * 3 // 4)
+    if hasattr(cv2, 'HOUGH_GRADIENT_ALT'):
+        # The ALT detector keeps concentric circles (plate rim around the food)
+        circles = cv2.HoughCircles(gray, cv2.HOUGH_GRADIENT_ALT, dp=1.5, minDist=1, param1=100, param2=0.8, **radii)
+    else:
+        circles = cv2.HoughCircles(gray, cv2.HOUGH_GRADIENT, dp=1.5, minDist=1, param1=100, param2=40, **radii)
+    if circles is None:
+        return None
+    # Largest circle is the plate rather than a bowl or garnish inside it
+    cx, cy, r = max(circles[0], key=lambda c: c[2])
+    x0, y0 = max(0, int((cx - r) / scale)), max(0, int((cy - r) / scale))
+    x1, y1 = min(w, int((cx + r) / scale)), min(h, int((cy + r) / scale))
+    if x1 - x0 < w * 0.2 or y1 - y0 < h * 0.2:
+        return None
+    return x0, y0, x1 - x0, y1 - y0
+
+
+def crop(image, config):
+    if config.crop == 'none':
+        return image
+    if config.crop == 'auto':
+        box = find_plate(image)
+        if box is not None:
+            x, y, w, h = box
+            return image[y:y + h, x:x + w]
+    return center_crop(image, config.center_ratio)
+
+
+def downscale(image, max_edge):
+    h, w = image.shape[:2]
+    if not max_edge or max(h, w) <= max_edge:
+        return image
+    scale = max_edge / max(h, w)
+    return cv2.resize(image, (max(1, int(w * scale)), max(1, int(h * scale))), interpolation=cv2.INTER_AREA)
+
+
+def encode(image, config):
+    ext, _, flag = FORMATS[config.fmt]
+    ok, buf = cv2.imencode(ext, image, [flag, int(config.quality)])
+    if not ok:
+        raise RuntimeError(f"Could not encode image as {config.fmt}")
+    return buf
+
+
+def prepare_upload(image, config=None):
+    """Crop, downscale and encode ``image`` (BGR); return ``(encoded_bytes, info)``.
+
+    ``info`` reports the final size in pixels, the encoded byte count, the MIME
+    type and how long preprocessing and encoding took.
+    """
+    config = config or PreprocessConfig.from_env()
+    t0 = time.perf_counter()
+    prepared = downscale(crop(image, config), config.max_edge)
+    t1 = time.perf_counter()
+    data = encode(prepared, config).tobytes()
+    t2 = time.perf_counter()
+    info = {
+        "width": prepared.shape[1],
+        "height": prepared.shape[0],
+        "bytes": len(data),
+        "mime": config.mime,
+        "preprocess_ms": round((t1 - t0) * 1000, 2),
+        "encode_ms": round((t2 - t1) * 1000, 2),
+    }
+    return data, info
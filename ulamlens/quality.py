@@ -0,0 +1,136 @@
+"""Cheap checks that a frame is worth a model call.
+
+Motion-blurred, underexposed and empty-plate photos cost the same as good
+ones and come back with garbage. ``QualityGate.assess`` scores a frame on a
+small grayscale/HSV copy in a couple of milliseconds:
+
+- sharpness: variance of the Laplacian (low means blurred or out of focus)
+- exposure: mean brightness and the share of crushed or blown-out pixels
+- food present: share of saturated pixels in the centre of the frame (an
+  empty plate or table is mostly unsaturated)
+
+``sharpness_score`` is the same sharpness measure on an even smaller copy,
+cheap enough for the camera thread to score every frame and keep the
+sharpest of the last few for Capture (see ``ui.camera``).
+"""
+import cv2
+import numpy as np
+
+from ulamlens.config import env_bool, env_float, env_int
+
+# Width of the copy the checks run on; thresholds are calibrated for it
+ASSESS_WIDTH = 320
+SCORE_WIDTH = 160
+
+
+def _small_gray(image, width):
+    h, w = image.shape[:2]
+    if w > width:
+        image = cv2.resize(image, (width, max(1, round(h * width / w))), interpolation=cv2.INTER_AREA)
+    if image.ndim == 3:
+        return image, cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    return None, image
+
+
+def sharpness(gray):
+    """Variance of the Laplacian of a grayscale image."""
+    return float(cv2.Laplacian(gray, cv2.CV_32F).var())
+
+
+def sharpness_score(image):
+    """Sharpness of a BGR frame at a fixed small size, for ranking frames against each other."""
+    _, gray = _small_gray(image, SCORE_WIDTH)
+    return sharpness(gray)
+
+
+class QualityReport:
+    """Scores of one frame; ``problems`` lists what failed (empty when the frame is fine)."""
+
+    def __init__(self, sharpness, brightness, dark_fraction, bright_fraction, food_fraction, problems):
+        self.sharpness = sharpness
+        self.brightness = brightness
+        self.dark_fraction = dark_fraction
+        self.bright_fraction = bright_fraction
+        self.food_fraction = food_fraction
+        self.problems = problems
+
+    @property
+    def ok(self):
+        return not self.problems
+
+    def message(self):
+        return "; ".join(self.problems)
+
+    def to_dict(self):
+        return {
+            'sharpness': round(self.sharpness, 1),
+            'brightness': round(self.brightness, 1),
+            'dark_fraction': round(self.dark_fraction, 3),
+            'bright_fraction': round(self.bright_fraction, 3),
+            'food_fraction': round(self.food_fraction, 3),
+            'problems': list(self.problems),
+        }
+
+    def __repr__(self):
+        return f"QualityReport({self.to_dict()})"
+
+
+class QualityGate:
+    """Thresholds for ``assess``. ``enabled=False`` turns the gate off (every frame passes).
+
+    ``min_sharpness`` is the Laplacian variance at ASSESS_WIDTH pixels wide,
+    ``min_brightness``/``max_brightness`` bound the mean gray level, at most
+    ``max_clipped`` of the pixels may be nearly black or white, and at least
+    ``min_food`` of the centre must be saturated colour.
+    """
+
+    def __init__(self, enabled=True, min_sharpness=40.0, min_brightness=45.0, max_brightness=215.0,
+                 max_clipped=0.4, min_food=0.05, retries=3):
+        self.enabled = enabled
+        self.min_sharpness = min_sharpness
+        self.min_brightness = min_brightness
+        self.max_brightness = max_brightness
+        self.max_clipped = max_clipped
+        self.min_food = min_food
+        # Extra frames Capture waits for when the best one so far fails the gate
+        self.retries = retries
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            enabled=env_bool('ULAMLENS_QUALITY', True),
+            min_sharpness=env_float('ULAMLENS_QUALITY_MIN_SHARPNESS', 40.0),
+            min_brightness=env_float('ULAMLENS_QUALITY_MIN_BRIGHTNESS', 45.0),
+            max_brightness=env_float('ULAMLENS_QUALITY_MAX_BRIGHTNESS', 215.0),
+            min_food=env_float('ULAMLENS_QUALITY_MIN_FOOD', 0.05),
+            retries=env_int('ULAMLENS_QUALITY_RETRIES', 3),
+        )
+
+    def assess(self, image):
+        """``QualityReport`` for a BGR frame."""
+        color, gray = _small_gray(image, ASSESS_WIDTH)
+        sharp = sharpness(gray)
+        brightness = float(gray.mean())
+        dark = float(np.count_nonzero(gray < 20)) / gray.size
+        bright = float(np.count_nonzero(gray > 245)) / gray.size
+        food = 1.0
+        if color is not None:
+            h, w = gray.shape
+            center = color[h // 5:h - h // 5, w // 5:w - w // 5]
+            hsv = cv2.cvtColor(center, cv2.COLOR_BGR2HSV)
+            saturated = (hsv[..., 1] > 60) & (hsv[..., 2] > 40)
+            food = float(np.count_nonzero(saturated)) / saturated.size
+
+        problems = []
+        # Badly exposed frames also look blurred and colourless, so only the first failing check is reported
+        if not self.enabled:
+            pass
+        elif brightness < self.min_brightness or dark > self.max_clipped:
+            problems.append("the photo is too dark")
+        elif brightness > self.max_brightness or bright > self.max_clipped:
+            problems.append("the photo is overexposed")
+        elif food < self.min_food:
+            problems.append("no food is visible in the middle of the photo")
+        elif sharp < self.min_sharpness:
+            problems.append("the photo is blurry")
+        return QualityReport(sharp, brightness, dark, bright, food, problems)
@@ -0,0 +1,104 @@
+"""Incremental parsing of streamed model output.
+
+The model answers with a single JSON object (see ``analysis.PROMPT``). While
+the text is still arriving, ``IncrementalJsonParser`` reports each top-level
+field (``ulam_name``, ``macros``, ...) as soon as its value is complete, so
+the UI can show it before the rest of the answer has been generated.
+"""
+import json
+
+
+class IncrementalJsonParser:
+    """Feed text chunks; ``feed`` returns the ``(key, value)`` pairs completed by that chunk.
+
+    Text before the first ``{`` (e.g. a Markdown fence) is ignored. Commas and
+    braces inside strings and nested objects are tracked, so ``macros`` is
+    only reported once its closing brace has arrived.
+    """
+
+    def __init__(self):
+        self.text = ''
+        self.fields = {}
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._member_start = None
+        self._done = False
+
+    def feed(self, chunk):
+        completed = []
+        if not chunk or self._done:
+            return completed
+        self.text += chunk
+        text = self.text
+        for i in range(self._pos, len(text)):
+            ch = text[i]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == '\\':
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                continue
+            if ch == '"':
+                if self._depth > 0:
+                    self._in_string = True
+            elif ch in '{[':
+                self._depth += 1
+                if self._depth == 1:
+                    self._member_start = i + 1
+            elif ch in '}]':
+                if self._depth == 0:
+                    continue
+                self._depth -= 1
+                if self._depth == 0:
+                    completed += self._close_member(text, i)
+                    self._done = True
+                    self._pos = i + 1
+                    return completed
+            elif ch == ',' and self._depth == 1:
+                completed += self._close_member(text, i)
+                self._member_start = i + 1
+        self._pos = len(text)
+        return completed
+
+    def _close_member(self, text, end):
+        member = text[self._member_start:end].strip()
+        if not member:
+            return []
+        try:
+            parsed = json.loads('{' + member + '}')
+        except ValueError:
+            return []
+        self.fields.update(parsed)
+        return list(parsed.items())
+
+    @property
+    def done(self):
+        """True once the closing brace of the object has been seen."""
+        return self._done
+
+
+def sse_text_deltas(lines, on_completed=None):
+    """Yield output-text deltas from the server-sent event lines of a streamed responses-API call.
+
+    ``on_completed(usage)`` receives the token usage of the final ``response.completed`` event.
+    """
+    for line in lines:
+        if isinstance(line, bytes):
+            line = line.decode('utf-8', 'replace')
+        if not line.startswith('data:'):
+            continue
+        data = line[5:].strip()
+        if not data or data == '[DONE]':
+            continue
+        try:
+            event = json.loads(data)
+        except ValueError:
+            continue
+        if event.get('type') == 'response.output_text.delta':
+            yield event.get('delta') or ''
+        elif event.get('type') == 'response.completed' and on_completed is not None:
+            on_completed((event.get('response') or {}).get('usage'))